@@ -0,0 +1,116 @@
+"""Micro-benchmark: filtering one search page of posts.
+
+    python benchmarks/bench_filters.py [--posts 200] [--repeat 2000]
+
+Compares the old per-post rule functions (allowed-ext set rebuilt and the URL
+re-parsed for every post, then the scrape's separate nsfw / min-size passes)
+with one compiled `FilterSpec` applied to the batch.
+"""
+
+from __future__ import annotations
+
+import argparse
+import dataclasses
+import json
+import time
+from urllib.parse import urlparse
+
+from bench_json_decode import fake_danbooru_page
+
+from moescraper.adapters.danbooru import DanbooruAdapter
+from moescraper.core.filters import FilterSpec, normalize_ext, ratings_for_nsfw_mode
+from moescraper.core.models import Post, Rating
+
+
+def _old_guess_ext(url: str) -> str | None:
+    path = urlparse(url).path
+    if "." not in path:
+        return None
+    ext = path.rsplit(".", 1)[-1].lower()
+    return ext if 1 <= len(ext) <= 5 else None
+
+
+def _old_passes_file_ext(post: Post, allowed_exts, allow_unknown_ext: bool) -> bool:
+    if not allowed_exts:
+        return True
+    allowed = {normalize_ext.__wrapped__(x) for x in allowed_exts}
+    allowed.discard(None)
+    ext = normalize_ext.__wrapped__(post.file_ext)
+    if not ext and post.file_url:
+        ext = normalize_ext.__wrapped__(_old_guess_ext(post.file_url))
+    if not ext:
+        return bool(allow_unknown_ext)
+    return ext in allowed
+
+
+def _old_min_size(post: Post, min_w, min_h) -> bool:
+    if post.width is None or post.height is None:
+        return True
+    if min_w is not None and post.width < min_w:
+        return False
+    if min_h is not None and post.height < min_h:
+        return False
+    return True
+
+
+def old_pipeline(posts: list[Post], allowed: set[str], min_w: int, min_h: int) -> list[Post]:
+    # client.search_page -> filter_posts(nsfw=False, ...), then batch_scrape's passes.
+    out = []
+    for p in posts:
+        if p.rating == Rating.NSFW:
+            continue
+        if not _old_min_size(p, min_w, min_h):
+            continue
+        if not _old_passes_file_ext(p, allowed, False):
+            continue
+        out.append(p)
+    out = [p for p in out if p.rating == Rating.SAFE]
+    return [p for p in out if _old_min_size(p, min_w, min_h)]
+
+
+def bench(fn, repeat: int) -> float:
+    fn()  # warm up
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - t0) / repeat
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--posts", type=int, default=200)
+    ap.add_argument("--repeat", type=int, default=2000)
+    args = ap.parse_args()
+
+    items = json.loads(fake_danbooru_page(args.posts))
+    posts = DanbooruAdapter(None).parse_response(items, limit=len(items), nsfw=True)
+    # Half the posts without file_ext (like zerochan), so the URL path is exercised.
+    posts = [dataclasses.replace(p, file_ext=None) if i % 2 else p for i, p in enumerate(posts)]
+
+    allowed = {"jpg", "png", "JPEG"}
+    min_w, min_h = 1000, 800
+
+    spec = FilterSpec(
+        ratings=ratings_for_nsfw_mode("safe"),
+        min_width=min_w,
+        min_height=min_h,
+        allowed_exts=allowed,  # type: ignore[arg-type]
+    )
+    assert spec.apply(posts) == old_pipeline(posts, allowed, min_w, min_h)
+
+    def more_rules():
+        return dataclasses.replace(spec, max_aspect=2.0, exclude_tags={"comic"}).apply(posts)
+
+    base = bench(lambda: old_pipeline(posts, allowed, min_w, min_h), args.repeat)
+    rows = [
+        ("per-post rules (before)", base),
+        ("FilterSpec.apply", bench(lambda: spec.apply(posts), args.repeat)),
+        ("+2 rules, compiled per call", bench(more_rules, args.repeat)),
+    ]
+    print(f"batch: {len(posts)} posts, {len(spec.apply(posts))} kept")
+    for name, t in rows:
+        print(f"{name:<28} {t * 1e6:8.1f} us/page   x{base / t:5.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""Micro-benchmark: HttpClient.get_json decode paths on a Danbooru-sized page.
+
+    python benchmarks/bench_json_decode.py [--posts 200] [--repeat 200]
+
+Compares the old text path (bytes -> str, regex over everything, strip,
+json.loads) with `decode_json_bytes` using orjson (if installed) and the
+stdlib fallback.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import random
+import string
+import time
+
+from moescraper.core import http as http_mod
+from moescraper.core.http import decode_json_bytes, decode_json_text
+
+
+def fake_danbooru_page(n_posts: int, seed: int = 0) -> bytes:
+    """Posts shaped like /posts.json (same keys, similar field sizes)."""
+    rnd = random.Random(seed)
+
+    def word() -> str:
+        return "".join(rnd.choices(string.ascii_lowercase + "_", k=rnd.randint(4, 18)))
+
+    posts = []
+    for i in range(n_posts):
+        md5 = "%032x" % rnd.getrandbits(128)
+        general = " ".join(word() for _ in range(rnd.randint(20, 60)))
+        posts.append(
+            {
+                "id": 7_000_000 - i,
+                "created_at": "2024-05-01T12:34:56.789-04:00",
+                "uploader_id": rnd.randint(1, 10**6),
+                "score": rnd.randint(0, 500),
+                "source": f"https://www.pixiv.net/artworks/{rnd.randint(10**7, 10**8)}",
+                "md5": md5,
+                "rating": rnd.choice("gsqe"),
+                "image_width": rnd.randint(500, 4000),
+                "image_height": rnd.randint(500, 4000),
+                "tag_string": general + " 1girl solo",
+                "fav_count": rnd.randint(0, 900),
+                "file_ext": "jpg",
+                "parent_id": None,
+                "has_children": False,
+                "tag_count_general": general.count(" ") + 1,
+                "tag_count_artist": 1,
+                "tag_count_character": 1,
+                "tag_count_copyright": 1,
+                "file_size": rnd.randint(10**5, 10**7),
+                "tag_string_general": general,
+                "tag_string_character": word(),
+                "tag_string_copyright": word(),
+                "tag_string_artist": word(),
+                "tag_string_meta": "highres",
+                "file_url": f"https://cdn.donmai.us/original/{md5[:2]}/{md5[2:4]}/{md5}.jpg",
+                "large_file_url": f"https://cdn.donmai.us/sample/{md5[:2]}/{md5[2:4]}/sample-{md5}.jpg",
+                "preview_file_url": f"https://cdn.donmai.us/180x180/{md5[:2]}/{md5[2:4]}/{md5}.jpg",
+            }
+        )
+    return json.dumps(posts, ensure_ascii=False).encode("utf-8")
+
+
+def old_text_path(body: bytes):
+    # What get_json did before: resp.text, then decode_json_text.
+    return decode_json_text(body.decode("utf-8"))
+
+
+def bench(fn, body: bytes, repeat: int) -> float:
+    fn(body)  # warm up
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        fn(body)
+    return (time.perf_counter() - t0) / repeat
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--posts", type=int, default=200)
+    ap.add_argument("--repeat", type=int, default=200)
+    args = ap.parse_args()
+
+    body = fake_danbooru_page(args.posts)
+    print(f"payload: {args.posts} posts, {len(body) / 1024:.0f} KiB")
+
+    base = bench(old_text_path, body, args.repeat)
+    rows = [("text path (before)", base)]
+
+    orjson_mod = http_mod.orjson
+    if orjson_mod is not None:
+        rows.append(("bytes + orjson", bench(decode_json_bytes, body, args.repeat)))
+    http_mod.orjson = None
+    try:
+        rows.append(("bytes + json", bench(decode_json_bytes, body, args.repeat)))
+    finally:
+        http_mod.orjson = orjson_mod
+
+    assert decode_json_bytes(body) == old_text_path(body)
+    for name, t in rows:
+        print(f"{name:<20} {t * 1e3:8.3f} ms/page   x{base / t:5.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""Micro-benchmark: near-duplicate lookups over stored perceptual hashes.
+
+    python benchmarks/bench_phash_index.py [--hashes 200000] [--queries 500] [--k 4 8]
+
+Compares, per query, a linear scan, a BK-tree (the classic metric tree,
+kept here for reference) and `HashIndex` (multi-index hashing). Stored
+hashes are random 64-bit ints; queries are stored hashes with up to k+2
+bits flipped, so both hits and misses are measured.
+"""
+
+from __future__ import annotations
+
+import argparse
+import random
+import time
+
+from moescraper.core.phash import HashIndex
+
+
+class BKTree:
+    def __init__(self) -> None:
+        self.root: list | None = None  # [hash, value, {distance: child}]
+
+    def add(self, h: int, value: int) -> None:
+        if self.root is None:
+            self.root = [h, value, {}]
+            return
+        node = self.root
+        while True:
+            d = (node[0] ^ h).bit_count()
+            child = node[2].get(d)
+            if child is None:
+                node[2][d] = [h, value, {}]
+                return
+            node = child
+
+    def query(self, h: int, k: int) -> list[tuple[int, int]]:
+        out = []
+        stack = [self.root] if self.root is not None else []
+        while stack:
+            node = stack.pop()
+            d = (node[0] ^ h).bit_count()
+            if d <= k:
+                out.append((d, node[1]))
+            for dist, child in node[2].items():
+                if d - k <= dist <= d + k:
+                    stack.append(child)
+        out.sort()
+        return out
+
+
+def linear(hashes: list[int], h: int, k: int) -> list[tuple[int, int]]:
+    out = [(d, i) for i, x in enumerate(hashes) if (d := (x ^ h).bit_count()) <= k]
+    out.sort()
+    return out
+
+
+def bench(fn, queries) -> float:
+    t0 = time.perf_counter()
+    for q in queries:
+        fn(q)
+    return (time.perf_counter() - t0) / len(queries)
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--hashes", type=int, default=200_000)
+    ap.add_argument("--queries", type=int, default=500)
+    ap.add_argument("--k", type=int, nargs="+", default=[4, 8])
+    args = ap.parse_args()
+
+    rnd = random.Random(0)
+    hashes = [rnd.getrandbits(64) for _ in range(args.hashes)]
+
+    t0 = time.perf_counter()
+    tree = BKTree()
+    for i, h in enumerate(hashes):
+        tree.add(h, i)
+    print(f"{len(hashes)} hashes; BK-tree build {time.perf_counter() - t0:.2f}s")
+
+    for k in args.k:
+        queries = []
+        for _ in range(args.queries):
+            q = rnd.choice(hashes)
+            for _ in range(rnd.randrange(k + 3)):
+                q ^= 1 << rnd.randrange(64)
+            queries.append(q)
+
+        t0 = time.perf_counter()
+        index = HashIndex(k)
+        index.add_many((h, i) for i, h in enumerate(hashes))
+        build = time.perf_counter() - t0
+
+        assert all(index.query(q) == tree.query(q, k) for q in queries[:50])
+        n_lin = max(1, len(queries) // 20)  # the scan is slow; time a sample
+        base = bench(lambda q: linear(hashes, q, k), queries[:n_lin])
+        rows = [
+            ("linear scan", base),
+            ("BK-tree", bench(lambda q: tree.query(q, k), queries)),
+            ("HashIndex", bench(index.query, queries)),
+        ]
+        print(f"k={k} (HashIndex build {build:.2f}s)")
+        for name, t in rows:
+            print(f"  {name:<12} {t * 1e6:10.1f} us/query   x{base / t:8.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+"""Memory benchmark: old Post (dataclass, list tags, raw kept) vs slotted Post.
+
+    python benchmarks/bench_post_memory.py [--n 1000000] [--tags 40]
+
+Builds N synthetic Danbooru-like posts the way the adapters do (fresh tag
+strings per post from `tag_string.split()`) and reports how much each variant
+grows the process (peak RSS, one fresh interpreter per variant; Unix only).
+"""
+
+from __future__ import annotations
+
+import argparse
+import gc
+import itertools
+import multiprocessing
+import random
+import resource
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import asdict, dataclass
+from typing import Any, Optional
+
+from moescraper.core.models import Post, Rating
+
+
+@dataclass(frozen=True)
+class OldPost:
+    """Post as it was before: no slots, list tags, API item always on `raw`."""
+
+    source: str
+    post_id: str
+    file_url: Optional[str]
+    preview_url: Optional[str]
+    tags: list[str]
+    rating: Rating
+    width: Optional[int] = None
+    height: Optional[int] = None
+    md5: Optional[str] = None
+    file_ext: Optional[str] = None
+    raw: Optional[dict[str, Any]] = None
+
+    def to_dict(self) -> dict[str, Any]:
+        d = asdict(self)
+        d["rating"] = self.rating.value
+        return d
+
+
+def fake_items(n: int, n_tags: int, seed: int = 0):
+    rnd = random.Random(seed)
+    vocab = [f"tag_{i:05d}" for i in range(20_000)]
+    # zipf-ish: a few tags are on almost every post
+    cum = list(itertools.accumulate(1.0 / (i + 1) for i in range(len(vocab))))
+    for i in range(n):
+        md5 = "%032x" % rnd.getrandbits(128)
+        tag_string = " ".join(rnd.choices(vocab, cum_weights=cum, k=n_tags))
+        yield {
+            "id": 7_000_000 - i,
+            "md5": md5,
+            "rating": "g",
+            "image_width": 1200,
+            "image_height": 1600,
+            "file_ext": "jpg",
+            "tag_string": tag_string,
+            "file_url": f"https://cdn.donmai.us/original/{md5[:2]}/{md5[2:4]}/{md5}.jpg",
+            "preview_file_url": f"https://cdn.donmai.us/180x180/{md5[:2]}/{md5[2:4]}/{md5}.jpg",
+        }
+
+
+def build(cls, items, keep_raw: bool) -> list:
+    out = []
+    for it in items:
+        # Like the adapters: split() gives fresh tag strings for every post.
+        tags = it["tag_string"].split()
+        out.append(
+            cls(
+                source="danbooru",
+                post_id=str(it["id"]),
+                file_url=it["file_url"],
+                preview_url=it["preview_file_url"],
+                tags=tags,
+                rating=Rating.SAFE,
+                width=it["image_width"],
+                height=it["image_height"],
+                md5=it["md5"],
+                file_ext=it["file_ext"],
+                raw=it if keep_raw else None,
+            )
+        )
+    return out
+
+
+def _peak_rss() -> int:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024  # KiB on Linux
+
+
+def _measure_child(cls_name: str, n: int, n_tags: int, keep_raw: bool) -> tuple[int, float]:
+    cls = {"OldPost": OldPost, "Post": Post}[cls_name]
+    gc.collect()
+    base = _peak_rss()
+    t0 = time.perf_counter()
+    posts = build(cls, fake_items(n, n_tags), keep_raw)
+    elapsed = time.perf_counter() - t0
+    grown = _peak_rss() - base
+    assert posts[0].to_dict()["tags"] == list(posts[0].tags)
+    return grown, elapsed
+
+
+def measure(label: str, cls_name: str, n: int, n_tags: int, keep_raw: bool) -> int:
+    # Fresh interpreter per variant, so peak RSS is not shared between runs.
+    ctx = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=1, mp_context=ctx) as ex:
+        grown, elapsed = ex.submit(_measure_child, cls_name, n, n_tags, keep_raw).result()
+    print(f"{label:<34} {grown / 2**20:9.1f} MiB  {grown / n:7.0f} B/post  {elapsed:6.1f} s")
+    return grown
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--n", type=int, default=1_000_000)
+    ap.add_argument("--tags", type=int, default=40, help="tags per post")
+    args = ap.parse_args()
+
+    print(f"{args.n:,} posts, {args.tags} tags each")
+    before = measure("before (dataclass, list, raw)", "OldPost", args.n, args.tags, keep_raw=True)
+    measure("slotted Post, keep_raw=True", "Post", args.n, args.tags, keep_raw=True)
+    after = measure("slotted Post (default)", "Post", args.n, args.tags, keep_raw=False)
+    print(f"reduction: x{before / after:.1f}")
+
+
+if __name__ == "__main__":
+    main()
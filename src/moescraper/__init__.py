@@ -1,4 +1,4 @@
-from .client import MoeScraperClient
+from .client import AsyncMoeScraperClient, MoeScraperClient
 
-__all__ = ["MoeScraperClient"]
+__all__ = ["AsyncMoeScraperClient", "MoeScraperClient"]
 __version__ = "0.1.0"
\ No newline at end of file
@@ -1,9 +1,11 @@
 from .danbooru import DanbooruAdapter
+from .local import LocalIndexAdapter
 from .safebooru import SafebooruAdapter
 from .zerochan import ZerochanAdapter
 
 __all__ = [
     "DanbooruAdapter",
+    "LocalIndexAdapter",
     "SafebooruAdapter",
     "ZerochanAdapter",
 ]
\ No newline at end of file
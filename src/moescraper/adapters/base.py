@@ -1,18 +1,32 @@
 from __future__ import annotations
 
-from abc import ABC, abstractmethod
-from typing import Optional
+import asyncio
+from abc import ABC
+from typing import Any, Optional, Union
 
 from moescraper.core.http import HttpClient
 from moescraper.core.models import Post
 
+# Position of a result page: a page number (int), or a keyset cursor (str)
+# returned by `search_page` of an adapter with `supports_cursor`.
+Cursor = Union[int, str]
+
 
 class BaseAdapter(ABC):
     source_name: str
     hard_limit: Optional[int] = None
+    # Keyset pagination ("posts older than id N"): the cost of a page does not
+    # grow with its depth. Adapters that set this implement `build_cursor_request`.
+    supports_cursor: bool = False
 
-    def __init__(self, http: HttpClient):
+    def __init__(self, http: HttpClient, *, keep_raw: bool = False):
+        # `http` is either HttpClient (sync) or AsyncHttpClient (async client).
         self.http = http
+        # Keep each API item on Post.raw (off by default: it dominates memory).
+        self.keep_raw = keep_raw
+
+    def close(self) -> None:
+        """Release adapter-owned resources (the HTTP client belongs to the caller)."""
 
     def clamp(self, *, page: int, limit: int, default_limit: int = 20) -> tuple[int, int]:
         """Normalize page/limit consistently across adapters."""
@@ -27,6 +41,89 @@ class BaseAdapter(ABC):
         """Default tag joiner (space-separated)."""
         return " ".join(t for t in tags if t)
 
-    @abstractmethod
+    def build_request(
+        self, tags: list[str], page: int, limit: int, nsfw: bool
+    ) -> tuple[str, dict[str, Any]]:
+        """Return (url, params) for one search page."""
+        raise NotImplementedError(f"{type(self).__name__}: implement build_request or search")
+
+    def parse_response(self, data: Any, *, limit: int, nsfw: bool) -> list[Post]:
+        """Turn decoded JSON of one search page into posts."""
+        raise NotImplementedError(f"{type(self).__name__}: implement parse_response or search")
+
+    def _search_only(self) -> bool:
+        # Adapters written against the old API only override `search`; they
+        # page by number and run in a thread on the async client.
+        cls = type(self)
+        return (
+            cls.search is not BaseAdapter.search
+            and cls.build_request is BaseAdapter.build_request
+        )
+
+    def build_cursor_request(
+        self, tags: list[str], cursor: str, limit: int, nsfw: bool
+    ) -> tuple[str, dict[str, Any]]:
+        """Return (url, params) for the page after `cursor` (keyset adapters only)."""
+        raise NotImplementedError(f"{type(self).__name__} does not support cursor pagination")
+
+    def can_use_cursor(self, tags: list[str]) -> bool:
+        """Keyset paging walks ids downward, so it only holds for the default id order."""
+        return self.supports_cursor and not any(t.startswith(("order:", "sort:")) for t in tags)
+
+    def cursor_after(self, posts: list[Post]) -> Optional[str]:
+        """Cursor for the page after `posts`: the last (smallest) id seen."""
+        ids = [int(p.post_id) for p in posts if p.post_id.isdigit()]
+        return str(min(ids)) if ids else None
+
+    def _page_request(
+        self, tags: list[str], cursor: Cursor, limit: int, nsfw: bool
+    ) -> tuple[str, dict[str, Any]]:
+        if isinstance(cursor, str):
+            return self.build_cursor_request(tags, cursor, limit, nsfw)
+        return self.build_request(tags, cursor, limit, nsfw)
+
+    def _next_cursor(self, tags: list[str], cursor: Cursor, posts: list[Post]) -> Optional[Cursor]:
+        if not self.can_use_cursor(tags):
+            return int(cursor) + 1
+        # An empty keyset page is the end of the result set.
+        return self.cursor_after(posts)
+
+    def search_page(
+        self, tags: list[str], cursor: Cursor, limit: int, nsfw: bool
+    ) -> tuple[list[Post], Optional[Cursor]]:
+        """One page at `cursor` plus the cursor of the next page (None when exhausted).
+
+        A page number works as a starting cursor for every adapter; keyset
+        adapters answer with a string cursor from then on, other adapters
+        with the next page number.
+        """
+        if self._search_only():
+            page = int(cursor)
+            return self.search(tags, page, limit, nsfw), page + 1
+        url, params = self._page_request(tags, cursor, limit, nsfw)
+        data = self.http.get_json(url, params=params)
+        posts = self.parse_response(data, limit=limit, nsfw=nsfw)
+        return posts, self._next_cursor(tags, cursor, posts)
+
+    async def search_page_async(
+        self, tags: list[str], cursor: Cursor, limit: int, nsfw: bool
+    ) -> tuple[list[Post], Optional[Cursor]]:
+        if self._search_only():
+            return await asyncio.to_thread(self.search_page, tags, cursor, limit, nsfw)
+        url, params = self._page_request(tags, cursor, limit, nsfw)
+        data = await self.http.get_json(url, params=params)
+        posts = self.parse_response(data, limit=limit, nsfw=nsfw)
+        return posts, self._next_cursor(tags, cursor, posts)
+
     def search(self, tags: list[str], page: int, limit: int, nsfw: bool) -> list[Post]:
-        raise NotImplementedError
\ No newline at end of file
+        url, params = self.build_request(tags, page, limit, nsfw)
+        data = self.http.get_json(url, params=params)
+        return self.parse_response(data, limit=limit, nsfw=nsfw)
+
+    async def search_async(self, tags: list[str], page: int, limit: int, nsfw: bool) -> list[Post]:
+        """Same as `search`, but requires the adapter to be bound to an AsyncHttpClient."""
+        if self._search_only():
+            return await asyncio.to_thread(self.search, tags, page, limit, nsfw)
+        url, params = self.build_request(tags, page, limit, nsfw)
+        data = await self.http.get_json(url, params=params)
+        return self.parse_response(data, limit=limit, nsfw=nsfw)
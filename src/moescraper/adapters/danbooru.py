@@ -1,7 +1,10 @@
 from __future__ import annotations
 
+from typing import Any
+
 from moescraper.core.filters import normalize_rating
 from moescraper.core.models import Post
+
 from .base import BaseAdapter
 
 
@@ -9,17 +12,32 @@ class DanbooruAdapter(BaseAdapter):
     source_name = "danbooru"
     base_url = "https://danbooru.donmai.us"
     hard_limit = 200
+    supports_cursor = True
 
-    def search(self, tags: list[str], page: int, limit: int, nsfw: bool) -> list[Post]:
+    def build_request(
+        self, tags: list[str], page: int, limit: int, nsfw: bool
+    ) -> tuple[str, dict[str, Any]]:
         page, limit = self.clamp(page=page, limit=limit)
+        return self._posts_request(tags, page, limit, nsfw)
+
+    def build_cursor_request(
+        self, tags: list[str], cursor: str, limit: int, nsfw: bool
+    ) -> tuple[str, dict[str, Any]]:
+        # page=b<id>: posts with id < <id>, newest first
+        _, limit = self.clamp(page=1, limit=limit)
+        return self._posts_request(tags, f"b{int(cursor)}", limit, nsfw)
+
+    def _posts_request(
+        self, tags: list[str], page: int | str, limit: int, nsfw: bool
+    ) -> tuple[str, dict[str, Any]]:
         q = self.build_query(tags)
         if not nsfw:
             q = (q + " " if q else "") + "-rating:q -rating:e"
 
         params = {"tags": q, "page": page, "limit": limit}
-        url = f"{self.base_url}/posts.json"
-        data = self.http.get_json(url, params=params)
+        return f"{self.base_url}/posts.json", params
 
+    def parse_response(self, data: Any, *, limit: int, nsfw: bool) -> list[Post]:
         posts: list[Post] = []
         for item in data:
             file_url = item.get("file_url")
@@ -44,7 +62,8 @@ class DanbooruAdapter(BaseAdapter):
                 height=item.get("image_height"),
                 md5=item.get("md5"),
                 file_ext=item.get("file_ext"),
-                raw=item,
+                raw=item if self.keep_raw else None,
+                file_size=item.get("file_size"),
             )
             posts.append(p)
 
@@ -0,0 +1,161 @@
+from __future__ import annotations
+
+import asyncio
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Optional
+
+from moescraper.core.index_db import IndexDB
+from moescraper.core.models import Post
+
+from .base import BaseAdapter, Cursor
+
+_RATING_ALIASES = {
+    "g": "safe",
+    "general": "safe",
+    "safe": "safe",
+    "s": "sensitive",
+    "sensitive": "sensitive",
+    "q": "nsfw",
+    "questionable": "nsfw",
+    "e": "nsfw",
+    "explicit": "nsfw",
+    "nsfw": "nsfw",
+    "unknown": "unknown",
+}
+
+_SIZE_OPS = (">=", "<=", ">", "<", "=")
+
+
+@dataclass
+class _LocalQuery:
+    include: list[str] = field(default_factory=list)
+    exclude: list[str] = field(default_factory=list)
+    ratings: Optional[set[str]] = None
+    exclude_ratings: set[str] = field(default_factory=set)
+    sources: Optional[set[str]] = None
+    size: list[tuple[str, str, int]] = field(default_factory=list)
+
+
+def _ratings(value: str) -> set[str]:
+    out = set()
+    for v in value.lower().split(","):
+        if v not in _RATING_ALIASES:
+            raise ValueError(f"Unknown rating '{v}'")
+        out.add(_RATING_ALIASES[v])
+    return out
+
+
+def parse_local_query(tags: list[str]) -> _LocalQuery:
+    """Danbooru-style query: `tag` (required), `-tag` (excluded) and the metatags
+    `rating:g,s` / `-rating:e`, `source:danbooru`, `width:>=1024`, `height:<2000`."""
+    q = _LocalQuery()
+    for raw in tags:
+        neg = raw.startswith("-")
+        t = raw[1:] if neg else raw
+        if not t:
+            continue
+        name, _, value = t.partition(":")
+        if value and name == "rating":
+            if neg:
+                q.exclude_ratings |= _ratings(value)
+            else:
+                q.ratings = _ratings(value) if q.ratings is None else q.ratings & _ratings(value)
+        elif value and name == "source" and not neg:
+            q.sources = {value} if q.sources is None else q.sources & {value}
+        elif value and name in ("width", "height") and not neg:
+            op = next((o for o in _SIZE_OPS if value.startswith(o)), "=")
+            q.size.append((name, op, int(value[len(op) :] if value.startswith(op) else value)))
+        elif neg:
+            q.exclude.append(t)
+        else:
+            q.include.append(t)
+    return q
+
+
+class LocalIndexAdapter(BaseAdapter):
+    """Offline search over the posts already in an IndexDB (no HTTP).
+
+    Same tag semantics as the booru adapters (all tags required, `-tag`
+    excluded, nsfw=False drops nsfw ratings) plus a few metatags, answered from
+    the SQLite FTS index, so `download` / `save_metadata` can reuse an index
+    built by earlier scrapes. Pages are keyset cursors on the index row id.
+    """
+
+    source_name = "local"
+    supports_cursor = True
+
+    def __init__(
+        self,
+        http: Any = None,
+        *,
+        index_db: str | Path = "out/index.sqlite",
+        downloaded_only: bool = False,
+        keep_raw: bool = False,
+    ):
+        super().__init__(http, keep_raw=keep_raw)
+        self.index_db = Path(index_db)
+        self.downloaded_only = downloaded_only
+        self._db: Optional[IndexDB] = None
+
+    @property
+    def db(self) -> IndexDB:
+        # Read-only: a missing or mistyped path raises instead of creating an
+        # empty index that silently answers nothing.
+        if self._db is None:
+            self._db = IndexDB(self.index_db, read_only=True)
+        return self._db
+
+    def close(self) -> None:
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+    def build_request(
+        self, tags: list[str], page: int, limit: int, nsfw: bool
+    ) -> tuple[str, dict[str, Any]]:
+        raise NotImplementedError("LocalIndexAdapter reads IndexDB directly (no HTTP request)")
+
+    def parse_response(self, data: Any, *, limit: int, nsfw: bool) -> list[Post]:
+        # `data` is what IndexDB.search_posts returned: (row id, Post) pairs.
+        return [p for _, p in data][: max(1, limit)]
+
+    def _query(
+        self, tags: list[str], cursor: Cursor, limit: int, nsfw: bool
+    ) -> list[tuple[int, Post]]:
+        q = parse_local_query(tags)
+        if not nsfw:
+            q.exclude_ratings.add("nsfw")
+        limit = max(int(limit), 1)
+        before_id = int(cursor) if isinstance(cursor, str) else None
+        offset = 0 if isinstance(cursor, str) else (max(int(cursor), 1) - 1) * limit
+        return self.db.search_posts(
+            q.include,
+            q.exclude,
+            ratings=q.ratings,
+            exclude_ratings=q.exclude_ratings,
+            sources=q.sources,
+            size=q.size,
+            downloaded_only=self.downloaded_only,
+            before_id=before_id,
+            offset=offset,
+            limit=limit,
+        )
+
+    def search(self, tags: list[str], page: int, limit: int, nsfw: bool) -> list[Post]:
+        return self.parse_response(self._query(tags, page, limit, nsfw), limit=limit, nsfw=nsfw)
+
+    def search_page(
+        self, tags: list[str], cursor: Cursor, limit: int, nsfw: bool
+    ) -> tuple[list[Post], Optional[Cursor]]:
+        rows = self._query(tags, cursor, limit, nsfw)
+        nxt = str(rows[-1][0]) if rows else None
+        return self.parse_response(rows, limit=limit, nsfw=nsfw), nxt
+
+    async def search_async(self, tags: list[str], page: int, limit: int, nsfw: bool) -> list[Post]:
+        return await asyncio.to_thread(self.search, tags, page, limit, nsfw)
+
+    async def search_page_async(
+        self, tags: list[str], cursor: Cursor, limit: int, nsfw: bool
+    ) -> tuple[list[Post], Optional[Cursor]]:
+        return await asyncio.to_thread(self.search_page, tags, cursor, limit, nsfw)
@@ -1,7 +1,10 @@
 from __future__ import annotations
 
+from typing import Any
+
 from moescraper.core.filters import normalize_rating
 from moescraper.core.models import Post
+
 from .base import BaseAdapter
 
 
@@ -9,10 +12,26 @@ class SafebooruAdapter(BaseAdapter):
     source_name = "safebooru"
     base_url = "https://safebooru.org"
     hard_limit = 200
+    supports_cursor = True
 
-    def search(self, tags: list[str], page: int, limit: int, nsfw: bool) -> list[Post]:
+    def build_request(
+        self, tags: list[str], page: int, limit: int, nsfw: bool
+    ) -> tuple[str, dict[str, Any]]:
         page, limit = self.clamp(page=page, limit=limit)
-        pid = max(page - 1, 0)
+        return self._index_request(tags, page - 1, limit, nsfw)
+
+    def build_cursor_request(
+        self, tags: list[str], cursor: str, limit: int, nsfw: bool
+    ) -> tuple[str, dict[str, Any]]:
+        # Gelbooru-style API has no keyset paging; emulate it with an id:< tag
+        # and always ask for the first page.
+        _, limit = self.clamp(page=1, limit=limit)
+        return self._index_request(tags + [f"id:<{int(cursor)}"], 0, limit, nsfw)
+
+    def _index_request(
+        self, tags: list[str], pid: int, limit: int, nsfw: bool
+    ) -> tuple[str, dict[str, Any]]:
+        pid = max(pid, 0)
         q = self.build_query(tags)
 
         if not nsfw:
@@ -28,9 +47,9 @@ class SafebooruAdapter(BaseAdapter):
             "limit": limit,
         }
 
-        url = f"{self.base_url}/index.php"
-        data = self.http.get_json(url, params=params)
+        return f"{self.base_url}/index.php", params
 
+    def parse_response(self, data: Any, *, limit: int, nsfw: bool) -> list[Post]:
         # bentuk response kadang list, kadang dict
         if isinstance(data, dict) and "post" in data:
             items = data["post"]
@@ -65,7 +84,7 @@ class SafebooruAdapter(BaseAdapter):
                 height=item.get("height"),
                 md5=item.get("md5"),
                 file_ext=item.get("file_ext"),
-                raw=item,
+                raw=item if self.keep_raw else None,
             )
             posts.append(p)
 
@@ -1,11 +1,12 @@
 from __future__ import annotations
 
 import re
+from typing import Any
 from urllib.parse import quote_plus
 
 from moescraper.core.models import Post, Rating
-from .base import BaseAdapter
 
+from .base import BaseAdapter
 
 _ADULT_TAG_RE = re.compile(r"adult only|nsfw|explicit", re.IGNORECASE)
 
@@ -14,7 +15,9 @@ class ZerochanAdapter(BaseAdapter):
     source_name = "zerochan"
     base_url = "https://www.zerochan.net"
 
-    def search(self, tags: list[str], page: int, limit: int, nsfw: bool) -> list[Post]:
+    def build_request(
+        self, tags: list[str], page: int, limit: int, nsfw: bool
+    ) -> tuple[str, dict[str, Any]]:
         p, limit = self.clamp(page=page, limit=limit)
 
         if tags:
@@ -24,9 +27,9 @@ class ZerochanAdapter(BaseAdapter):
         else:
             url = f"{self.base_url}/"
             params = {"p": p, "json": 1}
+        return url, params
 
-        data = self.http.get_json(url, params=params)
-
+    def parse_response(self, data: Any, *, limit: int, nsfw: bool) -> list[Post]:
         items = None
         if isinstance(data, dict):
             items = data.get("items") or data.get("results") or data.get("images")
@@ -68,7 +71,7 @@ class ZerochanAdapter(BaseAdapter):
                     preview_url=preview,
                     tags=tags_out,
                     rating=rating,
-                    raw=it if isinstance(it, dict) else {"value": it},
+                    raw=(it if isinstance(it, dict) else {"value": it}) if self.keep_raw else None,
                 )
             )
 
@@ -2,37 +2,75 @@ from __future__ import annotations
 
 from dataclasses import dataclass
 from pathlib import Path
-from typing import Literal, Optional
+from typing import Callable, Iterable, Literal, Optional
 
-from moescraper.core.http import HttpClient, HttpConfig
+from moescraper.adapters import (
+    DanbooruAdapter,
+    LocalIndexAdapter,
+    SafebooruAdapter,
+    ZerochanAdapter,
+)
+from moescraper.adapters.base import BaseAdapter, Cursor
+from moescraper.core.downloader import (
+    DownloadEngine,
+    StorageLayout,
+    download_posts,
+    download_posts_async,
+    make_async_download_client,
+)
+from moescraper.core.filters import FilterSpec
+from moescraper.core.http import AsyncHttpClient, HttpClient, HttpConfig
 from moescraper.core.models import Post
-from moescraper.core.filters import filter_posts
-from moescraper.core.downloader import download_posts
-from moescraper.core.metadata import write_jsonl, write_csv
+from moescraper.core.parquet import write_parquet
+from moescraper.core.transform import TransformConfig
+from moescraper.core.writers import MetadataWriter
 
-from moescraper.adapters.base import BaseAdapter
-from moescraper.adapters import DanbooruAdapter, SafebooruAdapter, ZerochanAdapter
 
+def _split_tags(tags: list[str] | str | None) -> list[str]:
+    if isinstance(tags, str):
+        return [t for t in tags.split() if t]
+    return tags or []
 
-@dataclass
-class MoeScraperClient:
-    http_cfg: Optional[HttpConfig] = None
-    enable_default_adapters: bool = True
 
-    def __post_init__(self) -> None:
-        self.http = HttpClient(self.http_cfg)
-        self.adapters: dict[str, BaseAdapter] = {}
+def _missing_size(p: Post) -> bool:
+    return p.width is None or p.height is None or p.file_size is None
 
-        if self.enable_default_adapters:
-            self.register_defaults()
 
-    def close(self) -> None:
-        self.http.close()
+def _search_filter(
+    spec: FilterSpec | None,
+    nsfw: bool,
+    min_width: int | None,
+    min_height: int | None,
+    allowed_exts: list[str] | set[str] | None,
+    allow_unknown_ext: bool,
+) -> FilterSpec:
+    # A compiled spec from the caller replaces the keyword filters.
+    if spec is not None:
+        return spec
+    return FilterSpec.for_search(
+        nsfw,
+        min_width=min_width,
+        min_height=min_height,
+        allowed_exts=allowed_exts,
+        allow_unknown_ext=allow_unknown_ext,
+    )
+
+
+class _AdapterRegistry:
+    """Adapter bookkeeping shared by the sync and async clients."""
+
+    http: HttpClient | AsyncHttpClient
+    adapters: dict[str, BaseAdapter]
+    keep_raw: bool
 
     def register_defaults(self) -> None:
         self.register_adapter(DanbooruAdapter, source_name="danbooru")
         self.register_adapter(SafebooruAdapter, source_name="safebooru")
         self.register_adapter(ZerochanAdapter, source_name="zerochan")
+        # Offline search over out/index.sqlite (opened read-only on first query;
+        # an error if it doesn't exist). Register your own
+        # LocalIndexAdapter(index_db=...) with override=True for another index.
+        self.register_adapter(LocalIndexAdapter, source_name="local")
 
     def register_adapter(
         self,
@@ -46,6 +84,7 @@ class MoeScraperClient:
             if not name:
                 raise ValueError("Adapter class must define source_name")
             inst = adapter(self.http)
+            inst.keep_raw = self.keep_raw
         else:
             name = source_name or getattr(adapter, "source_name", None)
             if not name:
@@ -60,13 +99,75 @@ class MoeScraperClient:
     def register(self, adapter: BaseAdapter | type[BaseAdapter], *, source_name: Optional[str] = None) -> None:
         self.register_adapter(adapter, source_name=source_name, override=False)
 
+    def _close_adapters(self) -> None:
+        for adapter in self.adapters.values():
+            adapter.close()
+
     def available_sources(self) -> list[str]:
         return sorted(self.adapters.keys())
 
+    def _adapter_for(self, source: str) -> BaseAdapter:
+        if source not in self.adapters:
+            available = ", ".join(self.available_sources())
+            raise KeyError(f"Unknown source '{source}'. Available: {available}")
+        return self.adapters[source]
+
+
+@dataclass
+class MoeScraperClient(_AdapterRegistry):
+    http_cfg: Optional[HttpConfig] = None
+    enable_default_adapters: bool = True
+    # Keep the full API item on Post.raw (memory-heavy; off by default).
+    keep_raw: bool = False
+
+    def __post_init__(self) -> None:
+        self.http = HttpClient(self.http_cfg)
+        self.adapters: dict[str, BaseAdapter] = {}
+        self._engine: Optional[DownloadEngine] = None
+
+        if self.enable_default_adapters:
+            self.register_defaults()
+
+    def rate_limit_stats(self) -> dict[str, dict[str, float]]:
+        """Per-host requests and wait time of the limiter shared by API calls and downloads."""
+        return self.http.limiter.stats()
+
+    def cache_stats(self) -> dict[str, int]:
+        """Hit/miss counters of the API response cache (empty when `cache_path` is unset)."""
+        return self.http.cache_stats()
+
+    def close(self) -> None:
+        if self._engine is not None:
+            self._engine.close()
+            self._engine = None
+        self._close_adapters()
+        self.http.close()
+
+    def download_engine(self, max_workers: Optional[int] = None) -> DownloadEngine:
+        """The client's long-lived DownloadEngine (created on first use, grown on demand).
+
+        The engine is shared, so it is never shrunk here; callers bound their
+        own concurrency (see `download_posts(max_workers=...)`).
+        """
+        if self._engine is None:
+            self._engine = DownloadEngine(
+                max_workers=max_workers or 4,
+                user_agent=self.http.cfg.user_agent,
+                limiter=self.http.limiter,
+                http2=self.http.cfg.http2,
+                http2_max_connections=self.http.cfg.http2_max_connections,
+                http2_max_streams=self.http.cfg.http2_max_streams,
+                retry=self.http.cfg.retry,
+                budget=self.http.retry_budget,
+            )
+        elif max_workers and max_workers > self._engine.max_workers:
+            self._engine.resize(max_workers)
+        return self._engine
+
     def scrape_images(
         self,
         *,
-        source: str,
+        source: str | list[str],
         tags: list[str] | str | None = None,
         n_images: int = 5000,
         nsfw_mode: Literal["safe", "all", "nsfw"] = "safe",
@@ -78,23 +179,33 @@ class MoeScraperClient:
         limit: int = 200,
         min_width: int | None = None,
         min_height: int | None = None,
+        min_aspect: float | None = None,
+        max_aspect: float | None = None,
+        max_file_size: int | None = None,
+        include_tags: list[str] | set[str] | None = None,
+        exclude_tags: list[str] | set[str] | None = None,
+        probe: bool = False,
+        probe_concurrency: int = 8,
         max_workers: int = 4,
+        prefetch_pages: int = 2,
         overwrite: bool = False,
         resume: bool = True,
         max_empty_pages: int = 10,
         allowed_exts: list[str] | set[str] | None = None,
         allow_unknown_ext: bool = False,
         freeze_apng: bool = True,
+        layout: StorageLayout = "flat",
+        transform: TransformConfig | None = None,
+        phash: bool = False,
+        near_dup_distance: int | None = None,
+        shard_size: int | None = None,
     ) -> None:
         from moescraper.core.batch_scrape import ScrapeConfig, scrape_to_count
 
-        if isinstance(tags, str):
-            tags_list = [t for t in tags.split() if t]
-        else:
-            tags_list = tags or []
+        tags_list = _split_tags(tags)
 
         cfg = ScrapeConfig(
-            source=source,
+            source=source if isinstance(source, str) else list(source),
             tags=tags_list,
             target=int(n_images),
             out_dir=Path(out_dir),
@@ -106,13 +217,26 @@ class MoeScraperClient:
             nsfw_mode=nsfw_mode,
             min_width=min_width,
             min_height=min_height,
+            min_aspect=min_aspect,
+            max_aspect=max_aspect,
+            max_file_size=max_file_size,
+            include_tags=set(include_tags) if include_tags else None,
+            exclude_tags=set(exclude_tags) if exclude_tags else None,
+            probe=bool(probe),
+            probe_concurrency=int(probe_concurrency),
             max_workers=int(max_workers),
+            prefetch_pages=int(prefetch_pages),
             overwrite=bool(overwrite),
             resume=bool(resume),
             max_empty_pages=int(max_empty_pages),
             allowed_exts=set(allowed_exts) if allowed_exts else None,
             allow_unknown_ext=bool(allow_unknown_ext),
             freeze_apng=bool(freeze_apng),
+            layout=layout,
+            transform=transform,
+            phash=bool(phash),
+            near_dup_distance=near_dup_distance,
+            shard_size=shard_size,
         )
 
         scrape_to_count(self, cfg)
@@ -129,24 +253,61 @@ class MoeScraperClient:
         min_height: int | None = None,
         allowed_exts: list[str] | set[str] | None = None,
         allow_unknown_ext: bool = False,
+        filter_spec: FilterSpec | None = None,
     ) -> list[Post]:
-        if source not in self.adapters:
-            raise KeyError(f"Unknown source '{source}'. Available: {', '.join(self.available_sources())}")
+        adapter = self._adapter_for(source)
+        posts = adapter.search(_split_tags(tags), page=page, limit=limit, nsfw=nsfw)
+        return _search_filter(
+            filter_spec, nsfw, min_width, min_height, allowed_exts, allow_unknown_ext
+        ).apply(posts)
 
-        if isinstance(tags, str):
-            tags_list = [t for t in tags.split() if t]
-        else:
-            tags_list = tags or []
+    def search_page(
+        self,
+        *,
+        source: str,
+        tags: list[str] | str | None = None,
+        cursor: Cursor = 1,
+        limit: int = 20,
+        nsfw: bool = False,
+        min_width: int | None = None,
+        min_height: int | None = None,
+        allowed_exts: list[str] | set[str] | None = None,
+        allow_unknown_ext: bool = False,
+        filter_spec: FilterSpec | None = None,
+    ) -> tuple[list[Post], Optional[Cursor]]:
+        """Like `search`, but also returns the cursor of the next page (None when exhausted).
+
+        Start from a page number; sources with keyset paging (danbooru, safebooru)
+        hand back an id cursor, so deep pages cost the same as the first one.
+        `filter_spec` replaces the nsfw / size / ext filters (the source still gets `nsfw`).
+        """
+        adapter = self._adapter_for(source)
+        posts, nxt = adapter.search_page(_split_tags(tags), cursor, limit, nsfw)
+        posts = _search_filter(
+            filter_spec, nsfw, min_width, min_height, allowed_exts, allow_unknown_ext
+        ).apply(posts)
+        return posts, nxt
+
+    def probe(
+        self,
+        posts: list[Post],
+        *,
+        max_workers: int = 8,
+        only: Optional[Callable[[Post], bool]] = None,
+    ) -> list[Post]:
+        """Fill missing width/height/file_size from a ranged GET of each image's first bytes.
 
-        adapter = self.adapters[source]
-        posts = adapter.search(tags_list, page=page, limit=limit, nsfw=nsfw)
-        return filter_posts(
+        Probes the posts missing any of them (or those selected by `only`).
+        """
+        from moescraper.core.probe import probe_posts
+
+        engine = self.download_engine()
+        return probe_posts(
+            engine.client,
             posts,
-            nsfw=nsfw,
-            min_width=min_width,
-            min_height=min_height,
-            allowed_exts=set(allowed_exts) if allowed_exts else None,
-            allow_unknown_ext=bool(allow_unknown_ext),
+            limiter=engine.limiter,
+            only=only or _missing_size,
+            max_workers=max_workers,
         )
 
     def download(
@@ -159,30 +320,255 @@ class MoeScraperClient:
         allowed_exts: list[str] | set[str] | None = None,
         allow_unknown_ext: bool = False,
         freeze_apng: bool = True,
+        layout: StorageLayout = "flat",
+        transform: TransformConfig | None = None,
+        shard_size: int | None = None,
     ):
         return download_posts(
             posts,
             out_dir=out_dir,
-            max_workers=max_workers,
             overwrite=overwrite,
-            user_agent=self.http.cfg.user_agent,
             allowed_exts=set(allowed_exts) if allowed_exts else None,
             allow_unknown_ext=bool(allow_unknown_ext),
             freeze_apng=bool(freeze_apng),
+            max_workers=max_workers,
+            engine=self.download_engine(max_workers),
+            layout=layout,
+            transform=transform,
+            shard_size=shard_size,
         )
 
-    def save_metadata(self, posts: list[Post], out_path: str = "out/metadata.jsonl") -> None:
-        """Format inferred from extension: .jsonl | .csv"""
-        if out_path.endswith(".jsonl"):
-            write_jsonl(posts, out_path)
-        elif out_path.endswith(".csv"):
-            write_csv(posts, out_path)
+    def save_metadata(self, posts: Iterable[Post], out_path: str = "out/metadata.jsonl") -> None:
+        """Format inferred from extension: .jsonl | .csv (+ .gz | .zst) | .parquet (pyarrow)"""
+        if str(out_path).endswith(".parquet"):
+            write_parquet(posts, out_path)
         else:
-            raise ValueError("out_path must end with .jsonl | .csv")
+            with MetadataWriter(out_path) as w:
+                w.write_many(posts)
 
     # Backward-compat
     def write_metadata_jsonl(self, posts: list[Post], out_path: str = "out/metadata.jsonl") -> None:
         self.save_metadata(posts, out_path)
 
     def write_metadata_csv(self, posts: list[Post], out_path: str = "out/metadata.csv") -> None:
-        self.save_metadata(posts, out_path)
\ No newline at end of file
+        self.save_metadata(posts, out_path)
+
+
+@dataclass
+class AsyncMoeScraperClient(_AdapterRegistry):
+    """asyncio client: same API as MoeScraperClient, but search/download/scrape are coroutines.
+
+    Adapters are bound to an AsyncHttpClient and queried via `search_async`;
+    downloads run as tasks on the caller's event loop.
+    """
+
+    http_cfg: Optional[HttpConfig] = None
+    enable_default_adapters: bool = True
+    # Keep the full API item on Post.raw (memory-heavy; off by default).
+    keep_raw: bool = False
+
+    def __post_init__(self) -> None:
+        self.http = AsyncHttpClient(self.http_cfg)
+        # API calls and downloads draw from the same per-host budgets.
+        self.download_limiter = self.http.limiter
+        self.adapters: dict[str, BaseAdapter] = {}
+
+        if self.enable_default_adapters:
+            self.register_defaults()
+
+    def cache_stats(self) -> dict[str, int]:
+        """Hit/miss counters of the API response cache (empty when `cache_path` is unset)."""
+        return self.http.cache_stats()
+
+    async def close(self) -> None:
+        self._close_adapters()
+        await self.http.close()
+
+    async def __aenter__(self) -> "AsyncMoeScraperClient":
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.close()
+
+    async def scrape_images(
+        self,
+        *,
+        source: str | list[str],
+        tags: list[str] | str | None = None,
+        n_images: int = 5000,
+        nsfw_mode: Literal["safe", "all", "nsfw"] = "safe",
+        out_dir: str = "out/images",
+        meta_jsonl: str = "out/metadata.jsonl",
+        index_db: str = "out/index.sqlite",
+        state_path: str = "out/scrape_state.json",
+        page_start: int = 1,
+        limit: int = 200,
+        min_width: int | None = None,
+        min_height: int | None = None,
+        min_aspect: float | None = None,
+        max_aspect: float | None = None,
+        max_file_size: int | None = None,
+        include_tags: list[str] | set[str] | None = None,
+        exclude_tags: list[str] | set[str] | None = None,
+        probe: bool = False,
+        probe_concurrency: int = 8,
+        max_concurrency: int = 16,
+        overwrite: bool = False,
+        resume: bool = True,
+        max_empty_pages: int = 10,
+        allowed_exts: list[str] | set[str] | None = None,
+        allow_unknown_ext: bool = False,
+        freeze_apng: bool = True,
+        layout: StorageLayout = "flat",
+        transform: TransformConfig | None = None,
+        phash: bool = False,
+        near_dup_distance: int | None = None,
+        shard_size: int | None = None,
+    ) -> None:
+        from moescraper.core.batch_scrape import ScrapeConfig, scrape_to_count_async
+
+        cfg = ScrapeConfig(
+            source=source if isinstance(source, str) else list(source),
+            tags=_split_tags(tags),
+            target=int(n_images),
+            out_dir=Path(out_dir),
+            meta_jsonl=Path(meta_jsonl),
+            index_db=Path(index_db),
+            state_path=Path(state_path),
+            page_start=int(page_start),
+            limit=int(limit),
+            nsfw_mode=nsfw_mode,
+            min_width=min_width,
+            min_height=min_height,
+            min_aspect=min_aspect,
+            max_aspect=max_aspect,
+            max_file_size=max_file_size,
+            include_tags=set(include_tags) if include_tags else None,
+            exclude_tags=set(exclude_tags) if exclude_tags else None,
+            probe=bool(probe),
+            probe_concurrency=int(probe_concurrency),
+            max_workers=int(max_concurrency),
+            overwrite=bool(overwrite),
+            resume=bool(resume),
+            max_empty_pages=int(max_empty_pages),
+            allowed_exts=set(allowed_exts) if allowed_exts else None,
+            allow_unknown_ext=bool(allow_unknown_ext),
+            freeze_apng=bool(freeze_apng),
+            layout=layout,
+            transform=transform,
+            phash=bool(phash),
+            near_dup_distance=near_dup_distance,
+            shard_size=shard_size,
+        )
+
+        await scrape_to_count_async(self, cfg)
+
+    async def search(
+        self,
+        *,
+        source: str,
+        tags: list[str] | str | None = None,
+        page: int = 1,
+        limit: int = 20,
+        nsfw: bool = False,
+        min_width: int | None = None,
+        min_height: int | None = None,
+        allowed_exts: list[str] | set[str] | None = None,
+        allow_unknown_ext: bool = False,
+        filter_spec: FilterSpec | None = None,
+    ) -> list[Post]:
+        adapter = self._adapter_for(source)
+        posts = await adapter.search_async(_split_tags(tags), page=page, limit=limit, nsfw=nsfw)
+        return _search_filter(
+            filter_spec, nsfw, min_width, min_height, allowed_exts, allow_unknown_ext
+        ).apply(posts)
+
+    async def search_page(
+        self,
+        *,
+        source: str,
+        tags: list[str] | str | None = None,
+        cursor: Cursor = 1,
+        limit: int = 20,
+        nsfw: bool = False,
+        min_width: int | None = None,
+        min_height: int | None = None,
+        allowed_exts: list[str] | set[str] | None = None,
+        allow_unknown_ext: bool = False,
+        filter_spec: FilterSpec | None = None,
+    ) -> tuple[list[Post], Optional[Cursor]]:
+        """Like `search`, but also returns the cursor of the next page (None when exhausted).
+
+        Start from a page number; sources with keyset paging (danbooru, safebooru)
+        hand back an id cursor, so deep pages cost the same as the first one.
+        `filter_spec` replaces the nsfw / size / ext filters (the source still gets `nsfw`).
+        """
+        adapter = self._adapter_for(source)
+        posts, nxt = await adapter.search_page_async(_split_tags(tags), cursor, limit, nsfw)
+        posts = _search_filter(
+            filter_spec, nsfw, min_width, min_height, allowed_exts, allow_unknown_ext
+        ).apply(posts)
+        return posts, nxt
+
+    async def probe(
+        self,
+        posts: list[Post],
+        *,
+        max_concurrency: int = 16,
+        only: Optional[Callable[[Post], bool]] = None,
+    ) -> list[Post]:
+        """asyncio version of `MoeScraperClient.probe`."""
+        from moescraper.core.probe import probe_posts_async
+
+        async with make_async_download_client(
+            user_agent=self.http.cfg.user_agent, http2=self.http.cfg.http2
+        ) as c:
+            return await probe_posts_async(
+                c,
+                posts,
+                limiter=self.download_limiter,
+                only=only or _missing_size,
+                max_concurrency=max_concurrency,
+            )
+
+    async def download(
+        self,
+        posts: list[Post],
+        *,
+        out_dir: str = "out/images",
+        max_concurrency: int = 16,
+        overwrite: bool = False,
+        allowed_exts: list[str] | set[str] | None = None,
+        allow_unknown_ext: bool = False,
+        freeze_apng: bool = True,
+        layout: StorageLayout = "flat",
+        transform: TransformConfig | None = None,
+        shard_size: int | None = None,
+    ) -> list[Path]:
+        return await download_posts_async(
+            posts,
+            out_dir=out_dir,
+            max_concurrency=max_concurrency,
+            overwrite=overwrite,
+            user_agent=self.http.cfg.user_agent,
+            allowed_exts=set(allowed_exts) if allowed_exts else None,
+            allow_unknown_ext=bool(allow_unknown_ext),
+            freeze_apng=bool(freeze_apng),
+            layout=layout,
+            limiter=self.download_limiter,
+            http2=self.http.cfg.http2,
+            http2_max_connections=self.http.cfg.http2_max_connections,
+            http2_max_streams=self.http.cfg.http2_max_streams,
+            retry=self.http.cfg.retry,
+            budget=self.http.retry_budget,
+            transform=transform,
+            shard_size=shard_size,
+        )
+
+    def save_metadata(self, posts: Iterable[Post], out_path: str = "out/metadata.jsonl") -> None:
+        """Format inferred from extension: .jsonl | .csv (+ .gz | .zst) | .parquet (pyarrow)"""
+        if str(out_path).endswith(".parquet"):
+            write_parquet(posts, out_path)
+        else:
+            with MetadataWriter(out_path) as w:
+                w.write_many(posts)
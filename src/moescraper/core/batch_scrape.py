@@ -1,19 +1,37 @@
 from __future__ import annotations
 
+import asyncio
 import json
-import sqlite3
+import queue
+import threading
 import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
 from dataclasses import dataclass
 from pathlib import Path
-from typing import Literal, Optional, TYPE_CHECKING
+from typing import TYPE_CHECKING, Literal, Optional
 
 from tqdm import tqdm
 
-from moescraper.core.models import Post, Rating
-from moescraper.core.downloader import download_posts, default_filename
+from moescraper.adapters.base import Cursor
+from moescraper.core.downloader import (
+    DownloadResult,
+    StorageLayout,
+    download_results_async,
+    make_async_download_client,
+    report_download_errors,
+)
+from moescraper.core.filters import FilterSpec, ratings_for_nsfw_mode
+from moescraper.core.index_db import IndexDB
+from moescraper.core.models import Post
+from moescraper.core.phash import HashIndex
+from moescraper.core.postprocess import PostProcessor
+from moescraper.core.probe import probe_posts, probe_posts_async
+from moescraper.core.shards import ShardWriter, write_result
+from moescraper.core.transform import TransformConfig
 
 if TYPE_CHECKING:
-    from moescraper.client import MoeScraperClient
+    from moescraper.client import AsyncMoeScraperClient, MoeScraperClient
 
 
 NsfwMode = Literal["safe", "all", "nsfw"]
@@ -21,7 +39,8 @@ NsfwMode = Literal["safe", "all", "nsfw"]
 
 @dataclass
 class ScrapeConfig:
-    source: str
+    # One source name, or several to scrape them concurrently toward one target.
+    source: str | list[str]
     tags: list[str]
     target: int
 
@@ -37,8 +56,24 @@ class ScrapeConfig:
     nsfw_mode: NsfwMode = "safe"
     min_width: Optional[int] = None
     min_height: Optional[int] = None
+    # width / height, e.g. (0.5, 2.0)
+    min_aspect: Optional[float] = None
+    max_aspect: Optional[float] = None
+    max_file_size: Optional[int] = None  # bytes
+
+    # Checked locally on every post (no extra search tags needed).
+    include_tags: Optional[set[str]] = None
+    exclude_tags: Optional[set[str]] = None
+
+    # Posts the source didn't give a size for (zerochan) get a ranged GET of
+    # their first KB when a size / aspect / file-size rule is set, so files
+    # outside the limits are never downloaded in full.
+    probe: bool = False
+    probe_concurrency: int = 8
 
     max_workers: int = 4
+    # Search pages fetched ahead of the download stage (bounded queue size).
+    prefetch_pages: int = 2
     overwrite: bool = False
     resume: bool = True
     max_empty_pages: int = 10
@@ -49,256 +84,750 @@ class ScrapeConfig:
 
     # Post-process downloaded files
     freeze_apng: bool = True
-
-
-class IndexDB:
-    def __init__(self, path: Path):
-        self.path = path
-        self.path.parent.mkdir(parents=True, exist_ok=True)
-        self.conn = sqlite3.connect(self.path)
-        self.conn.execute("PRAGMA journal_mode=WAL;")
-        self.conn.execute(
-            """
-            CREATE TABLE IF NOT EXISTS posts(
-                key TEXT PRIMARY KEY,
-                source TEXT,
-                post_id TEXT,
-                md5 TEXT,
-                file_url TEXT,
-                preview_url TEXT,
-                rating TEXT,
-                width INTEGER,
-                height INTEGER,
-                tags TEXT,
-                file_ext TEXT,
-                local_path TEXT,
-                downloaded INTEGER DEFAULT 0,
-                exported INTEGER DEFAULT 0
-            );
-            """
-        )
-        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_downloaded ON posts(downloaded);")
-        self.conn.commit()
-
-    def close(self) -> None:
-        self.conn.close()
-
-    @staticmethod
-    def key_of(p: Post) -> str:
-        return p.md5 if p.md5 else f"{p.source}:{p.post_id}"
-
-    def count_downloaded(self) -> int:
-        cur = self.conn.execute("SELECT COUNT(*) FROM posts WHERE downloaded=1;")
-        return int(cur.fetchone()[0])
-
-    def insert_posts(self, posts: list[Post]) -> None:
-        rows = []
-        for p in posts:
-            rows.append(
-                (
-                    self.key_of(p),
-                    p.source,
-                    p.post_id,
-                    p.md5,
-                    p.file_url,
-                    p.preview_url,
-                    p.rating.value,
-                    p.width,
-                    p.height,
-                    " ".join(p.tags or []),
-                    p.file_ext,
-                )
-            )
-        self.conn.executemany(
-            """
-            INSERT OR IGNORE INTO posts
-            (key, source, post_id, md5, file_url, preview_url, rating, width, height, tags, file_ext)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            """,
-            rows,
-        )
-        self.conn.commit()
-
-    def mark_downloaded(self, posts: list[Post], out_dir: Path) -> None:
-        updates = []
-        for p in posts:
-            dst = out_dir / default_filename(p)
-            if dst.exists():
-                updates.append((str(dst), self.key_of(p)))
-        if updates:
-            self.conn.executemany(
-                "UPDATE posts SET downloaded=1, local_path=? WHERE key=?",
-                updates,
-            )
-            self.conn.commit()
-
-    def export_new_downloaded_to_jsonl(self, jsonl_path: Path) -> int:
-        jsonl_path.parent.mkdir(parents=True, exist_ok=True)
-
-        cur = self.conn.execute(
-            """
-            SELECT key, source, post_id, file_url, preview_url, rating, width, height, md5, file_ext, tags, local_path
-            FROM posts
-            WHERE downloaded=1 AND exported=0
-            """
-        )
-        rows = cur.fetchall()
-        if not rows:
-            return 0
-
-        with jsonl_path.open("a", encoding="utf-8") as f:
-            for (
-                key,
-                source,
-                post_id,
-                file_url,
-                preview_url,
-                rating,
-                width,
-                height,
-                md5,
-                file_ext,
-                tags,
-                local_path,
-            ) in rows:
-                payload = {
-                    "source": source,
-                    "post_id": post_id,
-                    "file_url": file_url,
-                    "preview_url": preview_url,
-                    "rating": rating,
-                    "width": width,
-                    "height": height,
-                    "md5": md5,
-                    "file_ext": file_ext,
-                    "tags": tags.split() if tags else [],
-                    "local_path": local_path,
+    # Resize / re-encode / thumbnail each file on the process pool as it lands;
+    # outputs are recorded in the index (`outputs` table) and the JSONL export.
+    transform: Optional[TransformConfig] = None
+
+    # Perceptual hash of every download, stored in the index. With
+    # near_dup_distance=k, images within k bits (of 64) of one already kept are
+    # deleted and not counted (re-uploads, resized / recompressed copies).
+    phash: bool = False
+    near_dup_distance: Optional[int] = None
+
+    # Bytes per tar shard: images (+ .json metadata, .txt tags) are streamed into
+    # out_dir/shard-000000.tar, ... instead of loose files (staged in out_dir/.staging).
+    shard_size: Optional[int] = None
+
+    # "flat": out_dir/{source}_{post_id}_{md5[:8]}.{ext}
+    # "cas":  out_dir/ab/cd/{md5}.{ext}, md5-verified, deduped across sources
+    layout: StorageLayout = "flat"
+
+
+def _filter_spec(cfg: ScrapeConfig) -> FilterSpec:
+    """All post rules of a scrape, compiled once and applied in one pass per page."""
+    return FilterSpec(
+        ratings=ratings_for_nsfw_mode(cfg.nsfw_mode),
+        min_width=cfg.min_width,
+        min_height=cfg.min_height,
+        min_aspect=cfg.min_aspect,
+        max_aspect=cfg.max_aspect,
+        max_file_size=cfg.max_file_size,
+        include_tags=cfg.include_tags or frozenset(),
+        exclude_tags=cfg.exclude_tags or frozenset(),
+        allowed_exts=cfg.allowed_exts,
+        allow_unknown_ext=cfg.allow_unknown_ext,
+    )
+
+
+def _remove_files(res: DownloadResult) -> None:
+    paths = [res.path] + [o.path for o in (res.outputs or {}).values()]
+    for path in dict.fromkeys(paths):
+        if path is not None:
+            Path(path).unlink(missing_ok=True)
+
+
+class _NearDupFilter:
+    """Drops downloads whose perceptual hash is within `max_distance` of one kept
+    earlier (this run or a previous one, loaded from the index)."""
+
+    def __init__(self, db: IndexDB, max_distance: int):
+        self.db = db
+        self.index: HashIndex = db.phash_index(max_distance)
+        self.dropped = 0
+
+    def keep(self, results: list[DownloadResult]) -> list[DownloadResult]:
+        """The results to keep; the others' files are removed and recorded as duplicates."""
+        hashed = [r for r in results if r.path and r.phash is not None]
+        if not hashed:
+            return results
+        ids = self.db.ids_of([r.post for r in hashed])
+        dups: list[tuple[Post, int, int]] = []
+        dropped: set[int] = set()
+        for r in hashed:
+            pid = ids.get(self.db.key_of(r.post))
+            if pid is None:
+                continue
+            hit = self.index.nearest(r.phash)
+            if hit is not None and hit[1] != pid:
+                dups.append((r.post, r.phash, hit[1]))
+                dropped.add(id(r))
+                _remove_files(r)
+            elif hit is None:
+                self.index.add(r.phash, pid)
+        self.db.mark_near_duplicates(dups)
+        self.dropped += len(dups)
+        return [r for r in results if id(r) not in dropped]
+
+
+def _shard_writer(cfg: ScrapeConfig) -> tuple[Optional[ShardWriter], Path]:
+    """(shard writer or None, directory the downloads go to)."""
+    if cfg.shard_size is None:
+        return None, cfg.out_dir
+    shards = ShardWriter(cfg.out_dir, max_bytes=cfg.shard_size)
+    return shards, shards.staging_dir
+
+
+def _source_list(cfg: ScrapeConfig) -> list[str]:
+    """`cfg.source` as a list (one name, or several for a multi-source scrape)."""
+    if isinstance(cfg.source, str):
+        return [cfg.source]
+    return list(dict.fromkeys(cfg.source))
+
+
+def _state_matches(cfg: ScrapeConfig, st: dict) -> bool:
+    sources = _source_list(cfg)
+    if len(sources) == 1:
+        same_source = st.get("source") == sources[0]
+    else:
+        same_source = st.get("sources") == sorted(sources)
+    return (
+        same_source
+        and st.get("tags") == cfg.tags
+        and st.get("nsfw_mode") == cfg.nsfw_mode
+        and st.get("allowed_exts") == (sorted(cfg.allowed_exts) if cfg.allowed_exts else None)
+        and st.get("allow_unknown_ext") == cfg.allow_unknown_ext
+    )
+
+
+def _load_start_cursors(cfg: ScrapeConfig) -> dict[str, Cursor]:
+    """Resume position per source: a page number, or the keyset cursor (last seen id)."""
+    sources = _source_list(cfg)
+    cursors: dict[str, Cursor] = {s: cfg.page_start for s in sources}
+    if cfg.resume and cfg.state_path.exists():
+        try:
+            st = json.loads(cfg.state_path.read_text(encoding="utf-8"))
+            if _state_matches(cfg, st):
+                if len(sources) == 1:
+                    saved = {sources[0]: st["cursor"]} if "cursor" in st else {}
+                    pages = {sources[0]: st["page"]} if "page" in st else {}
+                else:
+                    saved = st.get("cursors") or {}
+                    pages = st.get("pages") or {}
+                for s in sources:
+                    if s in saved:
+                        cursors[s] = str(saved[s])
+                    elif s in pages:
+                        cursors[s] = int(pages[s])
+        except Exception:
+            pass
+    return cursors
+
+
+def _save_state(cfg: ScrapeConfig, next_cursors: dict[str, Cursor]) -> None:
+    sources = _source_list(cfg)
+    st: dict = {}
+    if len(sources) == 1:
+        st["source"] = sources[0]
+    else:
+        st["sources"] = sorted(sources)
+    st.update(
+        {
+            "tags": cfg.tags,
+            "nsfw_mode": cfg.nsfw_mode,
+            "allowed_exts": (sorted(cfg.allowed_exts) if cfg.allowed_exts else None),
+            "allow_unknown_ext": cfg.allow_unknown_ext,
+        }
+    )
+    # Keyset sources store their cursor (last seen id), the others a page number.
+    if len(sources) == 1:
+        c = next_cursors[sources[0]]
+        st["cursor" if isinstance(c, str) else "page"] = c
+    else:
+        pages = {s: c for s, c in next_cursors.items() if isinstance(c, int)}
+        cursors = {s: c for s, c in next_cursors.items() if isinstance(c, str)}
+        if pages:
+            st["pages"] = pages
+        if cursors:
+            st["cursors"] = cursors
+    st["updated_at"] = int(time.time())
+
+    cfg.state_path.parent.mkdir(parents=True, exist_ok=True)
+    cfg.state_path.write_text(
+        json.dumps(st, ensure_ascii=False, indent=2),
+        encoding="utf-8",
+    )
+
+
+class _PageTracker:
+    """Tracks in-flight posts per page so the resume pointer only moves past
+    pages whose posts have all been downloaded (pages finish out of order).
+
+    Pages are numbered in fetch order; each one remembers the cursor that
+    follows it, which becomes the resume point once it and every earlier
+    page are done.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._order: deque[int] = deque()
+        self._pending: dict[int, int] = {}
+        self._after: dict[int, Cursor] = {}
+        self._sealed: set[int] = set()
+
+    def open(self, seq: int, after: Cursor) -> None:
+        with self._lock:
+            self._order.append(seq)
+            self._pending[seq] = 0
+            self._after[seq] = after
+
+    def add(self, seq: int) -> None:
+        with self._lock:
+            self._pending[seq] += 1
+
+    def seal(self, seq: int) -> None:
+        with self._lock:
+            self._sealed.add(seq)
+
+    def done(self, seq: int) -> None:
+        with self._lock:
+            self._pending[seq] -= 1
+
+    def advance(self) -> Optional[Cursor]:
+        """Pop fully finished leading pages; return the cursor to resume from."""
+        nxt = None
+        with self._lock:
+            while self._order:
+                seq = self._order[0]
+                if seq not in self._sealed or self._pending[seq] > 0:
+                    break
+                self._order.popleft()
+                self._sealed.discard(seq)
+                del self._pending[seq]
+                nxt = self._after.pop(seq)
+        return nxt
+
+
+class _SourceBalancer:
+    """Shares the page prefetch budget between sources in a multi-source scrape.
+
+    - each source holds at most its share of `slots` pages that are being
+      fetched or waiting for the dispatcher
+    - shares follow an EWMA of new posts per second of search time (posts left
+      after dedupe against the index and the other sources), so a source that
+      mostly returns duplicates or answers slowly gets fewer pages in flight
+    - every active source keeps at least one slot and keeps being probed
+    """
+
+    def __init__(self, sources: list[str], slots: int, alpha: float = 0.3):
+        self.slots = max(int(slots), len(sources))
+        self.alpha = alpha
+        self._rate: dict[str, Optional[float]] = {s: None for s in sources}
+        self._held: dict[str, int] = {s: 0 for s in sources}
+        self._new: dict[str, int] = {s: 0 for s in sources}
+        self._active: set[str] = set(sources)
+        self._cond = threading.Condition()
+
+    def _share(self, source: str) -> int:
+        # Caller holds self._cond.
+        if len(self._active) <= 1:
+            return self.slots
+        sampled = [r for s, r in self._rate.items() if s in self._active and r is not None]
+        guess = (sum(sampled) / len(sampled)) if sampled else 1.0
+        rates = {s: (self._rate[s] if self._rate[s] is not None else guess) for s in self._active}
+        total = sum(rates.values())
+        if total <= 0:
+            return max(1, self.slots // len(self._active))
+        return max(1, int(self.slots * rates[source] / total))
+
+    def acquire(self, source: str, stop: threading.Event) -> bool:
+        """Block until `source` may fetch another page; False once `stop` is set."""
+        with self._cond:
+            while not stop.is_set() and self._held[source] >= self._share(source):
+                self._cond.wait(0.2)
+            if stop.is_set():
+                return False
+            self._held[source] += 1
+            return True
+
+    def release(self, source: str, n_new: int, elapsed_s: float) -> None:
+        """A fetched page reached the dispatcher and yielded `n_new` new posts."""
+        with self._cond:
+            self._held[source] -= 1
+            self._new[source] += n_new
+            rate = n_new / max(elapsed_s, 1e-3)
+            prev = self._rate[source]
+            self._rate[source] = rate if prev is None else prev + self.alpha * (rate - prev)
+            self._cond.notify_all()
+
+    def retire(self, source: str) -> None:
+        """`source` ran out of pages; its share goes to the others."""
+        with self._cond:
+            self._active.discard(source)
+            self._cond.notify_all()
+
+    def stats(self) -> dict[str, dict[str, float]]:
+        with self._cond:
+            return {
+                s: {
+                    "new": self._new[s],
+                    "rate": round(self._rate[s] or 0.0, 2),
+                    "share": self._share(s) if s in self._active else 0,
                 }
-                f.write(json.dumps(payload, ensure_ascii=False) + "\n")
-
-        self.conn.executemany("UPDATE posts SET exported=1 WHERE key=?", [(r[0],) for r in rows])
-        self.conn.commit()
-        return len(rows)
+                for s in self._rate
+            }
 
 
-def _apply_nsfw_mode(posts: list[Post], mode: NsfwMode) -> list[Post]:
-    if mode == "all":
-        return posts
-    if mode == "nsfw":
-        return [p for p in posts if p.rating == Rating.NSFW]
-    return [p for p in posts if p.rating == Rating.SAFE]
+_END = object()
 
 
-def _apply_min_size(posts: list[Post], min_w: Optional[int], min_h: Optional[int]) -> list[Post]:
-    if min_w is None and min_h is None:
-        return posts
-    out: list[Post] = []
-    for p in posts:
-        if p.width is None or p.height is None:
-            out.append(p)
+def _put(q: queue.Queue, item: object, stop: threading.Event) -> bool:
+    """Blocking put that gives up once `stop` is set."""
+    while not stop.is_set():
+        try:
+            q.put(item, timeout=0.2)
+            return True
+        except queue.Full:
             continue
-        if min_w is not None and p.width < min_w:
-            continue
-        if min_h is not None and p.height < min_h:
-            continue
-        out.append(p)
-    return out
+    return False
 
 
 def scrape_to_count(client: "MoeScraperClient", cfg: ScrapeConfig) -> None:
+    """Scrape until `cfg.target` images are downloaded.
+
+    Runs as a staged pipeline connected by bounded queues:
+    - search threads (one per source): fetch/filter pages ahead of the
+      downloads (`prefetch_pages` per source)
+    - dispatcher (this thread): indexes posts and submits them to the client's
+      DownloadEngine while `downloaded + in_flight < target`
+    - download workers (`max_workers` engine threads): one post at a time
+    - index thread: marks downloads, appends JSONL, saves the resume state
+
+    With several sources (`cfg.source` is a list) all of them are searched
+    concurrently toward the one combined target. Posts are deduped by md5
+    across sources through the shared IndexDB (and against what is still
+    downloading), and `_SourceBalancer` steers the prefetch budget toward the
+    sources yielding new posts fastest.
+    """
     cfg.out_dir.mkdir(parents=True, exist_ok=True)
     cfg.meta_jsonl.parent.mkdir(parents=True, exist_ok=True)
+    spec = _filter_spec(cfg)
+
+    sources = _source_list(cfg)
+    for source in sources:
+        client._adapter_for(source)
 
     db = IndexDB(cfg.index_db)
     try:
-        page = cfg.page_start
-        if cfg.resume and cfg.state_path.exists():
-            try:
-                st = json.loads(cfg.state_path.read_text(encoding="utf-8"))
-                if (
-                    st.get("source") == cfg.source
-                    and st.get("tags") == cfg.tags
-                    and st.get("nsfw_mode") == cfg.nsfw_mode
-                    and st.get("allowed_exts") == (sorted(cfg.allowed_exts) if cfg.allowed_exts else None)
-                    and st.get("allow_unknown_ext") == cfg.allow_unknown_ext
-                ):
-                    page = int(st.get("page", page))
-            except Exception:
-                pass
+        start_cursors = _load_start_cursors(cfg)
+        next_cursors = dict(start_cursors)
 
         downloaded = db.count_downloaded()
         pbar = tqdm(total=cfg.target, initial=min(downloaded, cfg.target), desc="Images", unit="img")
+        if downloaded >= cfg.target:
+            pbar.close()
+            return
+
+        n_workers = max(1, int(cfg.max_workers))
+        stop = threading.Event()
+        cond = threading.Condition()
+        counts = {"downloaded": downloaded, "in_flight": 0}
+        trackers = {s: _PageTracker() for s in sources}
+        # Keys submitted but not indexed yet (guarded by db.lock), so the same
+        # md5 arriving from another source is not downloaded twice.
+        claimed: set[str] = set()
+        errors: list[str] = []
+        failures: list[BaseException] = []
+
+        n_prefetch = max(1, int(cfg.prefetch_pages))
+        balancer = _SourceBalancer(sources, n_prefetch * len(sources))
+        pages_q: queue.Queue = queue.Queue(maxsize=balancer.slots)
+        done_q: queue.Queue = queue.Queue()
+        engine = client.download_engine(n_workers)
+        # Keep the engine queue short so prefetching stays bounded.
+        max_in_flight = n_workers * 2
+        probe_pool = (
+            ThreadPoolExecutor(
+                max(1, int(cfg.probe_concurrency)), thread_name_prefix="moescraper-probe"
+            )
+            if cfg.probe
+            else None
+        )
+        want_phash = cfg.phash or cfg.near_dup_distance is not None
+        near_dups = (
+            _NearDupFilter(db, cfg.near_dup_distance) if cfg.near_dup_distance is not None else None
+        )
+        shards, dl_dir = _shard_writer(cfg)
 
-        empty_pages = 0
-        while downloaded < cfg.target:
+        def _search_stage(source: str) -> None:
+            cursor: Optional[Cursor] = start_cursors[source]
+            seq = 0
+            empty_pages = 0
             search_nsfw = cfg.nsfw_mode in ("all", "nsfw")
-
-            batch = client.search(
-                source=cfg.source,
-                tags=cfg.tags,
-                page=page,
-                limit=cfg.limit,
-                nsfw=search_nsfw,
-                allowed_exts=cfg.allowed_exts,
-                allow_unknown_ext=cfg.allow_unknown_ext,
+            try:
+                while cursor is not None and balancer.acquire(source, stop):
+                    t0 = time.monotonic()
+                    batch, nxt = client.search_page(
+                        source=source,
+                        tags=cfg.tags,
+                        cursor=cursor,
+                        limit=cfg.limit,
+                        nsfw=search_nsfw,
+                        filter_spec=spec,
+                    )
+                    if probe_pool is not None:
+                        batch = spec.apply(
+                            probe_posts(
+                                engine.client,
+                                batch,
+                                limiter=engine.limiter,
+                                only=spec.undecided,
+                                executor=probe_pool,
+                            )
+                        )
+
+                    seq += 1
+                    # End of keyset results: a later run resumes at the same cursor.
+                    after = nxt if nxt is not None else cursor
+                    item = (source, seq, cursor, after, batch, time.monotonic() - t0)
+                    if not _put(pages_q, item, stop):
+                        return
+                    if batch:
+                        empty_pages = 0
+                    else:
+                        empty_pages += 1
+                        if empty_pages >= cfg.max_empty_pages:
+                            break
+                    cursor = nxt
+            except BaseException as e:
+                failures.append(e)
+                stop.set()
+            finally:
+                balancer.retire(source)
+            _put(pages_q, _END, stop)
+
+        def _on_done(source: str, seq: int, fut: "Future[DownloadResult]") -> None:
+            try:
+                res = fut.result()
+            except BaseException as e:
+                failures.append(e)
+                stop.set()
+                done_q.put((source, seq, None))
+                return
+            done_q.put((source, seq, res))
+
+        def _index_stage() -> None:
+            finished = False
+            while not finished:
+                results = [done_q.get()]
+                while len(results) < 256:
+                    try:
+                        results.append(done_q.get_nowait())
+                    except queue.Empty:
+                        break
+                if results[-1] is _END:
+                    results.pop()
+                    finished = True
+
+                n_downloaded = counts["downloaded"]
+                try:
+                    kept = [res for _, _, res in results if res is not None]
+                    if near_dups is not None:
+                        kept = near_dups.keep(kept)
+                    if shards is not None:
+                        kept = [write_result(shards, res) for res in kept]
+                    with db.lock:
+                        db.mark_downloaded_paths([(res.post, res.path) for res in kept if res.path])
+                        db.record_outputs([(res.post, res.outputs) for res in kept if res.outputs])
+                        db.set_phashes(
+                            [
+                                (res.post, res.phash)
+                                for res in kept
+                                if res.path and res.phash is not None
+                            ]
+                        )
+                        for _, _, res in results:
+                            if res is not None:
+                                claimed.discard(db.key_of(res.post))
+                    db.export_new_downloaded_to_jsonl(cfg.meta_jsonl)
+                    n_downloaded = db.count_downloaded()
+
+                    moved = False
+                    for source, seq, res in results:
+                        trackers[source].done(seq)
+                        if res is not None and res.error:
+                            errors.append(res.error)
+                    for source, tracker in trackers.items():
+                        nxt = tracker.advance()
+                        if nxt is not None:
+                            next_cursors[source] = nxt
+                            moved = True
+                    if moved:
+                        _save_state(cfg, next_cursors)
+                except BaseException as e:
+                    failures.append(e)
+                    stop.set()
+
+                with cond:
+                    counts["downloaded"] = n_downloaded
+                    counts["in_flight"] -= len(results)
+                    if n_downloaded >= cfg.target:
+                        stop.set()
+                    cond.notify_all()
+
+                pbar.update(max(0, min(n_downloaded, cfg.target) - pbar.n))
+
+        search_threads = [
+            threading.Thread(
+                target=_search_stage, args=(s,), name=f"moescraper-search-{s}", daemon=True
             )
+            for s in sources
+        ]
+        index_thread = threading.Thread(target=_index_stage, name="moescraper-index", daemon=True)
+        for t in search_threads:
+            t.start()
+        index_thread.start()
+
+        try:
+            n_running = len(search_threads)
+            while not stop.is_set() and n_running:
+                try:
+                    item = pages_q.get(timeout=0.2)
+                except queue.Empty:
+                    continue
+                if item is _END:
+                    n_running -= 1
+                    continue
+
+                source, seq, cursor, after, batch, elapsed_s = item
+                tracker = trackers[source]
+                tracker.open(seq, after)
+                if batch:
+                    db.insert_posts(batch)
+                    with db.lock:
+                        if not cfg.overwrite:
+                            batch = db.filter_new(batch)
+                        fresh: list[Post] = []
+                        for post in batch:
+                            key = db.key_of(post)
+                            if key not in claimed:
+                                claimed.add(key)
+                                fresh.append(post)
+                        batch = fresh
+                balancer.release(source, len(batch), elapsed_s)
+
+                for i, post in enumerate(batch):
+                    with cond:
+                        while not stop.is_set() and (
+                            counts["downloaded"] + counts["in_flight"] >= cfg.target
+                            or counts["in_flight"] >= max_in_flight
+                        ):
+                            cond.wait(0.2)
+                        if stop.is_set():
+                            break
+                        counts["in_flight"] += 1
+                    tracker.add(seq)
+                    fut = engine.submit(
+                        post,
+                        dl_dir,
+                        overwrite=cfg.overwrite,
+                        allowed_exts=cfg.allowed_exts,
+                        allow_unknown_ext=cfg.allow_unknown_ext,
+                        freeze_apng=cfg.freeze_apng,
+                        layout=cfg.layout,
+                        transform=cfg.transform,
+                        phash=want_phash,
+                    )
+                    fut.add_done_callback(lambda f, s=source, seq=seq: _on_done(s, seq, f))
+                else:
+                    tracker.seal(seq)
+                    i = len(batch)
+                if i < len(batch):
+                    # Stopped mid-page: release the claims that were never submitted.
+                    with db.lock:
+                        claimed.difference_update(db.key_of(p) for p in batch[i:])
+
+                with cond:
+                    if len(sources) > 1:
+                        pbar.set_postfix(
+                            source=source, page=cursor, downloaded=counts["downloaded"]
+                        )
+                    else:
+                        pbar.set_postfix(page=cursor, downloaded=counts["downloaded"])
+        finally:
+            stop.set()
+            with cond:
+                cond.wait_for(lambda: counts["in_flight"] == 0)
+            done_q.put(_END)
+            index_thread.join()
+            for t in search_threads:
+                t.join()
+            if probe_pool is not None:
+                probe_pool.shutdown()
+            if shards is not None:
+                shards.close()
+            pbar.close()
+
+        report_download_errors(errors)
+        if failures:
+            raise failures[0]
+    finally:
+        db.close()
 
-            batch = _apply_nsfw_mode(batch, cfg.nsfw_mode)
-            batch = _apply_min_size(batch, cfg.min_width, cfg.min_height)
 
-            if not batch:
-                empty_pages += 1
-                pbar.set_postfix(page=page, downloaded=downloaded, empty=empty_pages)
-                if empty_pages >= cfg.max_empty_pages:
-                    break
-                page += 1
-                continue
+async def scrape_to_count_async(client: "AsyncMoeScraperClient", cfg: ScrapeConfig) -> None:
+    """asyncio version of `scrape_to_count` (same state file, index and export).
 
-            empty_pages = 0
+    With several sources each one runs its own search/download loop on the
+    event loop; they share the target, so faster sources simply take more of it.
+    """
+    cfg.out_dir.mkdir(parents=True, exist_ok=True)
+    cfg.meta_jsonl.parent.mkdir(parents=True, exist_ok=True)
+    spec = _filter_spec(cfg)
 
-            db.insert_posts(batch)
+    sources = _source_list(cfg)
+    for source in sources:
+        client._adapter_for(source)
 
-            remaining = cfg.target - downloaded
-            batch = batch[:remaining]
-
-            downloaded_paths = download_posts(
-                batch,
-                cfg.out_dir,
-                max_workers=cfg.max_workers,
-                overwrite=cfg.overwrite,
-                user_agent=client.http.cfg.user_agent,
-                allowed_exts=cfg.allowed_exts,
-                allow_unknown_ext=cfg.allow_unknown_ext,
-                freeze_apng=cfg.freeze_apng,
-            )
+    db = IndexDB(cfg.index_db)
+    try:
+        next_cursors = _load_start_cursors(cfg)
 
-            db.mark_downloaded(batch, cfg.out_dir)
-            db.export_new_downloaded_to_jsonl(cfg.meta_jsonl)
-
-            downloaded = db.count_downloaded()
-            pbar.update(min(len(downloaded_paths), cfg.target - pbar.n))
-            pbar.set_postfix(page=page, downloaded=downloaded)
-
-            cfg.state_path.parent.mkdir(parents=True, exist_ok=True)
-            cfg.state_path.write_text(
-                json.dumps(
-                    {
-                        "source": cfg.source,
-                        "tags": cfg.tags,
-                        "nsfw_mode": cfg.nsfw_mode,
-                        "allowed_exts": (sorted(cfg.allowed_exts) if cfg.allowed_exts else None),
-                        "allow_unknown_ext": cfg.allow_unknown_ext,
-                        "page": page + 1,
-                        "updated_at": int(time.time()),
-                    },
-                    ensure_ascii=False,
-                    indent=2,
-                ),
-                encoding="utf-8",
-            )
+        downloaded = db.count_downloaded()
+        state = {"downloaded": downloaded, "reserved": 0}
+        claimed: set[str] = set()
 
-            page += 1
+        # SQLite and shard writes block, so they run in worker threads
+        # (IndexDB serializes them on db.lock) and keep the event loop free.
+        def _new_posts(batch: list[Post]) -> list[Post]:
+            db.insert_posts(batch)
+            return batch if cfg.overwrite else db.filter_new(batch)
+
+        def _index_results(results: list[DownloadResult]) -> tuple[int, int]:
+            # One source at a time: the near-dup index and shards aren't thread-safe.
+            with db.lock:
+                if near_dups is not None:
+                    results = near_dups.keep(results)
+                if shards is not None:
+                    results = [write_result(shards, r) for r in results]
+                downloaded_paths = [(r.post, r.path) for r in results if r.path]
+                db.mark_downloaded_paths(downloaded_paths)
+                db.record_outputs([(r.post, r.outputs) for r in results if r.outputs])
+                db.set_phashes(
+                    [(r.post, r.phash) for r in results if r.path and r.phash is not None]
+                )
+                db.export_new_downloaded_to_jsonl(cfg.meta_jsonl)
+                return len(downloaded_paths), db.count_downloaded()
 
-        pbar.close()
+        async def _run_source(source: str) -> None:
+            cursor: Optional[Cursor] = next_cursors[source]
+            empty_pages = 0
+            search_nsfw = cfg.nsfw_mode in ("all", "nsfw")
+            # Keys already tried from a page that was cut short (target almost
+            # reached): that page is fetched again, and only advanced past once
+            # every post on it has been submitted.
+            tried: set[str] = set()
+            while cursor is not None and state["downloaded"] + state["reserved"] < cfg.target:
+                batch, nxt = await client.search_page(
+                    source=source,
+                    tags=cfg.tags,
+                    cursor=cursor,
+                    limit=cfg.limit,
+                    nsfw=search_nsfw,
+                    filter_spec=spec,
+                )
+                if probe_client is not None:
+                    batch = spec.apply(
+                        await probe_posts_async(
+                            probe_client,
+                            batch,
+                            limiter=client.download_limiter,
+                            only=spec.undecided,
+                            max_concurrency=cfg.probe_concurrency,
+                        )
+                    )
+
+                if not batch:
+                    empty_pages += 1
+                    pbar.set_postfix(page=cursor, downloaded=state["downloaded"], empty=empty_pages)
+                    if empty_pages >= cfg.max_empty_pages:
+                        break
+                    cursor = nxt
+                    continue
+
+                empty_pages = 0
+
+                batch = await asyncio.to_thread(_new_posts, batch)
+                batch = [
+                    p for p in batch if (k := db.key_of(p)) not in claimed and k not in tried
+                ]
+
+                remaining = cfg.target - state["downloaded"] - state["reserved"]
+                cut = len(batch) > remaining
+                batch = batch[: max(remaining, 0)]
+                keys = [db.key_of(p) for p in batch]
+                claimed.update(keys)
+                state["reserved"] += len(batch)
+
+                try:
+                    results = await download_results_async(
+                        batch,
+                        dl_dir,
+                        max_concurrency=cfg.max_workers,
+                        overwrite=cfg.overwrite,
+                        allowed_exts=cfg.allowed_exts,
+                        allow_unknown_ext=cfg.allow_unknown_ext,
+                        freeze_apng=cfg.freeze_apng,
+                        limiter=client.download_limiter,
+                        retry=client.http.cfg.retry,
+                        budget=client.http.retry_budget,
+                        layout=cfg.layout,
+                        postproc=postproc,
+                        transform=cfg.transform,
+                        phash=want_phash,
+                        client=dl_client,
+                    )
+
+                    report_download_errors([r.error for r in results if r.error])
+                    n_new, state["downloaded"] = await asyncio.to_thread(_index_results, results)
+                finally:
+                    state["reserved"] -= len(batch)
+                    claimed.difference_update(keys)
+
+                pbar.update(min(n_new, cfg.target - pbar.n))
+                if len(sources) > 1:
+                    pbar.set_postfix(source=source, page=cursor, downloaded=state["downloaded"])
+                else:
+                    pbar.set_postfix(page=cursor, downloaded=state["downloaded"])
+
+                if cut:
+                    tried.update(keys)
+                    continue
+                tried.clear()
+                if nxt is not None:
+                    next_cursors[source] = nxt
+                    _save_state(cfg, next_cursors)
+                cursor = nxt
+
+        # One download client for every page and source, so connections (and
+        # HTTP/2 sessions) are reused; the probe shares it too.
+        dl_client = make_async_download_client(
+            user_agent=client.http.cfg.user_agent,
+            http2=client.http.cfg.http2,
+            http2_max_connections=client.http.cfg.http2_max_connections,
+            http2_max_streams=client.http.cfg.http2_max_streams,
+        )
+        probe_client = dl_client if cfg.probe else None
+        postproc = PostProcessor()
+        want_phash = cfg.phash or cfg.near_dup_distance is not None
+        near_dups = (
+            _NearDupFilter(db, cfg.near_dup_distance) if cfg.near_dup_distance is not None else None
+        )
+        shards, dl_dir = _shard_writer(cfg)
+        pbar = tqdm(
+            total=cfg.target, initial=min(downloaded, cfg.target), desc="Images", unit="img"
+        )
+        tasks = [asyncio.create_task(_run_source(s)) for s in sources]
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            # A failed source stops the others before the db and shards close.
+            for t in tasks:
+                t.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            await dl_client.aclose()
+            await asyncio.to_thread(postproc.close)
+            if shards is not None:
+                shards.close()
+            pbar.close()
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
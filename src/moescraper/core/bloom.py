@@ -0,0 +1,52 @@
+from __future__ import annotations
+
+import hashlib
+import math
+from typing import Iterable
+
+
+class BloomFilter:
+    """Compact set-membership filter for string keys.
+
+    No false negatives; false positives at roughly `error_rate` while at most
+    `capacity` keys have been added. About 1.2 bytes per key at 1%.
+    """
+
+    def __init__(self, capacity: int, error_rate: float = 0.01):
+        self.capacity = max(int(capacity), 1)
+        self.error_rate = error_rate
+        n_bits = -self.capacity * math.log(error_rate) / (math.log(2) ** 2)
+        self.n_bits = max(int(math.ceil(n_bits)), 8)
+        self.n_hashes = max(int(round(self.n_bits / self.capacity * math.log(2))), 1)
+        self._bits = bytearray((self.n_bits + 7) // 8)
+        self._count = 0
+
+    def _positions(self, key: str) -> Iterable[int]:
+        # Double hashing (Kirsch-Mitzenmacher) from one 128-bit digest.
+        d = hashlib.blake2b(key.encode("utf-8"), digest_size=16).digest()
+        h1 = int.from_bytes(d[:8], "little")
+        h2 = int.from_bytes(d[8:], "little") | 1
+        n = self.n_bits
+        return ((h1 + i * h2) % n for i in range(self.n_hashes))
+
+    def add(self, key: str) -> None:
+        bits = self._bits
+        for pos in self._positions(key):
+            bits[pos >> 3] |= 1 << (pos & 7)
+        self._count += 1
+
+    def update(self, keys: Iterable[str]) -> None:
+        for k in keys:
+            self.add(k)
+
+    def __contains__(self, key: str) -> bool:
+        bits = self._bits
+        return all(bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(key))
+
+    def __len__(self) -> int:
+        """Number of `add` calls (duplicates included)."""
+        return self._count
+
+    @property
+    def full(self) -> bool:
+        return self._count >= self.capacity
@@ -1,86 +1,797 @@
 from __future__ import annotations
 
+import asyncio
+import hashlib
+import json
 import os
-from concurrent.futures import ThreadPoolExecutor, as_completed
+import queue
+import re
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, wait
+from contextlib import nullcontext
+from dataclasses import dataclass
+from functools import partial
 from pathlib import Path
-from typing import Optional
+from typing import Literal, Optional
 from urllib.parse import urlparse
 
 import httpx
 
+from .filters import ext_allowed, normalize_exts, post_ext
 from .models import Post
-from .rate_limit import RateLimiter
-from .utils import guess_ext_from_url, domain_of
+from .postprocess import _PIL_OK, ApngSniffer, PostProcessor, freeze_apng_inplace
+from .rate_limit import TokenBucketLimiter
+from .retry import RetryBudget, RetryConfig, _RetryPolicy
+from .transform import Processed, TransformConfig, TransformOutput, process_file
+from .transport import SyncClient, make_async_client, make_sync_client
+from .utils import domain_of
 
-try:
-    from PIL import Image
 
-    _PIL_OK = True
-except Exception:  # pragma: no cover
-    Image = None  # type: ignore
-    _PIL_OK = False
+def _safe_filename(name: str) -> str:
+    return "".join(c if c.isalnum() or c in ("-", "_", ".", "@") else "_" for c in name)
+
+
+def default_filename(post: Post) -> str:
+    ext = post_ext(post) or "jpg"
+    md5p = (post.md5[:8] if post.md5 else "nomd5")
+    return _safe_filename(f"{post.source}_{post.post_id}_{md5p}.{ext}")
+
 
+StorageLayout = Literal["flat", "cas"]
 
-def _normalize_ext(ext: str | None) -> str | None:
-    if not ext:
+_MD5_RE = re.compile(r"^[0-9a-f]{32}$")
+
+
+class ChecksumError(ValueError):
+    """Downloaded bytes don't match the md5 reported by the API."""
+
+
+def _valid_md5(md5: str | None) -> str | None:
+    if not md5:
         return None
-    e = ext.lower().strip()
-    if e.startswith("."):
-        e = e[1:]
-    if e == "jpeg":
-        e = "jpg"
-    return e or None
+    m = md5.strip().lower()
+    return m if _MD5_RE.match(m) else None
+
+
+def cas_relpath(md5: str, ext: str) -> str:
+    """Content-addressed path with two levels of fan-out: ab/cd/abcd....ext"""
+    return f"{md5[:2]}/{md5[2:4]}/{md5}.{ext}"
+
+
+def target_path(post: Post, out_dir: Path, layout: StorageLayout = "flat") -> Optional[Path]:
+    """Where `post` is stored. None for the cas layout when the md5 is not known
+    up front (the path is then derived from the hash of the downloaded bytes)."""
+    if layout == "cas":
+        md5 = _valid_md5(post.md5)
+        if not md5:
+            return None
+        return out_dir / cas_relpath(md5, post_ext(post) or "jpg")
+    return out_dir / default_filename(post)
+
+
+def _default_referer_for(url: str) -> str:
+    p = urlparse(url)
+    return f"{p.scheme}://{p.netloc}/"
+
+
+_DEFAULT_DOWNLOAD_UA = (
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
+    "(KHTML, like Gecko) Chrome/120 Safari/537.36"
+)
+_IMAGE_ACCEPT = "image/avif,image/webp,image/apng,image/*,*/*;q=0.8"
+
+
+def make_download_client(
+    *,
+    timeout_s: float = 60.0,
+    user_agent: str = _DEFAULT_DOWNLOAD_UA,
+    http2: bool = False,
+    http2_max_connections: int = 2,
+    http2_max_streams: int = 32,
+) -> SyncClient:
+    return make_sync_client(
+        http2=http2,
+        http2_max_connections=http2_max_connections,
+        http2_max_streams=http2_max_streams,
+        timeout=timeout_s,
+        follow_redirects=True,
+        headers={
+            "User-Agent": user_agent,
+            "Accept": _IMAGE_ACCEPT,
+        },
+    )
 
 
-def _detect_ext(post: Post) -> str | None:
-    return _normalize_ext(post.file_ext) or (
-        _normalize_ext(guess_ext_from_url(post.file_url)) if post.file_url else None
+def make_async_download_client(
+    *,
+    timeout_s: float = 60.0,
+    user_agent: str = _DEFAULT_DOWNLOAD_UA,
+    http2: bool = False,
+    http2_max_connections: int = 2,
+    http2_max_streams: int = 32,
+) -> httpx.AsyncClient:
+    return make_async_client(
+        http2=http2,
+        http2_max_connections=http2_max_connections,
+        http2_max_streams=http2_max_streams,
+        timeout=timeout_s,
+        follow_redirects=True,
+        headers={"User-Agent": user_agent, "Accept": _IMAGE_ACCEPT},
     )
 
 
-def _freeze_apng_inplace(path: Path) -> bool:
-    """If the file is an animated PNG (APNG), rewrite it as a still PNG.
+class _Sink:
+    """md5 of the streamed bytes, plus APNG sniffing when asked."""
+
+    __slots__ = ("md5", "png")
+
+    def __init__(self, sniff_png: bool):
+        self.md5 = hashlib.md5()
+        self.png = ApngSniffer() if sniff_png else None
+
+    def update(self, chunk: bytes) -> None:
+        self.md5.update(chunk)
+        if self.png is not None:
+            self.png.feed(chunk)
+
+    @property
+    def animated(self) -> bool:
+        return self.png is not None and self.png.animated
+
+
+class _RangeMismatch(Exception):
+    """A 206 that doesn't continue the .part."""
 
-    Returns True when a conversion happened.
+
+class _PartFile:
+    """A `.part` download that survives errors and can be resumed.
+
+    Next to it, `<name>.part.json` keeps the validator (strong ETag, else
+    Last-Modified) and whether the server accepts byte ranges; a resume sends
+    `Range: bytes=<size>-` with `If-Range`, so a changed file comes back whole
+    (200) instead of being appended to stale bytes.
     """
-    if not _PIL_OK:
-        return False
-    try:
-        with Image.open(path) as im:  # type: ignore[misc]
-            is_anim = bool(getattr(im, "is_animated", False))
-            n_frames = int(getattr(im, "n_frames", 1))
-            if not (is_anim and n_frames > 1):
-                return False
 
+    def __init__(self, dst: Path):
+        self.tmp = dst.with_suffix(dst.suffix + ".part")
+        self.meta = dst.with_suffix(dst.suffix + ".part.json")
+
+    def size(self) -> int:
+        try:
+            return self.tmp.stat().st_size
+        except OSError:
+            return 0
+
+    def resume_headers(self) -> dict[str, str]:
+        size = self.size()
+        if not size:
+            return {}
+        try:
+            meta = json.loads(self.meta.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return {}
+        if not meta.get("ranges") or not meta.get("validator"):
+            return {}
+        return {"Range": f"bytes={size}-", "If-Range": meta["validator"]}
+
+    def open(self, resp: httpx.Response, sniff_png: bool = False):
+        """(file, sink) to write the body of `resp` into: appended on a 206 that
+        continues the part, from scratch on a full response.
+
+        A 206 for any other range raises `_RangeMismatch` (it is not the file)."""
+        h = _Sink(sniff_png)
+        offset = self.size()
+        if resp.status_code == 206:
+            start = resp.headers.get("Content-Range", "").partition(" ")[2].partition("-")[0]
+            if start != str(offset):
+                raise _RangeMismatch(f"206 for bytes {start or '?'}-, expected {offset}-")
+            if offset:
+                with self.tmp.open("rb") as f:
+                    for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                        h.update(chunk)
+                return self.tmp.open("ab"), h
+
+        etag = resp.headers.get("ETag")
+        validator = etag if etag and not etag.startswith("W/") else None
+        validator = validator or resp.headers.get("Last-Modified")
+        ranges = resp.headers.get("Accept-Ranges", "").lower() == "bytes"
+        meta = {"validator": validator, "ranges": ranges}
+        self.meta.write_text(json.dumps(meta), encoding="utf-8")
+        return self.tmp.open("wb"), h
+
+    def commit(self, dst: Path) -> None:
+        os.replace(self.tmp, dst)
+        self.meta.unlink(missing_ok=True)
+
+    def discard(self) -> None:
+        self.tmp.unlink(missing_ok=True)
+        self.meta.unlink(missing_ok=True)
+
+
+# Worth another attempt (the .part keeps what already arrived).
+_TRANSIENT_ERRORS = (httpx.TimeoutException, httpx.NetworkError, httpx.RemoteProtocolError)
+_DEFAULT_RETRY = RetryConfig()
+
+
+def _finish(
+    part: _PartFile, dst: Path, url: str, sink: _Sink, expected_md5: str | None
+) -> tuple[str, bool]:
+    digest = sink.md5.hexdigest()
+    if expected_md5 and digest != expected_md5:
+        part.discard()
+        raise ChecksumError(f"md5 mismatch for {url}: expected {expected_md5}, got {digest}")
+    part.commit(dst)
+    return digest, sink.animated
+
+
+def _fetch_to(
+    client: SyncClient,
+    limiter: TokenBucketLimiter,
+    url: str,
+    dst: Path,
+    *,
+    expected_md5: str | None = None,
+    retry: RetryConfig | None = None,
+    sniff_png: bool = False,
+    budget: RetryBudget | None = None,
+) -> tuple[str, bool]:
+    """Stream `url` into `dst` (via a .part file); returns (md5 of the bytes, is_apng).
+
+    - transient network errors and retryable statuses (5xx, 429) are retried
+      with backoff; each attempt resumes the .part with a Range request when
+      the server supports it, and an attempt that made progress doesn't use
+      up a try
+    - when the tries run out the .part is kept, so the next run resumes it
+      (it is dropped on a status that isn't worth retrying)
+    - a 206 that doesn't continue the .part drops it and retries without Range
+    - the hash is computed while writing; on mismatch with `expected_md5` the
+      partial file is dropped and ChecksumError is raised
+    - with `sniff_png`, PNG chunk headers are checked on the fly for APNG
+    """
+    part = _PartFile(dst)
+    policy = _RetryPolicy(retry or _DEFAULT_RETRY, url, limiter=limiter, budget=budget)
+    tries = 0
+    while True:
+        tries += 1
+        before = part.size()
+        limiter.wait(domain_of(url))
+        headers = {"Referer": _default_referer_for(url), **part.resume_headers()}
+        try:
+            with client.stream("GET", url, headers=headers) as r:
+                r.raise_for_status()
+                policy.on_success()
+                f, h = part.open(r, sniff_png)
+                with f:
+                    for chunk in r.iter_bytes(chunk_size=1024 * 128):
+                        if chunk:
+                            f.write(chunk)
+                            h.update(chunk)
+            return _finish(part, dst, url, h, expected_md5)
+        except httpx.HTTPStatusError as e:
+            if e.response.status_code == 416 and before:
+                part.discard()  # stale part: start over
+                continue
+            delay = policy.on_response(e.response, tries)
+            if delay is None:
+                if e.response.status_code not in policy.cfg.retry_statuses:
+                    part.discard()
+                raise
+        except _RangeMismatch:
+            part.discard()
+            if not before:
+                raise
+            continue  # again, without Range
+        except _TRANSIENT_ERRORS:
+            delay = policy.on_error(tries)
+            if delay is None:
+                raise
+            if part.size() > before:
+                tries = 0
+        time.sleep(delay)
+
+
+async def _fetch_to_async(
+    client: httpx.AsyncClient,
+    limiter: TokenBucketLimiter,
+    url: str,
+    dst: Path,
+    *,
+    expected_md5: str | None = None,
+    retry: RetryConfig | None = None,
+    sniff_png: bool = False,
+    budget: RetryBudget | None = None,
+) -> tuple[str, bool]:
+    """asyncio version of `_fetch_to` (same .part resume, retries and md5 check)."""
+    part = _PartFile(dst)
+    policy = _RetryPolicy(retry or _DEFAULT_RETRY, url, limiter=limiter, budget=budget)
+    tries = 0
+    while True:
+        tries += 1
+        before = part.size()
+        await limiter.wait_async(domain_of(url))
+        headers = {"Referer": _default_referer_for(url), **part.resume_headers()}
+        try:
+            async with client.stream("GET", url, headers=headers) as r:
+                r.raise_for_status()
+                policy.on_success()
+                f, h = part.open(r, sniff_png)
+                with f:
+                    async for chunk in r.aiter_bytes(chunk_size=1024 * 128):
+                        if chunk:
+                            f.write(chunk)
+                            h.update(chunk)
+            return _finish(part, dst, url, h, expected_md5)
+        except httpx.HTTPStatusError as e:
+            if e.response.status_code == 416 and before:
+                part.discard()
+                continue
+            delay = policy.on_response(e.response, tries)
+            if delay is None:
+                if e.response.status_code not in policy.cfg.retry_statuses:
+                    part.discard()
+                raise
+        except _RangeMismatch:
+            part.discard()
+            if not before:
+                raise
+            continue
+        except _TRANSIENT_ERRORS:
+            delay = policy.on_error(tries)
+            if delay is None:
+                raise
+            if part.size() > before:
+                tries = 0
+        await asyncio.sleep(delay)
+
+
+_warned_pillow_missing = False
+
+
+def _store_by_hash(tmp_dst: Path, out_dir: Path, digest: str, ext: str) -> Path:
+    """Move a finished download to its content address (dedupes on collision)."""
+    final = out_dir / cas_relpath(digest, ext)
+    final.parent.mkdir(parents=True, exist_ok=True)
+    if final.exists():
+        tmp_dst.unlink(missing_ok=True)
+    else:
+        os.replace(tmp_dst, final)
+    return final
+
+
+def _download_one(
+    p: Post,
+    out_dir: Path,
+    *,
+    client: SyncClient,
+    limiter: TokenBucketLimiter,
+    overwrite: bool = False,
+    allowed: frozenset[str] | None = None,
+    allow_unknown_ext: bool = False,
+    freeze_apng: bool = True,
+    layout: StorageLayout = "flat",
+    verify_md5: bool = False,
+    retry: RetryConfig | None = None,
+    budget: RetryBudget | None = None,
+) -> tuple[Optional[Path], Optional[str], bool]:
+    """`download_one` without the post-processing: (path, error, is_apng).
+
+    With `freeze_apng`, PNGs are sniffed while streaming; `is_apng` tells the
+    caller a still frame has to be made.
+    """
+    if not p.file_url:
+        return None, None, False
+
+    ext = post_ext(p)
+    if not ext_allowed(ext, allowed, allow_unknown_ext):
+        return None, None, False
+
+    md5 = _valid_md5(p.md5)
+    expected = md5 if (verify_md5 or layout == "cas") else None
+    sniff = freeze_apng and (ext == "png" or ext is None)
+
+    dst = target_path(p, out_dir, layout)
+    if dst is not None and dst.exists() and not overwrite:
+        return dst, None, False
+
+    def _fetch_by_hash(url: str) -> tuple[Path, bool]:
+        # cas without a trusted md5: land in .incoming/, then move by hash.
+        incoming = out_dir / ".incoming" / default_filename(p)
+        incoming.parent.mkdir(parents=True, exist_ok=True)
+        digest, animated = _fetch_to(
+            client, limiter, url, incoming, retry=retry, sniff_png=sniff, budget=budget
+        )
+        return _store_by_hash(incoming, out_dir, digest, ext or "jpg"), animated
+
+    def _fetch(url: str, check: str | None) -> tuple[Path, bool]:
+        if dst is None:
+            return _fetch_by_hash(url)
+        dst.parent.mkdir(parents=True, exist_ok=True)
+        _, animated = _fetch_to(
+            client,
+            limiter,
+            url,
+            dst,
+            expected_md5=check,
+            retry=retry,
+            sniff_png=sniff,
+            budget=budget,
+        )
+        return dst, animated
+
+    try:
+        path, animated = _fetch(p.file_url, expected)
+        return path, None, animated
+    except httpx.HTTPStatusError as e:
+        status = e.response.status_code
+        if status == 403 and p.preview_url and p.preview_url != p.file_url:
             try:
-                im.seek(0)
-            except Exception:
-                pass
+                # Preview bytes never match the original md5; in the cas layout
+                # they are stored under their own hash.
+                if layout == "cas":
+                    return _fetch_by_hash(p.preview_url)[0], None, False
+                return _fetch(p.preview_url, None)[0], None, False
+            except Exception as e2:
+                err = f"[{p.source} #{p.post_id}] preview_url failed: {type(e2).__name__}: {e2}"
+                return None, err, False
 
-            still = im.convert("RGBA") if im.mode not in ("RGB", "RGBA") else im
+        return None, f"[{p.source} #{p.post_id}] {status} for {p.file_url}", False
+    except Exception as e:
+        return None, f"[{p.source} #{p.post_id}] {type(e).__name__}: {e}", False
 
-            tmp = path.with_suffix(path.suffix + ".still.part")
-            still.save(tmp, format="PNG")
-            os.replace(tmp, path)
-            return True
-    except Exception:
-        # Jangan bikin gagal download hanya karena post-process.
-        return False
 
+def _warn_pillow_missing() -> None:
+    global _warned_pillow_missing
+    if not _warned_pillow_missing:
+        _warned_pillow_missing = True
+        print(
+            "[moescraper] PIL/Pillow belum terpasang; skip post-process (freeze APNG / transform). "
+            "Install: pip install Pillow"
+        )
 
-def _safe_filename(name: str) -> str:
-    return "".join(c if c.isalnum() or c in ("-", "_", ".", "@") else "_" for c in name)
 
+def download_one(
+    p: Post,
+    out_dir: Path,
+    *,
+    client: SyncClient,
+    limiter: TokenBucketLimiter,
+    overwrite: bool = False,
+    allowed: frozenset[str] | None = None,
+    allow_unknown_ext: bool = False,
+    freeze_apng: bool = True,
+    layout: StorageLayout = "flat",
+    verify_md5: bool = False,
+    retry: RetryConfig | None = None,
+    budget: RetryBudget | None = None,
+) -> tuple[Optional[Path], Optional[str]]:
+    """Download one post into `out_dir`.
 
-def default_filename(post: Post) -> str:
-    ext = _detect_ext(post) or "jpg"
-    md5p = (post.md5[:8] if post.md5 else "nomd5")
-    return _safe_filename(f"{post.source}_{post.post_id}_{md5p}.{ext}")
+    `allowed` must already be normalized (see `normalize_exts`).
+    Returns (path, error); both are None when the post is skipped by the ext filter.
 
+    layout="cas" stores files as ab/cd/<md5>.<ext> and always verifies the md5;
+    a file whose md5 is already on disk is returned without fetching anything.
 
-def _default_referer_for(url: str) -> str:
-    p = urlparse(url)
-    return f"{p.scheme}://{p.netloc}/"
+    An APNG spotted while streaming is frozen here, in the calling thread;
+    DownloadEngine hands that to its process pool instead.
+    """
+    path, err, animated = _download_one(
+        p,
+        out_dir,
+        client=client,
+        limiter=limiter,
+        overwrite=overwrite,
+        allowed=allowed,
+        allow_unknown_ext=allow_unknown_ext,
+        freeze_apng=freeze_apng,
+        layout=layout,
+        verify_md5=verify_md5,
+        retry=retry,
+        budget=budget,
+    )
+    if animated and path is not None:
+        if _PIL_OK:
+            freeze_apng_inplace(path)
+        else:
+            _warn_pillow_missing()
+    return path, err
+
+
+def report_download_errors(errors: list[str], *, raise_on_error: bool = False) -> None:
+    if not errors:
+        return
+    msg = "Download errors (showing up to 5):\n" + "\n".join(errors[:5])
+    if raise_on_error:
+        raise RuntimeError(msg)
+    print(msg)
+
+
+@dataclass
+class DownloadResult:
+    post: Post
+    path: Optional[Path]
+    error: Optional[str] = None
+    # Files written by the transform stage, by kind ("main", "thumb").
+    outputs: Optional[dict[str, TransformOutput]] = None
+    # 64-bit perceptual hash (see `core.phash`), when asked for.
+    phash: Optional[int] = None
+
+
+_STOP = object()
+
+
+def _transformed_already(
+    post: Post, out_dir: Path, transform: TransformConfig, opts: dict
+) -> Optional[Path]:
+    """Final path of a post whose transform outputs are all on disk from an earlier run.
+
+    Needed with `replace`, where the original is gone and would be fetched again.
+    """
+    if opts["overwrite"] or not post.file_url:
+        return None
+    if not ext_allowed(post_ext(post), opts["allowed"], opts["allow_unknown_ext"]):
+        return None
+    dst = target_path(post, out_dir, opts["layout"])
+    if dst is None or not transform.is_done(dst):
+        return None
+    return transform.final_path(dst)
+
+
+def _postprocess_failed(post: Post, exc: BaseException) -> str:
+    return f"[{post.source} #{post.post_id}] post-process failed: {type(exc).__name__}: {exc}"
+
+
+def _apply_processed(
+    result: DownloadResult, done: Processed, transform: TransformConfig | None
+) -> None:
+    result.phash = done.phash
+    if done.outputs:
+        result.outputs = done.outputs
+        if transform is not None and transform.replace and "main" in done.outputs:
+            result.path = done.outputs["main"].path
+
+
+def _follow(primary: "Future[DownloadResult]", fut: "Future[DownloadResult]", post: Post) -> None:
+    """Resolve a coalesced submission from the transfer it was attached to."""
+    if primary.cancelled():
+        fut.cancel()
+        return
+    exc = primary.exception()
+    if exc is not None:
+        fut.set_exception(exc)
+        return
+    res = primary.result()
+    fut.set_result(
+        DownloadResult(
+            post=post, path=res.path, error=res.error, outputs=res.outputs, phash=res.phash
+        )
+    )
+
+
+class DownloadEngine:
+    """Long-lived download workers sharing one httpx connection pool and one limiter.
+
+    Unlike `download_posts`, nothing is torn down between batches, so keep-alive
+    connections, worker threads and rate-limit history carry over for a whole run.
+
+        engine = DownloadEngine(max_workers=4)
+        fut = engine.submit(post, "out/images")   # Future[DownloadResult]
+        engine.join()                             # wait for everything submitted
+        engine.close()
+    """
+
+    def __init__(
+        self,
+        *,
+        max_workers: int = 4,
+        timeout_s: float = 60.0,
+        user_agent: str = _DEFAULT_DOWNLOAD_UA,
+        limiter: TokenBucketLimiter | None = None,
+        http2: bool = False,
+        http2_max_connections: int = 2,
+        http2_max_streams: int = 32,
+        retry: RetryConfig | None = None,
+        process_workers: int | None = None,
+        budget: RetryBudget | None = None,
+    ):
+        self.limiter = limiter or TokenBucketLimiter.from_interval(0.8, jitter_s=0.2)
+        self.retry = retry or _DEFAULT_RETRY
+        self.budget = budget
+        # CPU-heavy post-processing (APNG freezing, transforms) runs here, off the I/O threads.
+        self.postproc = PostProcessor(process_workers)
+        self.client = make_download_client(
+            timeout_s=timeout_s,
+            user_agent=user_agent,
+            http2=http2,
+            http2_max_connections=http2_max_connections,
+            http2_max_streams=http2_max_streams,
+        )
+
+        self._jobs: queue.Queue = queue.Queue()
+        self._cond = threading.Condition()
+        self._outstanding = 0
+        # (out_dir, md5) -> future of the transfer currently fetching it
+        self._inflight: dict[tuple[Path, str], Future] = {}
+        self.coalesced = 0
+        self._n_workers = 0
+        self._threads: list[threading.Thread] = []
+        self._closed = False
+        self.resize(max_workers)
+
+    @property
+    def max_workers(self) -> int:
+        return self._n_workers
+
+    def resize(self, max_workers: int) -> None:
+        """Grow or shrink the worker pool; queued jobs are kept."""
+        n = max(1, int(max_workers))
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("DownloadEngine is closed")
+            while self._n_workers < n:
+                t = threading.Thread(
+                    target=self._worker, name=f"moescraper-dl-{len(self._threads)}", daemon=True
+                )
+                t.start()
+                self._threads.append(t)
+                self._n_workers += 1
+            while self._n_workers > n:
+                self._jobs.put(_STOP)
+                self._n_workers -= 1
+
+    def submit(
+        self,
+        post: Post,
+        out_dir: str | Path,
+        *,
+        overwrite: bool = False,
+        allowed_exts: set[str] | None = None,
+        allow_unknown_ext: bool = False,
+        freeze_apng: bool = True,
+        layout: StorageLayout = "flat",
+        verify_md5: bool = False,
+        transform: TransformConfig | None = None,
+        phash: bool = False,
+    ) -> "Future[DownloadResult]":
+        """Queue one post. In the cas layout, a post whose md5 is already being
+        fetched is attached to that transfer instead of downloading it again.
+
+        With `transform`, the file is resized / re-encoded on the process pool
+        as soon as it lands; the result carries the written `outputs`.
+        `phash=True` adds the file's perceptual hash to the result.
+        """
+        fut: Future[DownloadResult] = Future()
+        out_dir = Path(out_dir)
+
+        key = None
+        md5 = _valid_md5(post.md5)
+        if layout == "cas" and md5:
+            key = (out_dir, md5)
+
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("DownloadEngine is closed")
+            primary = self._inflight.get(key) if key is not None else None
+            if primary is None:
+                if key is not None:
+                    self._inflight[key] = fut
+                self._outstanding += 1
+            else:
+                self.coalesced += 1
+
+        if primary is not None:
+            primary.add_done_callback(lambda f: _follow(f, fut, post))
+            return fut
+
+        job = (
+            fut,
+            post,
+            out_dir,
+            key,
+            dict(
+                overwrite=overwrite,
+                allowed=normalize_exts(allowed_exts),
+                allow_unknown_ext=allow_unknown_ext,
+                freeze_apng=freeze_apng,
+                layout=layout,
+                verify_md5=verify_md5,
+            ),
+            transform,
+            phash,
+        )
+        self._jobs.put(job)
+        return fut
+
+    def join(self, timeout: float | None = None) -> bool:
+        """Block until every submitted post is finished. Returns False on timeout."""
+        with self._cond:
+            return self._cond.wait_for(lambda: self._outstanding == 0, timeout=timeout)
+
+    def close(self) -> None:
+        with self._cond:
+            if self._closed:
+                return
+            self._closed = True
+            for _ in range(self._n_workers):
+                self._jobs.put(_STOP)
+            self._n_workers = 0
+        for t in self._threads:
+            t.join()
+        self.postproc.close()
+        self.client.close()
+
+    def __enter__(self) -> "DownloadEngine":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def _worker(self) -> None:
+        while True:
+            job = self._jobs.get()
+            if job is _STOP:
+                return
+            fut, post, out_dir, key, opts, transform, phash = job
+            if not fut.set_running_or_notify_cancel():
+                self._done(key)
+                continue
+            try:
+                done = _transformed_already(post, out_dir, transform, opts) if transform else None
+                if done is not None:
+                    self._resolve(fut, DownloadResult(post=post, path=done), key)
+                    continue
+                path, err, animated = _download_one(
+                    post,
+                    out_dir,
+                    client=self.client,
+                    limiter=self.limiter,
+                    retry=self.retry,
+                    budget=self.budget,
+                    **opts,
+                )
+            except BaseException as e:
+                fut.set_exception(e)
+                self._done(key)
+                continue
+            result = DownloadResult(post=post, path=path, error=err)
+            if path is not None and (animated or transform is not None or phash):
+                if _PIL_OK:
+                    # The post resolves once its file is processed; this
+                    # thread goes straight back to downloading.
+                    pfut = self.postproc.submit(
+                        process_file, path, freeze=animated, transform=transform, phash=phash
+                    )
+                    pfut.add_done_callback(partial(self._processed, fut, result, transform, key))
+                    continue
+                _warn_pillow_missing()
+            self._resolve(fut, result, key)
+
+    def _processed(
+        self,
+        fut: "Future[DownloadResult]",
+        result: DownloadResult,
+        transform: TransformConfig | None,
+        key,
+        pfut: Future,
+    ) -> None:
+        try:
+            _apply_processed(result, pfut.result(), transform)
+        except BaseException as e:
+            result.error = _postprocess_failed(result.post, e)
+        self._resolve(fut, result, key)
+
+    def _resolve(self, fut: "Future[DownloadResult]", result: DownloadResult, key) -> None:
+        fut.set_result(result)
+        self._done(key)
+
+    def _done(self, key) -> None:
+        with self._cond:
+            if key is not None:
+                self._inflight.pop(key, None)
+            self._outstanding -= 1
+            if self._outstanding == 0:
+                self._cond.notify_all()
 
 
 def download_posts(
@@ -90,11 +801,16 @@ def download_posts(
     max_workers: int = 1,
     overwrite: bool = False,
     timeout_s: float = 60.0,
-    user_agent: str = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120 Safari/537.36",
+    user_agent: str = _DEFAULT_DOWNLOAD_UA,
     raise_on_error: bool = False,
     allowed_exts: set[str] | None = None,
     allow_unknown_ext: bool = False,
     freeze_apng: bool = True,
+    engine: DownloadEngine | None = None,
+    layout: StorageLayout = "flat",
+    verify_md5: bool = False,
+    transform: TransformConfig | None = None,
+    shard_size: int | None = None,
 ) -> list[Path]:
     """
     Download posts with:
@@ -102,108 +818,324 @@ def download_posts(
     - Referer otomatis sesuai domain file_url
     - rate-limit ringan per-domain
     - fallback: kalau 403 pada file_url, coba preview_url
+    - retry with backoff on network errors / 5xx; interrupted files are kept
+      as .part and resumed with Range requests (also on the next run)
+
+    Pass a long-lived `engine` to reuse its connections/workers (at most
+    `max_workers` of these posts are in flight on it at a time); otherwise a
+    temporary one is created (`max_workers`, `timeout_s`, `user_agent`) and closed.
+
+    layout="cas" stores files by md5 (ab/cd/<md5>.<ext>), verifies the bytes,
+    and dedupes across sources; `verify_md5` turns verification on for "flat".
+
+    `transform` resizes / re-encodes each file on the engine's process pool as
+    soon as it lands (see `TransformConfig`); with `replace` the returned
+    paths are the transformed files.
+
+    `shard_size` (bytes) streams the images into rolling tar shards in
+    `out_dir` instead (`shard-000000.tar`, see `ShardWriter`); files are
+    staged in `out_dir/.staging` and the returned paths are `<shard>#<member>`.
     """
     out_dir = Path(out_dir)
     out_dir.mkdir(parents=True, exist_ok=True)
 
-    limiter = RateLimiter(min_interval_s=0.8, jitter_s=0.2)
+    shards = None
+    dl_dir = out_dir
+    if shard_size is not None:
+        from .shards import ShardWriter, write_result
 
-    client = httpx.Client(
-        timeout=timeout_s,
-        follow_redirects=True,
-        headers={
-            "User-Agent": user_agent,
-            "Accept": "image/avif,image/webp,image/apng,image/*,*/*;q=0.8",
-        },
-    )
+        shards = ShardWriter(out_dir, max_bytes=shard_size)
+        dl_dir = shards.staging_dir
+
+    own_engine = engine is None
+    if engine is None:
+        engine = DownloadEngine(max_workers=max_workers, timeout_s=timeout_s, user_agent=user_agent)
 
     downloaded: list[Path] = []
+    seen: set[Path] = set()
     errors: list[str] = []
-    warned_pillow_missing = False
+    try:
+        # A shared engine may have more workers than this call asked for:
+        # keep at most `max_workers` of our posts in flight.
+        window = max(1, int(max_workers))
+        todo = iter(posts)
+        pending: set[Future] = set()
+        while True:
+            for p in todo:
+                pending.add(
+                    engine.submit(
+                        p,
+                        dl_dir,
+                        overwrite=overwrite,
+                        allowed_exts=allowed_exts,
+                        allow_unknown_ext=allow_unknown_ext,
+                        freeze_apng=freeze_apng,
+                        layout=layout,
+                        verify_md5=verify_md5,
+                        transform=transform,
+                    )
+                )
+                if len(pending) >= window:
+                    break
+            if not pending:
+                break
+            finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for fut in finished:
+                res = fut.result()
+                if shards is not None:
+                    res = write_result(shards, res)
+                if res.path and res.path not in seen:
+                    seen.add(res.path)
+                    downloaded.append(res.path)
+                if res.error:
+                    errors.append(res.error)
+    finally:
+        if own_engine:
+            engine.close()
+        if shards is not None:
+            shards.close()
 
-    def _fetch_to(url: str, dst: Path) -> None:
-        limiter.wait(domain_of(url))
-        headers = {"Referer": _default_referer_for(url)}
-        tmp = dst.with_suffix(dst.suffix + ".part")
-        try:
-            with client.stream("GET", url, headers=headers) as r:
-                r.raise_for_status()
-                with tmp.open("wb") as f:
-                    for chunk in r.iter_bytes(chunk_size=1024 * 128):
-                        if chunk:
-                            f.write(chunk)
-            os.replace(tmp, dst)
-        finally:
-            if tmp.exists() and not dst.exists():
-                try:
-                    tmp.unlink()
-                except OSError:
-                    pass
+    report_download_errors(errors, raise_on_error=raise_on_error)
+    return downloaded
 
-    def _one(p: Post) -> Optional[Path]:
-        if not p.file_url:
-            return None
 
-        ext = _detect_ext(p)
-        if allowed_exts:
-            allowed = {_normalize_ext(x) for x in allowed_exts}
-            allowed.discard(None)
-            if not ext:
-                if not allow_unknown_ext:
-                    return None
-            else:
-                if ext not in allowed:
-                    return None
+async def download_results_async(
+    posts: list[Post],
+    out_dir: str | Path,
+    *,
+    max_concurrency: int = 16,
+    overwrite: bool = False,
+    timeout_s: float = 60.0,
+    user_agent: str = _DEFAULT_DOWNLOAD_UA,
+    allowed_exts: set[str] | None = None,
+    allow_unknown_ext: bool = False,
+    freeze_apng: bool = True,
+    limiter: TokenBucketLimiter | None = None,
+    http2: bool = False,
+    http2_max_connections: int = 2,
+    http2_max_streams: int = 32,
+    retry: RetryConfig | None = None,
+    postproc: PostProcessor | None = None,
+    transform: TransformConfig | None = None,
+    phash: bool = False,
+    budget: RetryBudget | None = None,
+    layout: StorageLayout = "flat",
+    verify_md5: bool = False,
+    client: httpx.AsyncClient | None = None,
+) -> list[DownloadResult]:
+    """Like `download_posts_async`, but one `DownloadResult` per post (in order),
+    errors included instead of reported; `phash=True` fills `DownloadResult.phash`.
 
-        dst = out_dir / default_filename(p)
-        if dst.exists() and not overwrite:
-            return dst
+    In the cas layout, posts sharing an md5 share one transfer (as in
+    `DownloadEngine.submit`). Pass a long-lived `client` (see
+    `make_async_download_client`) to keep its connections across calls; it
+    is left open, and the timeout / user-agent / HTTP/2 options are unused."""
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
 
-        try:
-            _fetch_to(p.file_url, dst)
-
-            # Post-process: freeze APNG -> PNG still (optional)
-            if freeze_apng and (ext == "png" or ext is None):
-                nonlocal warned_pillow_missing
-                if not _PIL_OK and not warned_pillow_missing:
-                    warned_pillow_missing = True
-                    print(
-                        "[moescraper] PIL/Pillow belum terpasang; skip freeze APNG. "
-                        "Install: pip install Pillow"
+    limiter = limiter or TokenBucketLimiter.from_interval(0.8, jitter_s=0.2)
+    sem = asyncio.Semaphore(max(1, int(max_concurrency)))
+    allowed = normalize_exts(allowed_exts)
+    opts = dict(
+        overwrite=overwrite, allowed=allowed, allow_unknown_ext=allow_unknown_ext, layout=layout
+    )
+
+    own_postproc = postproc is None
+    postproc = postproc or PostProcessor()
+
+    if client is None:
+        client_cm = make_async_download_client(
+            timeout_s=timeout_s,
+            user_agent=user_agent,
+            http2=http2,
+            http2_max_connections=http2_max_connections,
+            http2_max_streams=http2_max_streams,
+        )
+    else:
+        client_cm = nullcontext(client)
+    async with client_cm as client:
+
+        async def _fetch_by_hash(p: Post, url: str, ext: Optional[str], sniff: bool):
+            # cas without a trusted md5: land in .incoming/, then move by hash.
+            incoming = out_dir / ".incoming" / default_filename(p)
+            incoming.parent.mkdir(parents=True, exist_ok=True)
+            digest, animated = await _fetch_to_async(
+                client, limiter, url, incoming, retry=retry, sniff_png=sniff, budget=budget
+            )
+            return _store_by_hash(incoming, out_dir, digest, ext or "jpg"), animated
+
+        async def _fetch(
+            p: Post, dst: Optional[Path], ext: Optional[str]
+        ) -> tuple[Optional[Path], Optional[str], bool]:
+            """(path, error, animated) for one post; same rules as `_download_one`."""
+            sniff = freeze_apng and (ext == "png" or ext is None)
+            md5 = _valid_md5(p.md5)
+            expected = md5 if (verify_md5 or layout == "cas") else None
+            async with sem:
+                try:
+                    if dst is None:
+                        path, animated = await _fetch_by_hash(p, p.file_url, ext, sniff)
+                        return path, None, animated
+                    dst.parent.mkdir(parents=True, exist_ok=True)
+                    _, animated = await _fetch_to_async(
+                        client,
+                        limiter,
+                        p.file_url,
+                        dst,
+                        expected_md5=expected,
+                        retry=retry,
+                        sniff_png=sniff,
+                        budget=budget,
                     )
-                else:
-                    _freeze_apng_inplace(dst)
+                    return dst, None, animated
+                except httpx.HTTPStatusError as e:
+                    status = e.response.status_code
+                    if status == 403 and p.preview_url and p.preview_url != p.file_url:
+                        try:
+                            # Preview bytes never match the original md5.
+                            if layout == "cas":
+                                path, _ = await _fetch_by_hash(p, p.preview_url, ext, False)
+                                return path, None, False
+                            await _fetch_to_async(
+                                client, limiter, p.preview_url, dst, retry=retry, budget=budget
+                            )
+                            return dst, None, False
+                        except Exception as e2:
+                            err = f"preview_url failed: {type(e2).__name__}: {e2}"
+                            return None, f"[{p.source} #{p.post_id}] {err}", False
+                    return None, f"[{p.source} #{p.post_id}] {status} for {p.file_url}", False
+                except Exception as e:
+                    return None, f"[{p.source} #{p.post_id}] {type(e).__name__}: {e}", False
 
-            return dst
-        except httpx.HTTPStatusError as e:
-            status = e.response.status_code
-            if status == 403 and p.preview_url and p.preview_url != p.file_url:
+        async def _download(p: Post) -> DownloadResult:
+            if not p.file_url:
+                return DownloadResult(post=p, path=None)
+
+            ext = post_ext(p)
+            if not ext_allowed(ext, allowed, allow_unknown_ext):
+                return DownloadResult(post=p, path=None)
+
+            dst = target_path(p, out_dir, layout)
+            if transform is not None:
+                done = _transformed_already(p, out_dir, transform, opts)
+                if done is not None:
+                    return DownloadResult(post=p, path=done)
+
+            animated = False
+            if dst is not None and dst.exists() and not overwrite:
+                path = dst
+            else:
+                path, err, animated = await _fetch(p, dst, ext)
+                if err is not None:
+                    return DownloadResult(post=p, path=None, error=err)
+
+            result = DownloadResult(post=p, path=path)
+            # Outside the semaphore: the next transfer starts while this one is processed.
+            if animated or transform is not None or phash:
+                if not _PIL_OK:
+                    _warn_pillow_missing()
+                    return result
                 try:
-                    _fetch_to(p.preview_url, dst)
-                    return dst
-                except Exception as e2:
-                    errors.append(f"[{p.source} #{p.post_id}] preview_url failed: {type(e2).__name__}: {e2}")
-                    return None
+                    done = await postproc.run(
+                        process_file, path, freeze=animated, transform=transform, phash=phash
+                    )
+                    _apply_processed(result, done, transform)
+                except Exception as e:
+                    result.error = _postprocess_failed(p, e)
+            return result
 
-            errors.append(f"[{p.source} #{p.post_id}] {status} for {p.file_url}")
-            return None
-        except Exception as e:
-            errors.append(f"[{p.source} #{p.post_id}] {type(e).__name__}: {e}")
-            return None
+        # cas: posts sharing an md5 (the same image from several sources) share
+        # one transfer instead of streaming into the same .part concurrently.
+        inflight: dict[str, asyncio.Task] = {}
+
+        async def _one(p: Post) -> DownloadResult:
+            md5 = _valid_md5(p.md5) if layout == "cas" else None
+            if md5 is None:
+                return await _download(p)
+            primary = inflight.get(md5)
+            if primary is None:
+                primary = inflight[md5] = asyncio.ensure_future(_download(p))
+                return await primary
+            res = await asyncio.shield(primary)
+            return DownloadResult(
+                post=p, path=res.path, error=res.error, outputs=res.outputs, phash=res.phash
+            )
 
-    with ThreadPoolExecutor(max_workers=max_workers) as ex:
-        futs = [ex.submit(_one, p) for p in posts]
-        for fut in as_completed(futs):
-            path = fut.result()
-            if path:
-                downloaded.append(path)
+        try:
+            return list(await asyncio.gather(*(_one(p) for p in posts)))
+        finally:
+            if own_postproc:
+                await asyncio.to_thread(postproc.close)
+
+
+async def download_posts_async(
+    posts: list[Post],
+    out_dir: str | Path,
+    *,
+    max_concurrency: int = 16,
+    overwrite: bool = False,
+    timeout_s: float = 60.0,
+    user_agent: str = _DEFAULT_DOWNLOAD_UA,
+    raise_on_error: bool = False,
+    allowed_exts: set[str] | None = None,
+    allow_unknown_ext: bool = False,
+    freeze_apng: bool = True,
+    limiter: TokenBucketLimiter | None = None,
+    http2: bool = False,
+    http2_max_connections: int = 2,
+    http2_max_streams: int = 32,
+    retry: RetryConfig | None = None,
+    postproc: PostProcessor | None = None,
+    transform: TransformConfig | None = None,
+    shard_size: int | None = None,
+    budget: RetryBudget | None = None,
+    layout: StorageLayout = "flat",
+    verify_md5: bool = False,
+) -> list[Path]:
+    """asyncio version of `download_posts`.
 
-    client.close()
+    All transfers share one httpx.AsyncClient on the running event loop;
+    `max_concurrency` bounds in-flight requests instead of a thread count.
+    `layout` / `verify_md5` work as in `download_posts` (md5 checked while streaming).
+    APNGs (spotted while streaming) are frozen, and `transform` applied, on
+    `postproc`'s process pool; without one, a temporary pool is used.
+    Shards (`shard_size`) are written once the downloads are done.
+    """
+    out_dir = Path(out_dir)
+    shards = None
+    dl_dir = out_dir
+    if shard_size is not None:
+        from .shards import ShardWriter, write_result
 
-    if errors:
-        msg = "Download errors (showing up to 5):\n" + "\n".join(errors[:5])
-        if raise_on_error:
-            raise RuntimeError(msg)
-        print(msg)
+        shards = ShardWriter(out_dir, max_bytes=shard_size)
+        dl_dir = shards.staging_dir
 
-    return downloaded
\ No newline at end of file
+    results = await download_results_async(
+        posts,
+        dl_dir,
+        max_concurrency=max_concurrency,
+        overwrite=overwrite,
+        timeout_s=timeout_s,
+        user_agent=user_agent,
+        allowed_exts=allowed_exts,
+        allow_unknown_ext=allow_unknown_ext,
+        freeze_apng=freeze_apng,
+        limiter=limiter,
+        http2=http2,
+        http2_max_connections=http2_max_connections,
+        http2_max_streams=http2_max_streams,
+        retry=retry,
+        postproc=postproc,
+        transform=transform,
+        budget=budget,
+        layout=layout,
+        verify_md5=verify_md5,
+    )
+    if shards is not None:
+        try:
+            results = await asyncio.to_thread(lambda: [write_result(shards, r) for r in results])
+        finally:
+            shards.close()
+    report_download_errors([r.error for r in results if r.error], raise_on_error=raise_on_error)
+    # cas: posts sharing an md5 share a file
+    return list(dict.fromkeys(r.path for r in results if r.path))
@@ -1,9 +1,14 @@
 from __future__ import annotations
 
+from dataclasses import dataclass
+from functools import cached_property, lru_cache
+from typing import Callable, Iterable, Optional
+
 from .models import Post, Rating
 from .utils import guess_ext_from_url
 
 
+@lru_cache(maxsize=256)
 def normalize_ext(ext: str | None) -> str | None:
     """Normalize extension to a stable lowercase form.
 
@@ -20,6 +25,207 @@ def normalize_ext(ext: str | None) -> str | None:
     return e or None
 
 
+def post_ext(post: Post) -> str | None:
+    """Normalized extension of a post: `file_ext`, else guessed from `file_url`."""
+    return normalize_ext(post.file_ext) or (
+        normalize_ext(guess_ext_from_url(post.file_url)) if post.file_url else None
+    )
+
+
+@lru_cache(maxsize=64)
+def _normalize_exts(exts: frozenset[str]) -> frozenset[str] | None:
+    out = frozenset(e for e in map(normalize_ext, exts) if e)
+    return out or None
+
+
+def normalize_exts(exts: Iterable[str] | None) -> frozenset[str] | None:
+    """Normalized allow-list of extensions; None (accept all) when empty."""
+    if not exts:
+        return None
+    return _normalize_exts(frozenset(exts))
+
+
+def ext_allowed(ext: str | None, allowed: frozenset[str] | None, allow_unknown_ext: bool) -> bool:
+    """`allowed` must already be normalized (see `normalize_exts`)."""
+    if not allowed:
+        return True
+    if not ext:
+        return allow_unknown_ext
+    return ext in allowed
+
+
+_NOT_NSFW = frozenset(r for r in Rating if r != Rating.NSFW)
+_NSFW_MODE_RATINGS: dict[str, Optional[frozenset[Rating]]] = {
+    "all": None,
+    "safe": frozenset({Rating.SAFE}),
+    "nsfw": frozenset({Rating.NSFW}),
+}
+
+
+def ratings_for_nsfw(nsfw: bool) -> Optional[frozenset[Rating]]:
+    """Ratings kept by the `nsfw` search flag (nsfw=False drops NSFW only)."""
+    return None if nsfw else _NOT_NSFW
+
+
+def ratings_for_nsfw_mode(mode: str) -> Optional[frozenset[Rating]]:
+    """Ratings kept by a scrape `nsfw_mode`: "safe", "all" or "nsfw"."""
+    try:
+        return _NSFW_MODE_RATINGS[mode]
+    except KeyError:
+        raise ValueError(f"Unknown nsfw_mode '{mode}'") from None
+
+
+@dataclass(frozen=True)
+class FilterSpec:
+    """Post filter rules, compiled once into a single predicate.
+
+    - ratings: allowed ratings (None = any)
+    - min/max width and height, aspect ratio (width / height) range
+    - max_file_size in bytes
+    - include_tags (all required) / exclude_tags (none allowed)
+    - allowed_exts (None = any); posts without an extension need allow_unknown_ext
+
+    Posts that don't report their size (or file size) pass those rules.
+    `apply(posts)` filters a batch in one pass.
+    """
+
+    ratings: Optional[frozenset[Rating]] = None
+
+    min_width: Optional[int] = None
+    min_height: Optional[int] = None
+    max_width: Optional[int] = None
+    max_height: Optional[int] = None
+    min_aspect: Optional[float] = None
+    max_aspect: Optional[float] = None
+
+    max_file_size: Optional[int] = None
+
+    include_tags: frozenset[str] = frozenset()
+    exclude_tags: frozenset[str] = frozenset()
+
+    allowed_exts: Optional[frozenset[str]] = None
+    allow_unknown_ext: bool = False
+
+    def __post_init__(self) -> None:
+        # Accept plain sets/lists (and rating strings); store hashable, normalized values.
+        if self.ratings is not None:
+            object.__setattr__(self, "ratings", frozenset(Rating(r) for r in self.ratings))
+        object.__setattr__(self, "include_tags", frozenset(self.include_tags or ()))
+        object.__setattr__(self, "exclude_tags", frozenset(self.exclude_tags or ()))
+        object.__setattr__(self, "allowed_exts", normalize_exts(self.allowed_exts))
+
+    @classmethod
+    def for_search(
+        cls,
+        nsfw: bool,
+        *,
+        min_width: int | None = None,
+        min_height: int | None = None,
+        allowed_exts: Iterable[str] | None = None,
+        allow_unknown_ext: bool = False,
+    ) -> "FilterSpec":
+        """The rules behind the `search` keyword arguments."""
+        return cls(
+            ratings=ratings_for_nsfw(nsfw),
+            min_width=min_width,
+            min_height=min_height,
+            allowed_exts=allowed_exts,  # type: ignore[arg-type]
+            allow_unknown_ext=bool(allow_unknown_ext),
+        )
+
+    @cached_property
+    def predicate(self) -> Callable[[Post], bool]:
+        """One function checking every active rule; inactive rules cost a constant test."""
+        # Tuple, not the frozenset: Enum.__hash__ is Python-level, `in` on a
+        # short tuple of the singletons is an identity check.
+        ratings = tuple(self.ratings) if self.ratings is not None else None
+        min_w, max_w = self.min_width, self.max_width
+        min_h, max_h = self.min_height, self.max_height
+        min_ar, max_ar = self.min_aspect, self.max_aspect
+        check_dims = self._dims_rules
+        check_ar = min_ar is not None or max_ar is not None
+        max_size = self.max_file_size
+        include = self.include_tags or None
+        exclude = self.exclude_tags or None
+        allowed = self.allowed_exts
+        unknown_ok = self.allow_unknown_ext
+
+        def pred(p: Post) -> bool:
+            if ratings is not None and p.rating not in ratings:
+                return False
+            if check_dims:
+                w, h = p.width, p.height
+                if w is not None and h is not None:
+                    if min_w is not None and w < min_w:
+                        return False
+                    if max_w is not None and w > max_w:
+                        return False
+                    if min_h is not None and h < min_h:
+                        return False
+                    if max_h is not None and h > max_h:
+                        return False
+                    if check_ar and h > 0:
+                        ar = w / h
+                        if min_ar is not None and ar < min_ar:
+                            return False
+                        if max_ar is not None and ar > max_ar:
+                            return False
+            if max_size is not None and p.file_size is not None and p.file_size > max_size:
+                return False
+            if exclude is not None and not exclude.isdisjoint(p.tags):
+                return False
+            if include is not None and not include.issubset(p.tags):
+                return False
+            if allowed is not None:
+                ext = post_ext(p)
+                if ext is None:
+                    if not unknown_ok:
+                        return False
+                elif ext not in allowed:
+                    return False
+            return True
+
+        return pred
+
+    @cached_property
+    def _dims_rules(self) -> bool:
+        return any(
+            v is not None
+            for v in (
+                self.min_width,
+                self.min_height,
+                self.max_width,
+                self.max_height,
+                self.min_aspect,
+                self.max_aspect,
+            )
+        )
+
+    def undecided(self, post: Post) -> bool:
+        """True when a size rule passed `post` only because the source didn't
+        report its dimensions / file size (see `core.probe`)."""
+        if self._dims_rules and (post.width is None or post.height is None):
+            return True
+        return self.max_file_size is not None and post.file_size is None
+
+    @cached_property
+    def active(self) -> bool:
+        """False when the spec keeps every post."""
+        return self != _ACCEPT_ALL
+
+    def __call__(self, post: Post) -> bool:
+        return self.predicate(post)
+
+    def apply(self, posts: Iterable[Post]) -> list[Post]:
+        if not self.active:
+            return list(posts)
+        pred = self.predicate
+        return [p for p in posts if pred(p)]
+
+
+_ACCEPT_ALL = FilterSpec()
+
+
 def passes_file_ext(
     post: Post,
     allowed_exts: set[str] | None,
@@ -32,19 +238,7 @@ def passes_file_ext(
     - If extension is missing/unknown:
         - accept only when allow_unknown_ext=True
     """
-    if not allowed_exts:
-        return True
-
-    allowed = {normalize_ext(x) for x in allowed_exts}
-    allowed.discard(None)
-
-    ext = normalize_ext(post.file_ext)
-    if not ext and post.file_url:
-        ext = normalize_ext(guess_ext_from_url(post.file_url))
-
-    if not ext:
-        return bool(allow_unknown_ext)
-    return ext in allowed
+    return ext_allowed(post_ext(post), normalize_exts(allowed_exts), allow_unknown_ext)
 
 
 def normalize_rating(value: str | None, source: str) -> Rating:
@@ -63,10 +257,10 @@ def normalize_rating(value: str | None, source: str) -> Rating:
 
     if source == "safebooru":
         return Rating.SAFE
-    
+
     if v in ("safe", "s"):
         return Rating.SAFE
-    
+
     if v in ("questionable", "q", "explicit", "e"):
         return Rating.NSFW
 
@@ -74,19 +268,11 @@ def normalize_rating(value: str | None, source: str) -> Rating:
 
 
 def passes_nsfw(post: Post, nsfw: bool) -> bool:
-    return True if nsfw else (post.rating != Rating.NSFW)
+    return FilterSpec(ratings=ratings_for_nsfw(nsfw))(post)
 
 
 def passes_min_size(post: Post, *, min_width: int | None, min_height: int | None) -> bool:
-    if min_width is None and min_height is None:
-        return True
-    if post.width is None or post.height is None:
-        return True
-    if min_width is not None and post.width < min_width:
-        return False
-    if min_height is not None and post.height < min_height:
-        return False
-    return True
+    return FilterSpec(min_width=min_width, min_height=min_height)(post)
 
 
 def filter_posts(
@@ -97,13 +283,11 @@ def filter_posts(
     allowed_exts: set[str] | None = None,
     allow_unknown_ext: bool = False,
 ) -> list[Post]:
-    out: list[Post] = []
-    for p in posts:
-        if not passes_nsfw(p, nsfw):
-            continue
-        if not passes_min_size(p, min_width=min_width, min_height=min_height):
-            continue
-        if not passes_file_ext(p, allowed_exts, allow_unknown_ext=allow_unknown_ext):
-            continue
-        out.append(p)
-    return out
\ No newline at end of file
+    spec = FilterSpec.for_search(
+        nsfw,
+        min_width=min_width,
+        min_height=min_height,
+        allowed_exts=allowed_exts,
+        allow_unknown_ext=allow_unknown_ext,
+    )
+    return spec.apply(posts)
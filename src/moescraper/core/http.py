@@ -1,14 +1,23 @@
 from __future__ import annotations
 
+import json
+import re
 from dataclasses import dataclass, field
+from pathlib import Path
 from typing import Any, Optional
 
-import json
 import httpx
 
-from .rate_limit import RateLimiter
-from .retry import RetryConfig, request_with_retry
-from .utils import domain_of, sanitize_json_text
+try:
+    import orjson
+except ImportError:  # optional: pip install orjson
+    orjson = None
+
+from .http_cache import CachedResponse, ResponseCache
+from .rate_limit import RateProfile, TokenBucketLimiter
+from .retry import RetryBudget, RetryConfig, request_with_retry, request_with_retry_async
+from .transport import make_async_client, make_sync_client
+from .utils import domain_of, sanitize_json_bytes, sanitize_json_text
 
 
 @dataclass
@@ -18,36 +27,176 @@ class HttpConfig:
     follow_redirects: bool = True
     rate_limit_min_interval_s: float = 0.8
     rate_limit_jitter_s: float = 0.2
+    # Per-domain token-bucket budgets, e.g. {"danbooru.donmai.us": RateProfile(rate=2, burst=4)}.
+    # Hosts without a profile get 1/rate_limit_min_interval_s req/s with burst 1.
+    rate_limits: dict[str, RateProfile] = field(default_factory=dict)
     retry: RetryConfig = field(default_factory=RetryConfig)
+    # Opt-in HTTP/2 (needs `pip install 'httpx[http2]'`). Requests to one host share
+    # up to http2_max_connections connections with at most http2_max_streams
+    # in-flight streams each; hosts without h2 fall back to HTTP/1.1.
+    http2: bool = False
+    http2_max_connections: int = 2
+    http2_max_streams: int = 32
+    # Opt-in persistent cache for API GETs (SQLite file). Fresh entries skip the
+    # network and the rate limiter; stale ones are revalidated with ETag /
+    # Last-Modified. Total body size is capped by LRU eviction.
+    cache_path: Optional[str | Path] = None
+    cache_ttl_s: float = 3600.0
+    cache_max_bytes: int = 256 * 1024 * 1024
+
+    def make_limiter(self) -> TokenBucketLimiter:
+        interval = self.rate_limit_min_interval_s
+        rate = 1.0 / interval if interval > 0 else float("inf")
+        return TokenBucketLimiter(
+            RateProfile(rate=rate, burst=1),
+            self.rate_limits,
+            jitter_s=self.rate_limit_jitter_s,
+        )
+
+    def make_retry_budget(self) -> RetryBudget:
+        return RetryBudget(ratio=self.retry.budget_ratio, min_tokens=self.retry.budget_min_tokens)
+
+    def make_cache(self) -> Optional[ResponseCache]:
+        if self.cache_path is None:
+            return None
+        return ResponseCache(
+            Path(self.cache_path), ttl_s=self.cache_ttl_s, max_bytes=self.cache_max_bytes
+        )
+
+
+def _default_headers(cfg: HttpConfig) -> dict[str, str]:
+    return {
+        "User-Agent": cfg.user_agent,
+        "Accept": "application/json,text/plain,*/*",
+        "Accept-Language": "en-US,en;q=0.9",
+        "Referer": "https://safebooru.org/",
+        "Accept-Encoding": "gzip, deflate",  # hindari br (brotli)
+    }
+
+
+def _cached_body(
+    cache: ResponseCache, key: str, entry: Optional[CachedResponse], resp: httpx.Response
+) -> bytes:
+    """Finish a (possibly conditional) request against the cache."""
+    if resp.status_code == 304 and entry is not None:
+        cache.revalidated(key)
+        return entry.body
+    cache.miss()
+    resp.raise_for_status()
+    if resp.status_code == 200 and _is_json(resp):
+        cache.store(key, resp.content, resp.headers)
+    return resp.content
+
+
+def _is_json(resp: httpx.Response) -> bool:
+    # HTML challenge / error pages come back as 200 too; caching one would
+    # make the source look empty for the whole TTL.
+    if "json" in resp.headers.get("Content-Type", "").lower():
+        return True
+    try:
+        if orjson is not None:
+            orjson.loads(resp.content)
+        else:
+            json.loads(resp.content)
+    except ValueError:
+        return False
+    return True
+
+
+def decode_json_text(text: str) -> Any:
+    """Lenient JSON decode: "dirty" / empty / HTML bodies become []."""
+    cleaned = sanitize_json_text(text).strip()
+
+    if not cleaned:
+        return []
+
+    if cleaned[:1] == "<":
+        return []
+
+    try:
+        return json.loads(cleaned)
+    except json.JSONDecodeError:
+        return []
+
+
+_FIRST_CHAR_RE = re.compile(rb"\S")
+
+
+def decode_json_bytes(data: bytes) -> Any:
+    """`decode_json_text` on the raw body, without str copies.
+
+    - control characters are looked for first; the body is only rewritten
+      when there are some
+    - empty / HTML bodies are recognised from the first non-space byte
+    - parsed with orjson when installed (json.loads otherwise); anything it
+      rejects goes through the old text path
+    """
+    data = sanitize_json_bytes(data)
+
+    m = _FIRST_CHAR_RE.search(data)
+    if m is None:
+        return []
+    if data[m.start()] == 0x3C:  # "<"
+        return []
+
+    try:
+        if orjson is not None:
+            return orjson.loads(data)
+        return json.loads(data)
+    except ValueError:
+        return decode_json_text(data.decode("utf-8", errors="replace"))
 
 
 class HttpClient:
-    def __init__(self, cfg: Optional[HttpConfig] = None):
+    def __init__(
+        self, cfg: Optional[HttpConfig] = None, limiter: Optional[TokenBucketLimiter] = None
+    ):
         self.cfg = cfg or HttpConfig()
-        self.limiter = RateLimiter(
-            min_interval_s=self.cfg.rate_limit_min_interval_s,
-            jitter_s=self.cfg.rate_limit_jitter_s,
-        )
-        self.client = httpx.Client(
+        # Shared with the DownloadEngine by MoeScraperClient (one budget per host).
+        self.limiter = limiter or self.cfg.make_limiter()
+        self.retry_budget = self.cfg.make_retry_budget()
+        self.cache = self.cfg.make_cache()
+        self.client = make_sync_client(
+            http2=self.cfg.http2,
+            http2_max_connections=self.cfg.http2_max_connections,
+            http2_max_streams=self.cfg.http2_max_streams,
             timeout=self.cfg.timeout_s,
             follow_redirects=self.cfg.follow_redirects,
-            headers={
-                "User-Agent": self.cfg.user_agent,
-                "Accept": "application/json,text/plain,*/*",
-                "Accept-Language": "en-US,en;q=0.9",
-                "Referer": "https://safebooru.org/",
-                "Accept-Encoding": "gzip, deflate",  # hindari br (brotli)
-            },
+            headers=_default_headers(self.cfg),
         )
 
     def close(self) -> None:
         self.client.close()
+        if self.cache is not None:
+            self.cache.close()
+
+    def cache_stats(self) -> dict[str, int]:
+        return self.cache.stats() if self.cache is not None else {}
+
+    def get_bytes(self, url: str, params: dict[str, Any] | None = None) -> bytes:
+        entry = None
+        if self.cache is not None:
+            key = self.cache.key_of(url, params)
+            entry = self.cache.get(key)
+            if entry is not None and self.cache.is_fresh(entry):
+                self.cache.hit(key)
+                return entry.body
 
-    def get_text(self, url: str, params: dict[str, Any] | None = None) -> str:
         self.limiter.wait(domain_of(url))
-        resp = request_with_retry(self.client, "GET", url, self.cfg.retry, params=params)
+        resp = request_with_retry(
+            self.client,
+            "GET",
+            url,
+            self.cfg.retry,
+            limiter=self.limiter,
+            budget=self.retry_budget,
+            params=params,
+            headers=ResponseCache.validators(entry),
+        )
+        if self.cache is not None:
+            return _cached_body(self.cache, key, entry, resp)
         resp.raise_for_status()
-        return resp.text
+        return resp.content
 
     # def get_json(self, url: str, params: dict[str, Any] | None = None) -> Any:
     #     text = self.get_text(url, params=params)
@@ -55,20 +204,11 @@ class HttpClient:
     #     cleaned = sanitize_json_text(text)
     #     return httpx.Response(200, text=cleaned).json()
 
-    def get_json(self, url: str, params: dict[str, Any] | None = None) -> Any:
-        text = self.get_text(url, params=params)
-        cleaned = sanitize_json_text(text).strip()
-
-        if not cleaned:
-            return []
-
-        if cleaned[:1] == "<":
-            return []
+    def get_text(self, url: str, params: dict[str, Any] | None = None) -> str:
+        return self.get_bytes(url, params=params).decode("utf-8", errors="replace")
 
-        try:
-            return json.loads(cleaned)
-        except json.JSONDecodeError:
-            return []
+    def get_json(self, url: str, params: dict[str, Any] | None = None) -> Any:
+        return decode_json_bytes(self.get_bytes(url, params=params))
 
 
     # Debugging
@@ -88,4 +228,63 @@ class HttpClient:
     #         return json.loads(cleaned)
     #     except json.JSONDecodeError as e:
     #         snippet = cleaned[:300].replace("\n", " ")
-    #         raise ValueError(f"Invalid JSON from {url}. Snippet: {snippet}") from e
\ No newline at end of file
+    #         raise ValueError(f"Invalid JSON from {url}. Snippet: {snippet}") from e
+
+
+class AsyncHttpClient:
+    """asyncio counterpart of HttpClient (same config, same JSON leniency)."""
+
+    def __init__(
+        self, cfg: Optional[HttpConfig] = None, limiter: Optional[TokenBucketLimiter] = None
+    ):
+        self.cfg = cfg or HttpConfig()
+        self.limiter = limiter or self.cfg.make_limiter()
+        self.retry_budget = self.cfg.make_retry_budget()
+        self.cache = self.cfg.make_cache()
+        self.client = make_async_client(
+            http2=self.cfg.http2,
+            http2_max_connections=self.cfg.http2_max_connections,
+            http2_max_streams=self.cfg.http2_max_streams,
+            timeout=self.cfg.timeout_s,
+            follow_redirects=self.cfg.follow_redirects,
+            headers=_default_headers(self.cfg),
+        )
+
+    async def close(self) -> None:
+        await self.client.aclose()
+        if self.cache is not None:
+            self.cache.close()
+
+    def cache_stats(self) -> dict[str, int]:
+        return self.cache.stats() if self.cache is not None else {}
+
+    async def get_bytes(self, url: str, params: dict[str, Any] | None = None) -> bytes:
+        entry = None
+        if self.cache is not None:
+            key = self.cache.key_of(url, params)
+            entry = self.cache.get(key)
+            if entry is not None and self.cache.is_fresh(entry):
+                self.cache.hit(key)
+                return entry.body
+
+        await self.limiter.wait_async(domain_of(url))
+        resp = await request_with_retry_async(
+            self.client,
+            "GET",
+            url,
+            self.cfg.retry,
+            limiter=self.limiter,
+            budget=self.retry_budget,
+            params=params,
+            headers=ResponseCache.validators(entry),
+        )
+        if self.cache is not None:
+            return _cached_body(self.cache, key, entry, resp)
+        resp.raise_for_status()
+        return resp.content
+
+    async def get_text(self, url: str, params: dict[str, Any] | None = None) -> str:
+        return (await self.get_bytes(url, params=params)).decode("utf-8", errors="replace")
+
+    async def get_json(self, url: str, params: dict[str, Any] | None = None) -> Any:
+        return decode_json_bytes(await self.get_bytes(url, params=params))
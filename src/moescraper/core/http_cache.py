@@ -0,0 +1,156 @@
+from __future__ import annotations
+
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Optional
+from urllib.parse import urlencode
+
+
+@dataclass
+class CachedResponse:
+    body: bytes
+    etag: Optional[str]
+    last_modified: Optional[str]
+    stored_at: float
+
+
+class ResponseCache:
+    """Persistent cache for API GET bodies (SQLite), keyed by URL + params.
+
+    - entries younger than `ttl_s` are served without any request
+    - stale entries are revalidated with If-None-Match / If-Modified-Since
+      when the server sent an ETag / Last-Modified; a 304 refreshes them
+    - total body size is kept under `max_bytes` by evicting the least
+      recently used entries
+    - `stats()` counts fresh hits, 304 revalidations, misses and evictions
+    """
+
+    def __init__(self, path: Path, *, ttl_s: float = 3600.0, max_bytes: int = 256 * 1024 * 1024):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.ttl_s = ttl_s
+        self.max_bytes = max_bytes
+        self.lock = threading.RLock()
+        self.conn = sqlite3.connect(self.path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL;")
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS responses(
+                key TEXT PRIMARY KEY,
+                body BLOB,
+                etag TEXT,
+                last_modified TEXT,
+                stored_at REAL,
+                accessed_at REAL,
+                size INTEGER
+            );
+            """
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_accessed ON responses(accessed_at);")
+        self.conn.commit()
+        self._bytes = int(
+            self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses;").fetchone()[0]
+        )
+        self._stats = {"hits": 0, "revalidated": 0, "misses": 0, "stores": 0, "evictions": 0}
+
+    @staticmethod
+    def key_of(url: str, params: dict[str, Any] | None = None) -> str:
+        if not params:
+            return url
+        return url + "?" + urlencode(sorted((str(k), str(v)) for k, v in params.items()))
+
+    def close(self) -> None:
+        self.conn.close()
+
+    def get(self, key: str) -> Optional[CachedResponse]:
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT body, etag, last_modified, stored_at FROM responses WHERE key=?", (key,)
+            ).fetchone()
+        return None if row is None else CachedResponse(*row)
+
+    def is_fresh(self, entry: CachedResponse) -> bool:
+        return time.time() - entry.stored_at < self.ttl_s
+
+    @staticmethod
+    def validators(entry: Optional[CachedResponse]) -> dict[str, str]:
+        """Conditional request headers for a stale entry."""
+        headers: dict[str, str] = {}
+        if entry is None:
+            return headers
+        if entry.etag:
+            headers["If-None-Match"] = entry.etag
+        if entry.last_modified:
+            headers["If-Modified-Since"] = entry.last_modified
+        return headers
+
+    def hit(self, key: str) -> None:
+        """Fresh entry served from the cache."""
+        with self.lock:
+            self._stats["hits"] += 1
+            self.conn.execute("UPDATE responses SET accessed_at=? WHERE key=?", (time.time(), key))
+            self.conn.commit()
+
+    def revalidated(self, key: str) -> None:
+        """Server answered 304: the stored body is fresh again."""
+        with self.lock:
+            self._stats["revalidated"] += 1
+            now = time.time()
+            self.conn.execute(
+                "UPDATE responses SET stored_at=?, accessed_at=? WHERE key=?", (now, now, key)
+            )
+            self.conn.commit()
+
+    def miss(self) -> None:
+        with self.lock:
+            self._stats["misses"] += 1
+
+    def store(self, key: str, body: bytes, headers: Any) -> None:
+        size = len(body)
+        if size > self.max_bytes:
+            return
+        now = time.time()
+        with self.lock:
+            old = self.conn.execute("SELECT size FROM responses WHERE key=?", (key,)).fetchone()
+            if old is not None:
+                self._bytes -= int(old[0])
+            self.conn.execute(
+                """
+                INSERT OR REPLACE INTO responses
+                (key, body, etag, last_modified, stored_at, accessed_at, size)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                """,
+                (key, body, headers.get("ETag"), headers.get("Last-Modified"), now, now, size),
+            )
+            self._bytes += size
+            self._stats["stores"] += 1
+            self._evict()
+            self.conn.commit()
+
+    def _evict(self) -> None:
+        # Caller holds self.lock.
+        if self._bytes <= self.max_bytes:
+            return
+        cur = self.conn.execute("SELECT key, size FROM responses ORDER BY accessed_at;")
+        victims = []
+        for key, size in cur:
+            if self._bytes <= self.max_bytes:
+                break
+            victims.append((key,))
+            self._bytes -= int(size)
+        self.conn.executemany("DELETE FROM responses WHERE key=?", victims)
+        self._stats["evictions"] += len(victims)
+
+    def clear(self) -> None:
+        with self.lock:
+            self.conn.execute("DELETE FROM responses;")
+            self.conn.commit()
+            self._bytes = 0
+
+    def stats(self) -> dict[str, int]:
+        with self.lock:
+            n = int(self.conn.execute("SELECT COUNT(*) FROM responses;").fetchone()[0])
+            return {**self._stats, "entries": n, "bytes": self._bytes}
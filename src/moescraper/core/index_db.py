@@ -0,0 +1,885 @@
+from __future__ import annotations
+
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Iterable, Optional
+
+from moescraper.core.bloom import BloomFilter
+from moescraper.core.downloader import StorageLayout, target_path
+from moescraper.core.models import Post, Rating
+from moescraper.core.phash import HashIndex, from_signed, to_signed
+from moescraper.core.transform import TransformOutput
+from moescraper.core.writers import MetadataWriter
+
+
+class IndexDB:
+    """SQLite index of seen/downloaded posts.
+
+    The connection is shared by the scrape pipeline threads; every method
+    takes `self.lock` around its statements.
+
+    Downloaded keys are also kept in an in-memory Bloom filter (loaded at
+    open, updated on every mark), so already-downloaded posts can be dropped
+    without touching the filesystem; filter hits are confirmed by a primary
+    key lookup, so false positives never skip a post.
+
+    Tags are normalized: `tags(id, name)` holds each tag string once and
+    `post_tags(post_key, tag_id)` links it to `posts.id`, indexed both ways,
+    so per-tag counts and co-occurrence are index lookups instead of LIKE scans.
+
+    Files derived by the transform stage are kept in `outputs(post_key, kind, ...)`,
+    one row per kind ("main", "thumb").
+
+    `posts.phash` holds the perceptual hash of downloaded files (signed 64-bit);
+    posts dropped as near-duplicates keep theirs plus `dup_of` (the kept
+    post's id), and count as seen for `filter_new`.
+
+    `read_only=True` opens an existing index for queries only (`search_posts`,
+    `tag_count`, ...): nothing is created or migrated, and a missing file
+    raises FileNotFoundError instead of starting an empty index.
+    """
+
+    _BLOOM_MIN_CAPACITY = 100_000
+    _POST_COLUMNS = (
+        "key, source, post_id, md5, file_url, preview_url, rating, width, height, "
+        "tags, file_ext, local_path, downloaded, exported, dl_seq"
+    )
+
+    def __init__(self, path: Path, *, read_only: bool = False):
+        self.path = path
+        self.lock = threading.RLock()
+        self._tag_ids: dict[str, int] = {}
+        if read_only:
+            self._open_read_only()
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(self.path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL;")
+        # WAL + NORMAL stays consistent on crash; a larger page cache keeps the
+        # post_tags indexes hot during batched tag ingestion.
+        self.conn.execute("PRAGMA synchronous=NORMAL;")
+        self.conn.execute("PRAGMA cache_size=-65536;")
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS posts(
+                id INTEGER PRIMARY KEY,
+                key TEXT NOT NULL UNIQUE,
+                source TEXT,
+                post_id TEXT,
+                md5 TEXT,
+                file_url TEXT,
+                preview_url TEXT,
+                rating TEXT,
+                width INTEGER,
+                height INTEGER,
+                tags TEXT,
+                file_ext TEXT,
+                local_path TEXT,
+                downloaded INTEGER DEFAULT 0,
+                exported INTEGER DEFAULT 0,
+                dl_seq INTEGER,
+                file_size INTEGER,
+                phash INTEGER,
+                dup_of INTEGER
+            );
+            """
+        )
+        self.conn.execute("CREATE TABLE IF NOT EXISTS meta(k TEXT PRIMARY KEY, v INTEGER);")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS tags(id INTEGER PRIMARY KEY, name TEXT NOT NULL UNIQUE);"
+        )
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS post_tags(
+                post_key INTEGER NOT NULL,  -- posts.id
+                tag_id INTEGER NOT NULL,
+                PRIMARY KEY (post_key, tag_id)
+            ) WITHOUT ROWID;
+            """
+        )
+        self.conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_post_tags_tag ON post_tags(tag_id, post_key);"
+        )
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS outputs(
+                post_key INTEGER NOT NULL,  -- posts.id
+                kind TEXT NOT NULL,
+                path TEXT NOT NULL,
+                width INTEGER,
+                height INTEGER,
+                format TEXT,
+                PRIMARY KEY (post_key, kind)
+            ) WITHOUT ROWID;
+            """
+        )
+        self.conn.commit()
+        self._migrate_dl_seq()
+        self._migrate_post_ids()
+        self._migrate_file_size()
+        self._migrate_phash()
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_downloaded ON posts(downloaded);")
+        self.conn.commit()
+        self._ensure_fts()
+        self._migrate_tags()
+        self._load_counters()
+        self._load_known()
+
+    def _open_read_only(self) -> None:
+        if not self.path.is_file():
+            raise FileNotFoundError(f"Index database '{self.path}' does not exist")
+        uri = self.path.resolve().as_uri() + "?mode=ro"
+        self.conn = sqlite3.connect(uri, uri=True, check_same_thread=False)
+        names = {r[0] for r in self.conn.execute("SELECT name FROM sqlite_master;")}
+        if not {"posts", "tags", "post_tags"} <= names:
+            self.conn.close()
+            raise ValueError(
+                f"'{self.path}' is not an index database, or one from an older version "
+                "(open it once with read_only=False to upgrade it)"
+            )
+        self.has_fts = "posts_fts" in names
+
+    def _migrate_dl_seq(self) -> None:
+        """Databases from before the export cursor: number downloaded rows once
+        (already-exported rows first) and start the cursor after those."""
+        cols = {r[1] for r in self.conn.execute("PRAGMA table_info(posts);")}
+        if "dl_seq" not in cols:
+            self.conn.execute("ALTER TABLE posts ADD COLUMN dl_seq INTEGER;")
+            rows = self.conn.execute(
+                "SELECT rowid, exported FROM posts WHERE downloaded=1"
+                " ORDER BY exported DESC, rowid;"
+            ).fetchall()
+            self.conn.executemany(
+                "UPDATE posts SET dl_seq=? WHERE rowid=?",
+                [(i, rowid) for i, (rowid, _) in enumerate(rows, start=1)],
+            )
+            n_exported = sum(1 for _, exported in rows if exported)
+            self._set_meta("downloaded", len(rows))
+            self._set_meta("dl_seq", len(rows))
+            self._set_meta("export_cursor", n_exported)
+        self.conn.execute(
+            "CREATE UNIQUE INDEX IF NOT EXISTS idx_dl_seq ON posts(dl_seq)"
+            " WHERE dl_seq IS NOT NULL;"
+        )
+        self.conn.commit()
+
+    def _migrate_post_ids(self) -> None:
+        """Databases from before the tag tables: rebuild `posts` once with an
+        integer `id` (the old rowid) that `post_tags` can reference."""
+        cols = {r[1] for r in self.conn.execute("PRAGMA table_info(posts);")}
+        if "id" in cols:
+            return
+        self.conn.execute("DROP INDEX IF EXISTS idx_downloaded;")
+        self.conn.execute("DROP INDEX IF EXISTS idx_dl_seq;")
+        self.conn.execute("ALTER TABLE posts RENAME TO posts_old;")
+        self.conn.execute(
+            """
+            CREATE TABLE posts(
+                id INTEGER PRIMARY KEY,
+                key TEXT NOT NULL UNIQUE,
+                source TEXT,
+                post_id TEXT,
+                md5 TEXT,
+                file_url TEXT,
+                preview_url TEXT,
+                rating TEXT,
+                width INTEGER,
+                height INTEGER,
+                tags TEXT,
+                file_ext TEXT,
+                local_path TEXT,
+                downloaded INTEGER DEFAULT 0,
+                exported INTEGER DEFAULT 0,
+                dl_seq INTEGER
+            );
+            """
+        )
+        self.conn.execute(
+            f"INSERT INTO posts(id, {self._POST_COLUMNS}) "
+            f"SELECT rowid, {self._POST_COLUMNS} FROM posts_old ORDER BY rowid;"
+        )
+        self.conn.execute("DROP TABLE posts_old;")
+        self.conn.execute(
+            "CREATE UNIQUE INDEX IF NOT EXISTS idx_dl_seq ON posts(dl_seq)"
+            " WHERE dl_seq IS NOT NULL;"
+        )
+        self.conn.commit()
+
+    def _migrate_file_size(self) -> None:
+        cols = {r[1] for r in self.conn.execute("PRAGMA table_info(posts);")}
+        if "file_size" not in cols:
+            self.conn.execute("ALTER TABLE posts ADD COLUMN file_size INTEGER;")
+            self.conn.commit()
+
+    def _migrate_phash(self) -> None:
+        cols = {r[1] for r in self.conn.execute("PRAGMA table_info(posts);")}
+        for col in ("phash", "dup_of"):
+            if col not in cols:
+                self.conn.execute(f"ALTER TABLE posts ADD COLUMN {col} INTEGER;")
+        self.conn.commit()
+
+    def _migrate_tags(self) -> None:
+        """Move space-joined `posts.tags` strings into the tag tables (batched);
+        the text column is cleared afterwards and no longer written."""
+        while True:
+            rows = self.conn.execute(
+                "SELECT id, tags FROM posts WHERE tags IS NOT NULL LIMIT 10000;"
+            ).fetchall()
+            if not rows:
+                break
+            self._link_tags([(pid, tags.split()) for pid, tags in rows])
+            self.conn.executemany(
+                "UPDATE posts SET tags=NULL WHERE id=?", [(pid,) for pid, _ in rows]
+            )
+        self.conn.commit()
+
+    def _tag_ids_for(self, names: set[str]) -> dict[str, int]:
+        # Caller holds self.lock. Vocabulary ids are cached; unknown names are
+        # inserted in one batch and read back in chunks.
+        missing = [n for n in names if n not in self._tag_ids]
+        if missing:
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO tags(name) VALUES (?)", [(n,) for n in missing]
+            )
+            for i in range(0, len(missing), 500):
+                chunk = missing[i : i + 500]
+                cur = self.conn.execute(
+                    f"SELECT name, id FROM tags WHERE name IN ({','.join('?' * len(chunk))})", chunk
+                )
+                self._tag_ids.update(cur)
+        return self._tag_ids
+
+    def _ensure_fts(self) -> None:
+        """Full-text index over tag ids for local search (skipped when SQLite
+        lacks FTS5). Rows are `posts.id` -> "t<tag_id> ..." tokens; contentless
+        with detail=none, since only AND/NOT of single tokens is ever asked."""
+        existed = self.conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE name='posts_fts';"
+        ).fetchone() is not None
+        try:
+            self.conn.execute(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS posts_fts "
+                "USING fts5(tags, content='', detail=none, columnsize=0);"
+            )
+        except sqlite3.OperationalError:
+            self.has_fts = False
+            return
+        self.has_fts = True
+        if not existed:
+            self.conn.execute(
+                """
+                INSERT INTO posts_fts(rowid, tags)
+                SELECT post_key, group_concat('t' || tag_id, ' ') FROM post_tags GROUP BY post_key;
+                """
+            )
+        self.conn.commit()
+
+    @staticmethod
+    def _fts_tokens(tag_ids: set[int]) -> str:
+        return " ".join(f"t{i}" for i in sorted(tag_ids))
+
+    def _link_tags(self, rows: list[tuple[int, Iterable[str]]]) -> None:
+        # Caller holds self.lock; rows are (posts.id, tag names). Only links a
+        # post does not have yet are written, and its FTS row is replaced then.
+        ids = self._tag_ids_for({t for _, names in rows for t in names})
+        want: dict[int, set[int]] = {}
+        for pid, names in rows:
+            want.setdefault(pid, set()).update(ids[t] for t in names)
+
+        have: dict[int, set[int]] = {}
+        pids = list(want)
+        for i in range(0, len(pids), 500):
+            chunk = pids[i : i + 500]
+            marks = ",".join("?" * len(chunk))
+            cur = self.conn.execute(
+                f"SELECT post_key, tag_id FROM post_tags WHERE post_key IN ({marks})", chunk
+            )
+            for pid, tid in cur:
+                have.setdefault(pid, set()).add(tid)
+
+        links: list[tuple[int, int]] = []
+        fts_old: list[tuple[int, str]] = []
+        fts_new: list[tuple[int, str]] = []
+        for pid, tids in want.items():
+            old = have.get(pid, set())
+            added = tids - old
+            if not added:
+                continue
+            links.extend((pid, t) for t in added)
+            if old:
+                fts_old.append((pid, self._fts_tokens(old)))
+            fts_new.append((pid, self._fts_tokens(old | tids)))
+
+        self.conn.executemany(
+            "INSERT OR IGNORE INTO post_tags(post_key, tag_id) VALUES (?, ?)", links
+        )
+        if self.has_fts:
+            self.conn.executemany(
+                "INSERT INTO posts_fts(posts_fts, rowid, tags) VALUES ('delete', ?, ?)", fts_old
+            )
+            self.conn.executemany("INSERT INTO posts_fts(rowid, tags) VALUES (?, ?)", fts_new)
+
+    def _get_meta(self, k: str) -> int | None:
+        row = self.conn.execute("SELECT v FROM meta WHERE k=?", (k,)).fetchone()
+        return None if row is None else int(row[0])
+
+    def _set_meta(self, k: str, v: int) -> None:
+        self.conn.execute("INSERT OR REPLACE INTO meta(k, v) VALUES (?, ?)", (k, int(v)))
+
+    def _load_counters(self) -> None:
+        n = self._get_meta("downloaded")
+        if n is None:
+            # Fresh database, or one created by an older version without meta rows.
+            n = int(
+                self.conn.execute("SELECT COUNT(*) FROM posts WHERE downloaded=1;").fetchone()[0]
+            )
+            seq = int(
+                self.conn.execute("SELECT COALESCE(MAX(dl_seq), 0) FROM posts;").fetchone()[0]
+            )
+            self._set_meta("downloaded", n)
+            self._set_meta("dl_seq", seq)
+            self._set_meta("export_cursor", 0)
+            self.conn.commit()
+        self._n_downloaded = n
+        self._seq = self._get_meta("dl_seq") or 0
+        self._export_cursor = self._get_meta("export_cursor") or 0
+
+    def _load_known(self) -> None:
+        with self.lock:
+            # Sized from every key it holds, near-duplicates included: an
+            # undersized filter is full right after loading and rebuilt on every mark.
+            where = "downloaded=1 OR dup_of IS NOT NULL"
+            n = int(self.conn.execute(f"SELECT COUNT(*) FROM posts WHERE {where};").fetchone()[0])
+            self._known = BloomFilter(max(self._BLOOM_MIN_CAPACITY, n * 2))
+            cur = self.conn.execute(f"SELECT key FROM posts WHERE {where};")
+            while True:
+                rows = cur.fetchmany(10_000)
+                if not rows:
+                    break
+                self._known.update(r[0] for r in rows)
+
+    def _remember(self, keys: list[str]) -> None:
+        # Caller holds self.lock (and has committed the rows).
+        self._known.update(keys)
+        if self._known.full:
+            self._load_known()
+
+    def is_downloaded(self, key: str) -> bool:
+        with self.lock:
+            if key not in self._known:
+                return False
+            cur = self.conn.execute("SELECT 1 FROM posts WHERE key=? AND downloaded=1;", (key,))
+            return cur.fetchone() is not None
+
+    def filter_new(self, posts: list[Post]) -> list[Post]:
+        """Drop posts whose key is already downloaded, or was dropped as a near-duplicate
+        (in memory, no stat())."""
+        with self.lock:
+            maybe = {k for k in (self.key_of(p) for p in posts) if k in self._known}
+            confirmed: set[str] = set()
+            if maybe:
+                ks = list(maybe)
+                for i in range(0, len(ks), 500):
+                    chunk = ks[i : i + 500]
+                    cur = self.conn.execute(
+                        f"SELECT key FROM posts WHERE (downloaded=1 OR dup_of IS NOT NULL) "
+                        f"AND key IN ({','.join('?' * len(chunk))})",
+                        chunk,
+                    )
+                    confirmed.update(r[0] for r in cur)
+        if not confirmed:
+            return posts
+        return [p for p in posts if self.key_of(p) not in confirmed]
+
+    def close(self) -> None:
+        self.conn.close()
+
+    @staticmethod
+    def key_of(p: Post) -> str:
+        return p.md5 if p.md5 else f"{p.source}:{p.post_id}"
+
+    def count_downloaded(self) -> int:
+        """O(1): maintained as a running counter in the meta table."""
+        with self.lock:
+            return self._n_downloaded
+
+    def insert_posts(self, posts: list[Post]) -> None:
+        """Insert new posts and link their tags (one batch per call).
+
+        Posts already in the index keep their row; tags seen for them again
+        (e.g. the same md5 from another source) are added to their links.
+        """
+        rows = []
+        for p in posts:
+            rows.append(
+                (
+                    self.key_of(p),
+                    p.source,
+                    p.post_id,
+                    p.md5,
+                    p.file_url,
+                    p.preview_url,
+                    p.rating.value,
+                    p.width,
+                    p.height,
+                    p.file_ext,
+                    p.file_size,
+                )
+            )
+        with self.lock:
+            self.conn.executemany(
+                """
+                INSERT OR IGNORE INTO posts
+                (key, source, post_id, md5, file_url, preview_url, rating, width, height,
+                 file_ext, file_size)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                rows,
+            )
+            keys = list({r[0] for r in rows})
+            post_ids: dict[str, int] = {}
+            for i in range(0, len(keys), 500):
+                chunk = keys[i : i + 500]
+                cur = self.conn.execute(
+                    f"SELECT key, id FROM posts WHERE key IN ({','.join('?' * len(chunk))})", chunk
+                )
+                post_ids.update(cur)
+            self._link_tags([(post_ids[self.key_of(p)], p.tags) for p in posts if p.tags])
+            self.conn.commit()
+
+    def tag_count(self, name: str, *, downloaded_only: bool = True) -> int:
+        """Number of (downloaded) posts carrying tag `name`."""
+        sql = (
+            "SELECT COUNT(*) FROM post_tags pt JOIN tags t ON t.id = pt.tag_id"
+            + (
+                " JOIN posts p ON p.id = pt.post_key AND p.downloaded = 1"
+                if downloaded_only
+                else ""
+            )
+            + " WHERE t.name = ?"
+        )
+        with self.lock:
+            return int(self.conn.execute(sql, (name,)).fetchone()[0])
+
+    def tag_counts(
+        self, *, downloaded_only: bool = True, limit: int = 100
+    ) -> list[tuple[str, int]]:
+        """Most frequent tags as (name, count), highest first."""
+        sql = (
+            "SELECT t.name, c.n FROM ("
+            " SELECT pt.tag_id, COUNT(*) AS n FROM post_tags pt"
+            + (
+                " JOIN posts p ON p.id = pt.post_key AND p.downloaded = 1"
+                if downloaded_only
+                else ""
+            )
+            + " GROUP BY pt.tag_id ORDER BY n DESC LIMIT ?"
+            ") c JOIN tags t ON t.id = c.tag_id ORDER BY c.n DESC"
+        )
+        with self.lock:
+            return [(name, int(n)) for name, n in self.conn.execute(sql, (int(limit),))]
+
+    def cooccurring_tags(
+        self, name: str, *, downloaded_only: bool = True, limit: int = 50
+    ) -> list[tuple[str, int]]:
+        """Tags that appear together with `name`, as (name, shared posts), highest first."""
+        sql = (
+            "SELECT t.name, c.n FROM ("
+            " SELECT b.tag_id, COUNT(*) AS n"
+            " FROM post_tags a"
+            + (" JOIN posts p ON p.id = a.post_key AND p.downloaded = 1" if downloaded_only else "")
+            + " JOIN post_tags b ON b.post_key = a.post_key AND b.tag_id != a.tag_id"
+            " WHERE a.tag_id = (SELECT id FROM tags WHERE name = ?)"
+            " GROUP BY b.tag_id ORDER BY n DESC LIMIT ?"
+            ") c JOIN tags t ON t.id = c.tag_id ORDER BY c.n DESC"
+        )
+        with self.lock:
+            return [(t, int(n)) for t, n in self.conn.execute(sql, (name, int(limit)))]
+
+    def search_posts(
+        self,
+        include: list[str],
+        exclude: Iterable[str] = (),
+        *,
+        ratings: Optional[Iterable[str]] = None,
+        exclude_ratings: Iterable[str] = (),
+        sources: Optional[Iterable[str]] = None,
+        size: Iterable[tuple[str, str, int]] = (),
+        downloaded_only: bool = False,
+        before_id: Optional[int] = None,
+        offset: int = 0,
+        limit: int = 20,
+    ) -> list[tuple[int, Post]]:
+        """Posts matching all of `include` and none of `exclude`, newest id first.
+
+        - tag matching runs on the FTS index (EXISTS lookups on post_tags
+          when FTS5 is unavailable)
+        - `size` holds (column, op, value) filters, column "width"/"height"
+          and op one of = < <= > >=
+        - `before_id` pages by `posts.id` (keyset); `offset` by position
+        - returns (posts.id, Post) pairs; `posts.id` is the keyset cursor
+        """
+        with self.lock:
+            inc = [self._tag_id(t) for t in dict.fromkeys(include)]
+            if any(i is None for i in inc):
+                return []  # a required tag nobody has
+            exc = [i for i in (self._tag_id(t) for t in dict.fromkeys(exclude)) if i is not None]
+
+            where: list[str] = []
+            args: list = []
+            if inc and self.has_fts:
+                match = "(" + " AND ".join(f"t{i}" for i in inc) + ")"
+                match += "".join(f" NOT t{i}" for i in exc)
+                frm, pid = "posts_fts f JOIN posts p ON p.id = f.rowid", "f.rowid"
+                where.append("posts_fts MATCH ?")
+                args.append(match)
+            else:
+                frm, pid = "posts p", "p.id"
+                for i in inc:
+                    where.append(
+                        "EXISTS (SELECT 1 FROM post_tags x"
+                        " WHERE x.post_key = p.id AND x.tag_id = ?)"
+                    )
+                    args.append(i)
+                if exc:
+                    where.append(
+                        "NOT EXISTS (SELECT 1 FROM post_tags x WHERE x.post_key = p.id"
+                        f" AND x.tag_id IN ({','.join('?' * len(exc))}))"
+                    )
+                    args.extend(exc)
+
+            if ratings is not None:
+                rs = list(ratings)
+                where.append(f"p.rating IN ({','.join('?' * len(rs))})")
+                args.extend(rs)
+            xr = list(exclude_ratings)
+            if xr:
+                where.append(f"p.rating NOT IN ({','.join('?' * len(xr))})")
+                args.extend(xr)
+            if sources is not None:
+                ss = list(sources)
+                where.append(f"p.source IN ({','.join('?' * len(ss))})")
+                args.extend(ss)
+            for col, op, value in size:
+                if col not in ("width", "height") or op not in ("=", "<", "<=", ">", ">="):
+                    raise ValueError(f"Unsupported size filter: {col}{op}{value}")
+                where.append(f"p.{col} {op} ?")
+                args.append(int(value))
+            if downloaded_only:
+                where.append("p.downloaded = 1")
+            if before_id is not None:
+                where.append(f"{pid} < ?")
+                args.append(int(before_id))
+
+            sql = (
+                f"SELECT {pid}, p.source, p.post_id, p.file_url, p.preview_url, p.rating,"
+                " p.width, p.height, p.md5, p.file_ext, p.file_size,"
+                " (SELECT group_concat(t.name, ' ') FROM post_tags pt"
+                "  JOIN tags t ON t.id = pt.tag_id WHERE pt.post_key = p.id)"
+                f" FROM {frm}"
+                + (" WHERE " + " AND ".join(where) if where else "")
+                + f" ORDER BY {pid} DESC LIMIT ? OFFSET ?"
+            )
+            args.extend([int(limit), int(offset)])
+            rows = self.conn.execute(sql, args).fetchall()
+
+        out: list[tuple[int, Post]] = []
+        for row in rows:
+            row_id, source, post_id, file_url, preview_url, rating, w, h, md5, ext, size, tags = row
+            try:
+                r = Rating(rating)
+            except ValueError:
+                r = Rating.UNKNOWN
+            out.append(
+                (
+                    row_id,
+                    Post(
+                        source=source,
+                        post_id=post_id,
+                        file_url=file_url,
+                        preview_url=preview_url,
+                        tags=sorted(tags.split()) if tags else (),
+                        rating=r,
+                        width=w,
+                        height=h,
+                        md5=md5,
+                        file_ext=ext,
+                        file_size=size,
+                    ),
+                )
+            )
+        return out
+
+    def _tag_id(self, name: str) -> Optional[int]:
+        # Caller holds self.lock.
+        tid = self._tag_ids.get(name)
+        if tid is None:
+            row = self.conn.execute("SELECT id FROM tags WHERE name=?", (name,)).fetchone()
+            if row is not None:
+                tid = self._tag_ids[name] = int(row[0])
+        return tid
+
+    def mark_downloaded(
+        self, posts: list[Post], out_dir: Path, layout: StorageLayout = "flat"
+    ) -> None:
+        items = []
+        for p in self.filter_new(posts):
+            dst = target_path(p, out_dir, layout)
+            if dst is not None and dst.exists():
+                items.append((p, dst))
+        self.mark_downloaded_paths(items)
+
+    def mark_downloaded_paths(self, items: list[tuple[Post, Path]]) -> None:
+        """Like `mark_downloaded`, for callers that already know where each file landed.
+
+        Newly downloaded rows get the next `dl_seq`, which is what the export
+        cursor walks; the downloaded counter moves with them.
+        """
+        if not items:
+            return
+        with self.lock:
+            keys = []
+            for p, path in items:
+                key = self.key_of(p)
+                cur = self.conn.execute(
+                    "UPDATE posts SET downloaded=1, local_path=?, dl_seq=?"
+                    " WHERE key=? AND downloaded=0",
+                    (str(path), self._seq + 1, key),
+                )
+                if cur.rowcount:
+                    self._seq += 1
+                    self._n_downloaded += 1
+                else:
+                    self.conn.execute("UPDATE posts SET local_path=? WHERE key=?", (str(path), key))
+                keys.append(key)
+            self._set_meta("dl_seq", self._seq)
+            self._set_meta("downloaded", self._n_downloaded)
+            self.conn.commit()
+            self._remember(keys)
+
+    def record_outputs(self, items: list[tuple[Post, dict[str, TransformOutput]]]) -> None:
+        """Store the files the transform stage wrote for each post (replacing
+        earlier ones of the same kind). Posts must already be inserted."""
+        if not items:
+            return
+        with self.lock:
+            rows = []
+            for p, outputs in items:
+                row = self.conn.execute(
+                    "SELECT id FROM posts WHERE key=?", (self.key_of(p),)
+                ).fetchone()
+                if row is None:
+                    continue
+                rows.extend(
+                    (row[0], kind, str(o.path), o.width, o.height, o.format)
+                    for kind, o in outputs.items()
+                )
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO outputs(post_key, kind, path, width, height, format) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+            self.conn.commit()
+
+    def outputs_of(self, post: Post) -> dict[str, TransformOutput]:
+        with self.lock:
+            cur = self.conn.execute(
+                "SELECT o.kind, o.path, o.width, o.height, o.format "
+                "FROM outputs o JOIN posts ON posts.id = o.post_key WHERE posts.key=?",
+                (self.key_of(post),),
+            )
+            return {
+                kind: TransformOutput(path=Path(path), width=w, height=h, format=fmt)
+                for kind, path, w, h, fmt in cur
+            }
+
+    def ids_of(self, posts: list[Post]) -> dict[str, int]:
+        """`posts.id` by key, for posts already inserted."""
+        out: dict[str, int] = {}
+        keys = list({self.key_of(p) for p in posts})
+        with self.lock:
+            for i in range(0, len(keys), 500):
+                chunk = keys[i : i + 500]
+                cur = self.conn.execute(
+                    f"SELECT key, id FROM posts WHERE key IN ({','.join('?' * len(chunk))})", chunk
+                )
+                out.update(cur)
+        return out
+
+    def set_phashes(self, items: list[tuple[Post, int]]) -> None:
+        if not items:
+            return
+        with self.lock:
+            self.conn.executemany(
+                "UPDATE posts SET phash=? WHERE key=?",
+                [(to_signed(h), self.key_of(p)) for p, h in items],
+            )
+            self.conn.commit()
+
+    def mark_near_duplicates(self, items: list[tuple[Post, int, int]]) -> None:
+        """Record (post, phash, id of the kept post) for downloads dropped as near-duplicates."""
+        if not items:
+            return
+        with self.lock:
+            self.conn.executemany(
+                "UPDATE posts SET phash=?, dup_of=? WHERE key=?",
+                [(to_signed(h), kept, self.key_of(p)) for p, h, kept in items],
+            )
+            self.conn.commit()
+            self._remember([self.key_of(p) for p, _, _ in items])
+
+    def phash_index(self, max_distance: int = 4) -> HashIndex:
+        """HashIndex of the perceptual hashes of downloaded posts (values: `posts.id`)."""
+        with self.lock:
+            n = self.conn.execute(
+                "SELECT COUNT(*) FROM posts WHERE downloaded=1 AND phash IS NOT NULL;"
+            ).fetchone()[0]
+            index = HashIndex(max_distance, expected=max(n * 2, 1_000_000))
+            cur = self.conn.execute(
+                "SELECT id, phash FROM posts WHERE downloaded=1 AND phash IS NOT NULL;"
+            )
+            while True:
+                rows = cur.fetchmany(10_000)
+                if not rows:
+                    break
+                for pid, h in rows:
+                    index.add(from_signed(h), pid)
+        return index
+
+    _EXPORT_SELECT = """
+        SELECT dl_seq, source, post_id, file_url, preview_url, rating, width, height, md5, file_ext,
+               file_size,
+               (SELECT group_concat(t.name, ' ')
+                FROM post_tags pt JOIN tags t ON t.id = pt.tag_id
+                WHERE pt.post_key = posts.id),
+               local_path,
+               (SELECT group_concat(o.kind || '=' || o.path, char(10))
+                FROM outputs o WHERE o.post_key = posts.id),
+               phash
+        FROM posts
+    """
+
+    @staticmethod
+    def _export_record(row: tuple) -> dict:
+        (
+            _seq,
+            source,
+            post_id,
+            file_url,
+            preview_url,
+            rating,
+            width,
+            height,
+            md5,
+            file_ext,
+            file_size,
+            tags,
+            local_path,
+            outputs,
+            phash,
+        ) = row
+        return {
+            "source": source,
+            "post_id": post_id,
+            "file_url": file_url,
+            "preview_url": preview_url,
+            "rating": rating,
+            "width": width,
+            "height": height,
+            "md5": md5,
+            "file_ext": file_ext,
+            "file_size": file_size,
+            "tags": sorted(tags.split()) if tags else [],
+            "local_path": local_path,
+            "outputs": dict(o.split("=", 1) for o in outputs.split("\n")) if outputs else None,
+            "phash": from_signed(phash) if phash is not None else None,
+        }
+
+    def export_parquet(
+        self,
+        out_path: Path | str,
+        *,
+        partition_by: tuple[str, ...] = (),
+        row_group_size: int = 64_000,
+    ) -> int:
+        """Write every downloaded post to Parquet (see `write_parquet`); returns the row count.
+
+        Reads through its own connection (a WAL snapshot), in download order,
+        so a running scrape isn't blocked and memory stays at one row group.
+        Needs pyarrow.
+        """
+        from moescraper.core.parquet import write_parquet
+
+        conn = sqlite3.connect(self.path)
+        try:
+            cur = conn.execute(self._EXPORT_SELECT + " WHERE dl_seq > 0 ORDER BY dl_seq")
+            return write_parquet(
+                (self._export_record(row) for row in cur),
+                out_path,
+                partition_by=partition_by,
+                row_group_size=row_group_size,
+            )
+        finally:
+            conn.close()
+
+    @classmethod
+    def _jsonl_payload(cls, row: tuple) -> dict:
+        payload = cls._export_record(row)
+        if not payload["outputs"]:
+            del payload["outputs"]
+        if payload["phash"] is None:
+            del payload["phash"]
+        else:
+            payload["phash"] = f"{payload['phash']:016x}"
+        return payload
+
+    def export_jsonl(
+        self,
+        out_path: Path | str,
+        *,
+        max_records: Optional[int] = None,
+        max_bytes: Optional[int] = None,
+    ) -> list[Path]:
+        """Write every downloaded post to JSONL (`.gz` / `.zst` compress it); returns the files.
+
+        Streams rows from its own connection (a WAL snapshot), like
+        `export_parquet`; `max_records` / `max_bytes` rotate the output
+        (see `MetadataWriter`).
+        """
+        conn = sqlite3.connect(self.path)
+        try:
+            cur = conn.execute(self._EXPORT_SELECT + " WHERE dl_seq > 0 ORDER BY dl_seq")
+            with MetadataWriter(out_path, max_records=max_records, max_bytes=max_bytes) as w:
+                w.write_many(self._jsonl_payload(row) for row in cur)
+            return w.paths
+        finally:
+            conn.close()
+
+    def export_new_downloaded_to_jsonl(self, jsonl_path: Path) -> int:
+        with self.lock:
+            return self._export_new_downloaded_to_jsonl(jsonl_path)
+
+    def _export_new_downloaded_to_jsonl(self, jsonl_path: Path) -> int:
+        jsonl_path.parent.mkdir(parents=True, exist_ok=True)
+
+        if self._export_cursor >= self._seq:
+            return 0
+
+        # Rows downloaded since the last export, in download order (index range scan).
+        cur = self.conn.execute(
+            self._EXPORT_SELECT + " WHERE dl_seq > ? ORDER BY dl_seq", (self._export_cursor,)
+        )
+
+        last = self._export_cursor
+        # .jsonl, or .jsonl.gz / .jsonl.zst (appended as new gzip members / zstd frames)
+        with MetadataWriter(jsonl_path, append=True) as w:
+            for row in cur:
+                w.write(self._jsonl_payload(row))
+                last = row[0]
+        n = w.n_records
+
+        self._export_cursor = last
+        self._set_meta("export_cursor", last)
+        self.conn.commit()
+        return n
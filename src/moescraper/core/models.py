@@ -1,8 +1,10 @@
 from __future__ import annotations
 
-from dataclasses import dataclass, asdict
+import copy
+import sys
+from dataclasses import dataclass
 from enum import Enum
-from typing import Any, Optional
+from typing import Any, Iterable, Optional
 
 
 class Rating(str, Enum):
@@ -12,15 +14,29 @@ class Rating(str, Enum):
     UNKNOWN = "unknown"
 
 
-@dataclass(frozen=True)
+def intern_tags(tags: Iterable[str] | None) -> tuple[str, ...]:
+    """Tags as a tuple of interned strings (one copy of each tag per process)."""
+    if not tags:
+        return ()
+    return tuple(sys.intern(str(t)) for t in tags)
+
+
+@dataclass(frozen=True, slots=True)
 class Post:
+    """One search result.
+
+    Slotted and compact for long scrapes: `tags` is stored as a tuple of
+    interned strings (lists are converted), and `raw` (the API item) is only
+    kept when the adapter was asked to (`keep_raw`).
+    """
+
     source: str
     post_id: str
 
     file_url: Optional[str]
     preview_url: Optional[str]
 
-    tags: list[str]
+    tags: tuple[str, ...]
     rating: Rating
 
     width: Optional[int] = None
@@ -29,8 +45,29 @@ class Post:
     file_ext: Optional[str] = None
 
     raw: Optional[dict[str, Any]] = None
+    # Bytes, when the source reports it.
+    file_size: Optional[int] = None
+
+    def __post_init__(self) -> None:
+        object.__setattr__(self, "tags", intern_tags(self.tags))
 
-    def to_dict(self) -> dict[str, Any]:
-        d = asdict(self)
-        d["rating"] = self.rating.value
-        return d
\ No newline at end of file
+    def to_dict(self, *, copy_raw: bool = True) -> dict[str, Any]:
+        # Same shape as the old asdict() output: tags as a list, rating as its value.
+        # copy_raw=False shares `raw` (fine when the dict is only serialized).
+        raw = self.raw
+        if copy_raw and raw is not None:
+            raw = copy.deepcopy(raw)
+        return {
+            "source": self.source,
+            "post_id": self.post_id,
+            "file_url": self.file_url,
+            "preview_url": self.preview_url,
+            "tags": list(self.tags),
+            "rating": self.rating.value,
+            "width": self.width,
+            "height": self.height,
+            "md5": self.md5,
+            "file_ext": self.file_ext,
+            "file_size": self.file_size,
+            "raw": raw,
+        }
@@ -0,0 +1,167 @@
+from __future__ import annotations
+
+import os
+import shutil
+from pathlib import Path
+from typing import Any, Iterable, Sequence
+from urllib.parse import quote
+
+from .models import Post
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # optional: pip install pyarrow
+    pa = pq = None
+
+_HIVE_NULL = "__HIVE_DEFAULT_PARTITION__"
+
+
+def _schema():
+    cat = pa.dictionary(pa.int32(), pa.string())
+    return pa.schema(
+        [
+            ("source", cat),
+            ("post_id", pa.string()),
+            ("file_url", pa.string()),
+            ("preview_url", pa.string()),
+            ("rating", cat),
+            ("width", pa.int32()),
+            ("height", pa.int32()),
+            ("md5", pa.string()),
+            ("file_ext", cat),
+            ("file_size", pa.int64()),
+            ("tags", pa.list_(cat)),
+            ("local_path", pa.string()),
+            ("outputs", pa.map_(pa.string(), pa.string())),
+            ("phash", pa.uint64()),
+        ]
+    )
+
+
+def post_record(p: Post) -> dict[str, Any]:
+    """Parquet row of a Post (no `raw`, nothing copied)."""
+    return {
+        "source": p.source,
+        "post_id": p.post_id,
+        "file_url": p.file_url,
+        "preview_url": p.preview_url,
+        "rating": p.rating.value,
+        "width": p.width,
+        "height": p.height,
+        "md5": p.md5,
+        "file_ext": p.file_ext,
+        "file_size": p.file_size,
+        "tags": p.tags,
+    }
+
+
+def _column(rows: list[dict], field):
+    name, typ = field.name, field.type
+    if name == "tags":
+        # One dictionary per row group: each tag string is stored once.
+        offsets = [0]
+        flat: list[str] = []
+        for r in rows:
+            flat.extend(r.get("tags") or ())
+            offsets.append(len(flat))
+        values = pa.array(flat, type=pa.string()).dictionary_encode()
+        return pa.ListArray.from_arrays(pa.array(offsets, type=pa.int32()), values)
+    values = [r.get(name) for r in rows]
+    if name == "outputs":
+        values = [list(v.items()) if v else None for v in values]
+    if pa.types.is_dictionary(typ):
+        return pa.array(values, type=pa.string()).dictionary_encode()
+    return pa.array(values, type=typ)
+
+
+class _PartWriter:
+    def __init__(self, path: Path, schema, row_group_size: int, compression: str):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.schema = schema
+        self.row_group_size = row_group_size
+        self.rows: list[dict] = []
+        self.w = pq.ParquetWriter(path, schema, compression=compression)
+
+    def add(self, row: dict) -> None:
+        self.rows.append(row)
+        if len(self.rows) >= self.row_group_size:
+            self.flush()
+
+    def flush(self) -> None:
+        if not self.rows:
+            return
+        cols = [_column(self.rows, f) for f in self.schema]
+        self.w.write_table(pa.Table.from_arrays(cols, schema=self.schema))
+        self.rows = []
+
+    def close(self) -> None:
+        self.flush()
+        self.w.close()
+
+
+def write_parquet(
+    records: Iterable[dict[str, Any] | Post],
+    out_path: str | Path,
+    *,
+    partition_by: Sequence[str] = (),
+    row_group_size: int = 64_000,
+    compression: str = "zstd",
+) -> int:
+    """Stream records (Posts or export rows) into Parquet; returns the row count.
+
+    - rows are buffered and written `row_group_size` at a time (memory stays flat)
+    - tags are a list of dictionary-encoded strings; source / rating /
+      file_ext are dictionary columns too
+    - with `partition_by` (e.g. ("source", "rating")), `out_path` is a
+      directory in Hive layout (`source=danbooru/rating=safe/part-0.parquet`)
+      that pyarrow / polars / duckdb read as one dataset and prune by
+      those columns
+    - written under `<out_path>.part` and renamed when complete
+
+    Needs pyarrow.
+    """
+    if pa is None:
+        raise RuntimeError("pyarrow is required for Parquet export: pip install pyarrow")
+    out_path = Path(out_path)
+    schema = _schema()
+    for col in partition_by:
+        if col not in schema.names:
+            raise ValueError(f"Unknown partition column '{col}'")
+    file_schema = pa.schema([f for f in schema if f.name not in partition_by])
+
+    tmp = out_path.with_name(out_path.name + ".part")
+    if tmp.is_dir():
+        shutil.rmtree(tmp)
+    writers: dict[tuple, _PartWriter] = {}
+    n = 0
+    try:
+        for rec in records:
+            row = post_record(rec) if isinstance(rec, Post) else rec
+            key = tuple(row.get(c) for c in partition_by)
+            w = writers.get(key)
+            if w is None:
+                if partition_by:
+                    parts = [
+                        f"{c}={_HIVE_NULL if v is None else quote(str(v), safe='')}"
+                        for c, v in zip(partition_by, key)
+                    ]
+                    path = tmp.joinpath(*parts, "part-0.parquet")
+                else:
+                    path = tmp
+                w = writers[key] = _PartWriter(path, file_schema, row_group_size, compression)
+            w.add(row)
+            n += 1
+        if not writers and not partition_by:
+            # Still write an (empty) file with the schema.
+            writers[()] = _PartWriter(tmp, file_schema, row_group_size, compression)
+    finally:
+        for w in writers.values():
+            w.close()
+
+    if partition_by:
+        tmp.mkdir(parents=True, exist_ok=True)
+        if out_path.is_dir():
+            shutil.rmtree(out_path)
+    os.replace(tmp, out_path)
+    return n
@@ -0,0 +1,165 @@
+from __future__ import annotations
+
+import math
+from array import array
+from functools import lru_cache
+from itertools import combinations
+from pathlib import Path
+from typing import Iterable, Optional
+
+from .postprocess import _PIL_OK
+
+if _PIL_OK:
+    from PIL import Image
+
+HASH_BITS = 64
+
+_N = 32  # pHash input side
+_K = 8  # low-frequency block kept from the DCT
+# DCT-II basis for the first _K frequencies (scale doesn't matter: bits are
+# taken against the median).
+_COS = [[math.cos(math.pi / _N * (n + 0.5) * k) for n in range(_N)] for k in range(_K)]
+
+
+def phash(im) -> int:
+    """64-bit DCT perceptual hash of a PIL image (same scheme as `imagehash.phash`).
+
+    Survives resizing, recompression and small edits; compare with `hamming`.
+    """
+    px = im.convert("L").resize((_N, _N), Image.Resampling.LANCZOS).tobytes()
+    # Separable DCT, only the 8x8 low frequencies: rows first, then columns.
+    rows = [
+        [sum(c * v for c, v in zip(ck, px[i : i + _N])) for ck in _COS]
+        for i in range(0, _N * _N, _N)
+    ]
+    coeffs = [sum(c * v for c, v in zip(ck, col)) for ck in _COS for col in zip(*rows)]
+    med = sorted(coeffs)[len(coeffs) // 2 - 1 : len(coeffs) // 2 + 1]
+    median = (med[0] + med[1]) / 2
+    h = 0
+    for c in coeffs:
+        h = (h << 1) | (c > median)
+    return h
+
+
+def dhash(im) -> int:
+    """64-bit difference hash of a PIL image: cheaper than `phash`, less robust to edits."""
+    px = im.convert("L").resize((_K + 1, _K), Image.Resampling.LANCZOS).tobytes()
+    h = 0
+    for y in range(_K):
+        row = px[y * (_K + 1) : (y + 1) * (_K + 1)]
+        for x in range(_K):
+            h = (h << 1) | (row[x + 1] > row[x])
+    return h
+
+
+def image_phash(path: Path | str) -> int:
+    """`phash` of an image file, decoded at reduced scale where the format allows it."""
+    with Image.open(path) as im:
+        if im.format in ("JPEG", "MPO"):
+            im.draft("L", (_N, _N))
+        im.seek(0)
+        return phash(im)
+
+
+def hamming(a: int, b: int) -> int:
+    return (a ^ b).bit_count()
+
+
+def to_signed(h: int) -> int:
+    """64-bit hash as a signed int (what SQLite INTEGER can store)."""
+    return h - (1 << 64) if h >= 1 << 63 else h
+
+
+def from_signed(v: int) -> int:
+    return v + (1 << 64) if v < 0 else v
+
+
+@lru_cache(maxsize=64)
+def _flip_masks(width: int, radius: int) -> tuple[int, ...]:
+    # Every mask of `width` bits with at most `radius` bits set, fewest first.
+    return tuple(
+        sum(1 << b for b in bits)
+        for r in range(radius + 1)
+        for bits in combinations(range(width), r)
+    )
+
+
+class HashIndex:
+    """Hamming-radius lookups over 64-bit hashes without pairwise comparison.
+
+    Multi-index hashing: each hash is cut into m blocks and filed under every
+    block value. Two hashes within k bits differ in at most k // m bits of
+    some block (pigeonhole), so a query probes, per block, the buckets of
+    the values within that many bits, and only checks those candidates,
+    instead of walking every stored hash (or a BK-tree, node by node).
+
+    - blocks are sized from `expected` (about log2(n) bits, so buckets stay
+      small as the index grows to millions)
+    - values are ints (e.g. `posts.id`); storage is compact (`array`)
+    - practical up to a radius of ~12 bits of 64
+    """
+
+    def __init__(self, max_distance: int = 4, *, expected: int = 1_000_000):
+        if not 0 <= max_distance < HASH_BITS:
+            raise ValueError(f"max_distance must be in [0, {HASH_BITS})")
+        self.max_distance = int(max_distance)
+        block_bits = min(32, max(12, int(math.log2(max(2, expected)))))
+        m = max(1, min(self.max_distance + 1, HASH_BITS // block_bits))
+        self._blocks: list[tuple[int, int, int]] = []  # (shift, mask, width)
+        shift = HASH_BITS
+        for i in range(m):
+            width = HASH_BITS // m + (1 if i < HASH_BITS % m else 0)
+            shift -= width
+            self._blocks.append((shift, (1 << width) - 1, width))
+        self._tables: list[dict[int, array]] = [{} for _ in range(m)]
+        self._hashes = array("Q")
+        self._values = array("q")
+
+    def __len__(self) -> int:
+        return len(self._hashes)
+
+    def add(self, h: int, value: int = -1) -> None:
+        pos = len(self._hashes)
+        self._hashes.append(h)
+        self._values.append(value)
+        for (shift, mask, _), table in zip(self._blocks, self._tables):
+            sub = (h >> shift) & mask
+            bucket = table.get(sub)
+            if bucket is None:
+                table[sub] = array("I", (pos,))
+            else:
+                bucket.append(pos)
+
+    def add_many(self, items: Iterable[tuple[int, int]]) -> None:
+        for h, value in items:
+            self.add(h, value)
+
+    def query(self, h: int, max_distance: Optional[int] = None) -> list[tuple[int, int]]:
+        """(distance, value) of every stored hash within `max_distance`, closest first."""
+        k = self.max_distance if max_distance is None else int(max_distance)
+        if k > self.max_distance:
+            raise ValueError(f"index was built for max_distance <= {self.max_distance}")
+        radius = k // len(self._blocks)
+        hashes = self._hashes
+        seen: set[int] = set()
+        out: list[tuple[int, int]] = []
+        for (shift, mask, width), table in zip(self._blocks, self._tables):
+            sub = (h >> shift) & mask
+            for flip in _flip_masks(width, radius):
+                bucket = table.get(sub ^ flip)
+                if bucket is None:
+                    continue
+                for pos in bucket:
+                    if pos in seen:
+                        continue
+                    seen.add(pos)
+                    d = (hashes[pos] ^ h).bit_count()
+                    if d <= k:
+                        out.append((d, self._values[pos]))
+        out.sort()
+        return out
+
+    def nearest(self, h: int) -> Optional[tuple[int, int]]:
+        """(distance, value) of the closest stored hash within `max_distance`, or None."""
+        found = self.query(h)
+        return found[0] if found else None
@@ -0,0 +1,171 @@
+from __future__ import annotations
+
+import asyncio
+import multiprocessing
+import os
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from pathlib import Path
+from typing import Any, Callable, Optional
+
+try:
+    from PIL import Image
+
+    _PIL_OK = True
+except Exception:  # pragma: no cover
+    Image = None  # type: ignore
+    _PIL_OK = False
+
+
+_PNG_SIG = b"\x89PNG\r\n\x1a\n"
+
+
+class ApngSniffer:
+    """Spots an animated PNG while it streams in.
+
+    Feed the bytes in order; PNG chunk headers are followed (chunk bodies are
+    skipped, nothing is buffered beyond one header) until `IDAT`. An `acTL`
+    chunk before it means APNG. Non-PNG data stops the sniffer at once.
+    """
+
+    __slots__ = ("animated", "done", "_buf", "_skip", "_sig")
+
+    def __init__(self) -> None:
+        self.animated = False
+        self.done = False
+        self._buf = b""
+        self._skip = 0
+        self._sig = False
+
+    def feed(self, chunk: bytes) -> None:
+        if self.done:
+            return
+        if self._skip >= len(chunk):
+            self._skip -= len(chunk)
+            return
+        buf = self._buf + chunk[self._skip :] if self._buf else chunk[self._skip :]
+        self._skip = 0
+        i = 0
+        if not self._sig:
+            if len(buf) < 8:
+                self._buf = buf
+                return
+            if buf[:8] != _PNG_SIG:
+                self.done = True
+                return
+            self._sig = True
+            i = 8
+        while len(buf) - i >= 8:
+            ctype = buf[i + 4 : i + 8]
+            if ctype == b"acTL":
+                self.animated = True
+                self.done = True
+                return
+            if ctype == b"IDAT":
+                self.done = True
+                return
+            i += 12 + int.from_bytes(buf[i : i + 4], "big")
+        if i > len(buf):
+            self._skip = i - len(buf)
+            self._buf = b""
+        else:
+            self._buf = buf[i:]
+
+
+def freeze_apng_inplace(path: Path | str) -> bool:
+    """If the file is an animated PNG (APNG), rewrite it as a still PNG.
+
+    Returns True when a conversion happened.
+    """
+    if not _PIL_OK:
+        return False
+    path = Path(path)
+    try:
+        with Image.open(path) as im:  # type: ignore[misc]
+            is_anim = bool(getattr(im, "is_animated", False))
+            n_frames = int(getattr(im, "n_frames", 1))
+            if not (is_anim and n_frames > 1):
+                return False
+
+            try:
+                im.seek(0)
+            except Exception:
+                pass
+
+            still = im.convert("RGBA") if im.mode not in ("RGB", "RGBA") else im
+
+            tmp = path.with_suffix(path.suffix + ".still.part")
+            still.save(tmp, format="PNG")
+            os.replace(tmp, path)
+            return True
+    except Exception:
+        # Jangan bikin gagal download hanya karena post-process.
+        return False
+
+
+def _mp_context():
+    # Never plain fork: the pool starts from a download thread while other
+    # threads (and their locks, httpx pools) are live, and a forked child can
+    # deadlock on a lock held at fork time. forkserver forks from a clean,
+    # single-threaded server process; spawn where that doesn't exist (Windows).
+    methods = multiprocessing.get_all_start_methods()
+    if "forkserver" in methods:
+        ctx = multiprocessing.get_context("forkserver")
+        # Workers then start with Pillow and the job functions already imported.
+        ctx.set_forkserver_preload(["moescraper.core.transform"])
+        return ctx
+    return multiprocessing.get_context("spawn")
+
+
+class PostProcessor:
+    """Bounded process pool for CPU-heavy work on downloaded files.
+
+    - decoding / re-encoding runs in `max_workers` processes, so it neither
+      holds the GIL of the download threads nor stalls their I/O
+    - at most `max_pending` jobs are queued or running; `submit` blocks past
+      that, which slows the downloads down instead of piling up work
+    - processes are started on first use, with forkserver (spawn on
+      Windows), so like any multiprocessing code a script that downloads
+      needs an `if __name__ == "__main__":` guard around its entry point
+    """
+
+    def __init__(self, max_workers: Optional[int] = None, max_pending: Optional[int] = None):
+        self.max_workers = max(1, int(max_workers or min(4, os.cpu_count() or 1)))
+        self.max_pending = max(1, int(max_pending or self.max_workers * 2))
+        self._slots = threading.BoundedSemaphore(self.max_pending)
+        self._lock = threading.Lock()
+        self._pool: Optional[ProcessPoolExecutor] = None
+
+    def _executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(self.max_workers, mp_context=_mp_context())
+            return self._pool
+
+    def submit(self, fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Future:
+        """Run `fn(*args, **kwargs)` in a worker process (`fn` must be picklable)."""
+        self._slots.acquire()
+        try:
+            fut = self._executor().submit(fn, *args, **kwargs)
+        except BaseException:
+            self._slots.release()
+            raise
+        fut.add_done_callback(lambda _: self._slots.release())
+        return fut
+
+    async def run(self, fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        """asyncio version of `submit(...).result()`; waits for a slot off the event loop."""
+        fut = await asyncio.to_thread(self.submit, fn, *args, **kwargs)
+        return await asyncio.wrap_future(fut)
+
+    def close(self) -> None:
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=True)
+
+    def __enter__(self) -> "PostProcessor":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
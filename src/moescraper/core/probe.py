@@ -0,0 +1,258 @@
+from __future__ import annotations
+
+import asyncio
+import dataclasses
+from concurrent.futures import Executor, ThreadPoolExecutor
+from typing import Callable, Iterable, Mapping, Optional
+
+import httpx
+
+from .downloader import _default_referer_for
+from .models import Post
+from .rate_limit import TokenBucketLimiter
+from .transport import SyncClient
+from .utils import domain_of
+
+# First range fetched per image; enough for PNG/GIF/WebP and most JPEGs.
+PROBE_BYTES = 16 * 1024
+# JPEGs with a big EXIF/ICC block before the frame header get one more range, up to this.
+MAX_PROBE_BYTES = 128 * 1024
+
+
+def _jpeg_size(d: bytes) -> Optional[tuple[int, int]]:
+    i = 2
+    n = len(d)
+    while i + 9 <= n:
+        if d[i] != 0xFF:
+            return None
+        marker = d[i + 1]
+        if marker == 0xFF:  # fill byte
+            i += 1
+            continue
+        if marker == 0x01 or 0xD0 <= marker <= 0xD8:  # no length
+            i += 2
+            continue
+        # SOF0..SOF15 carry the frame size (C4 DHT, C8 JPG, CC DAC don't).
+        if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+            h = int.from_bytes(d[i + 5 : i + 7], "big")
+            w = int.from_bytes(d[i + 7 : i + 9], "big")
+            return (w, h) if w and h else None
+        i += 2 + int.from_bytes(d[i + 2 : i + 4], "big")
+    return None
+
+
+def _webp_size(d: bytes) -> Optional[tuple[int, int]]:
+    chunk = d[12:16]
+    if chunk == b"VP8 " and len(d) >= 30 and d[23:26] == b"\x9d\x01\x2a":
+        w = int.from_bytes(d[26:28], "little") & 0x3FFF
+        h = int.from_bytes(d[28:30], "little") & 0x3FFF
+        return w, h
+    if chunk == b"VP8L" and len(d) >= 25 and d[20] == 0x2F:
+        bits = int.from_bytes(d[21:25], "little")
+        return (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1
+    if chunk == b"VP8X" and len(d) >= 30:
+        return int.from_bytes(d[24:27], "little") + 1, int.from_bytes(d[27:30], "little") + 1
+    return None
+
+
+def image_size(data: bytes) -> Optional[tuple[int, int]]:
+    """(width, height) from the first bytes of a JPEG, PNG, GIF or WebP file.
+
+    None when the format is unknown or the header is not complete yet.
+    """
+    if data[:8] == b"\x89PNG\r\n\x1a\n":
+        if len(data) >= 24 and data[12:16] == b"IHDR":
+            return int.from_bytes(data[16:20], "big"), int.from_bytes(data[20:24], "big")
+        return None
+    if data[:6] in (b"GIF87a", b"GIF89a"):
+        if len(data) >= 10:
+            return int.from_bytes(data[6:8], "little"), int.from_bytes(data[8:10], "little")
+        return None
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return _webp_size(data)
+    if data[:2] == b"\xff\xd8":
+        return _jpeg_size(data)
+    return None
+
+
+def _is_jpeg(data: bytes) -> bool:
+    return data[:2] == b"\xff\xd8"
+
+
+def total_size(status: int, headers: Mapping[str, str]) -> Optional[int]:
+    """Full file size: the total of Content-Range on a 206, Content-Length on a 200."""
+    if status == 206:
+        total = headers.get("Content-Range", "").rpartition("/")[2].strip()
+        return int(total) if total.isdigit() else None
+    length = headers.get("Content-Length", "")
+    return int(length) if status == 200 and length.isdigit() else None
+
+
+def _probed(post: Post, head: bytes, size: Optional[int]) -> Post:
+    dims = image_size(head)
+    changes: dict = {}
+    if dims is not None and (post.width is None or post.height is None):
+        changes["width"], changes["height"] = dims
+    if size is not None and post.file_size is None:
+        changes["file_size"] = size
+    return dataclasses.replace(post, **changes) if changes else post
+
+
+def _range_get(
+    client: SyncClient, limiter: TokenBucketLimiter, url: str, start: int, end: int
+) -> tuple[int, Mapping[str, str], bytes]:
+    limiter.wait(domain_of(url))
+    headers = {"Referer": _default_referer_for(url), "Range": f"bytes={start}-{end - 1}"}
+    buf = bytearray()
+    with client.stream("GET", url, headers=headers) as r:
+        r.raise_for_status()
+        # A server that ignores Range sends the whole file: stop reading early.
+        for chunk in r.iter_bytes():
+            buf += chunk
+            if len(buf) >= end - start:
+                break
+        return r.status_code, r.headers, bytes(buf[: end - start])
+
+
+def probe_post(
+    client: SyncClient,
+    post: Post,
+    *,
+    limiter: TokenBucketLimiter,
+    probe_bytes: int = PROBE_BYTES,
+    max_probe_bytes: int = MAX_PROBE_BYTES,
+) -> Post:
+    """`post` with width/height/file_size filled from a ranged GET of its first bytes.
+
+    Fields the source already reported are kept; on any error the post is
+    returned unchanged (so the usual unknown-size rules apply).
+    """
+    if not post.file_url:
+        return post
+    url = post.file_url
+    try:
+        status, headers, head = _range_get(client, limiter, url, 0, probe_bytes)
+        size = total_size(status, headers)
+        if (
+            status == 206
+            and image_size(head) is None
+            and _is_jpeg(head)
+            and len(head) == probe_bytes
+            and (size is None or size > probe_bytes)
+        ):
+            try:
+                st, _, more = _range_get(client, limiter, url, probe_bytes, max_probe_bytes)
+                if st == 206:  # a 200 would be the file from byte 0 again
+                    head += more
+            except httpx.HTTPError:
+                pass
+    except (httpx.HTTPError, ValueError):
+        return post
+    return _probed(post, head, size)
+
+
+def probe_posts(
+    client: SyncClient,
+    posts: Iterable[Post],
+    *,
+    limiter: TokenBucketLimiter,
+    only: Optional[Callable[[Post], bool]] = None,
+    executor: Optional[Executor] = None,
+    max_workers: int = 8,
+    probe_bytes: int = PROBE_BYTES,
+) -> list[Post]:
+    """Probe posts concurrently; returns them in order (probed ones replaced).
+
+    `only` selects which posts need a probe (e.g. `FilterSpec.undecided`).
+    Pass a long-lived `executor` to reuse threads across batches.
+    """
+    posts = list(posts)
+    todo = [i for i, p in enumerate(posts) if p.file_url and (only is None or only(p))]
+    if not todo:
+        return posts
+
+    def _one(i: int) -> Post:
+        return probe_post(client, posts[i], limiter=limiter, probe_bytes=probe_bytes)
+
+    if executor is not None:
+        results = list(executor.map(_one, todo))
+    else:
+        with ThreadPoolExecutor(max_workers=max(1, min(int(max_workers), len(todo)))) as ex:
+            results = list(ex.map(_one, todo))
+    for i, p in zip(todo, results):
+        posts[i] = p
+    return posts
+
+
+async def _range_get_async(
+    client: httpx.AsyncClient, limiter: TokenBucketLimiter, url: str, start: int, end: int
+) -> tuple[int, Mapping[str, str], bytes]:
+    await limiter.wait_async(domain_of(url))
+    headers = {"Referer": _default_referer_for(url), "Range": f"bytes={start}-{end - 1}"}
+    buf = bytearray()
+    async with client.stream("GET", url, headers=headers) as r:
+        r.raise_for_status()
+        async for chunk in r.aiter_bytes():
+            buf += chunk
+            if len(buf) >= end - start:
+                break
+        return r.status_code, r.headers, bytes(buf[: end - start])
+
+
+async def probe_post_async(
+    client: httpx.AsyncClient,
+    post: Post,
+    *,
+    limiter: TokenBucketLimiter,
+    probe_bytes: int = PROBE_BYTES,
+    max_probe_bytes: int = MAX_PROBE_BYTES,
+) -> Post:
+    """asyncio version of `probe_post`."""
+    if not post.file_url:
+        return post
+    url = post.file_url
+    try:
+        status, headers, head = await _range_get_async(client, limiter, url, 0, probe_bytes)
+        size = total_size(status, headers)
+        if (
+            status == 206
+            and image_size(head) is None
+            and _is_jpeg(head)
+            and len(head) == probe_bytes
+            and (size is None or size > probe_bytes)
+        ):
+            try:
+                st, _, more = await _range_get_async(
+                    client, limiter, url, probe_bytes, max_probe_bytes
+                )
+                if st == 206:
+                    head += more
+            except httpx.HTTPError:
+                pass
+    except (httpx.HTTPError, ValueError):
+        return post
+    return _probed(post, head, size)
+
+
+async def probe_posts_async(
+    client: httpx.AsyncClient,
+    posts: Iterable[Post],
+    *,
+    limiter: TokenBucketLimiter,
+    only: Optional[Callable[[Post], bool]] = None,
+    max_concurrency: int = 16,
+    probe_bytes: int = PROBE_BYTES,
+) -> list[Post]:
+    """asyncio version of `probe_posts` (`max_concurrency` probes in flight)."""
+    posts = list(posts)
+    todo = [i for i, p in enumerate(posts) if p.file_url and (only is None or only(p))]
+    sem = asyncio.Semaphore(max(1, int(max_concurrency)))
+
+    async def _one(i: int) -> None:
+        async with sem:
+            posts[i] = await probe_post_async(
+                client, posts[i], limiter=limiter, probe_bytes=probe_bytes
+            )
+
+    await asyncio.gather(*(_one(i) for i in todo))
+    return posts
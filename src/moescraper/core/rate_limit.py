@@ -1,23 +1,206 @@
 from __future__ import annotations
 
+import asyncio
 import random
+import threading
 import time
 from dataclasses import dataclass, field
+from typing import Optional
 
 
 @dataclass
 class RateLimiter:
+    """Fixed minimum interval per domain (kept for backward compat).
+
+    Slots are reserved under a lock, so concurrent threads queue up one
+    interval apart instead of all sleeping the same amount and bursting.
+    """
+
     min_interval_s: float = 0.8
     jitter_s: float = 0.2
-    _last_time: dict[str, float] = field(default_factory=dict)
+    _next_time: dict[str, float] = field(default_factory=dict)
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
 
     def wait(self, domain: str) -> None:
-        now = time.time()
-        last = self._last_time.get(domain, 0.0)
-        elapsed = now - last
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_time.get(domain, 0.0))
+            self._next_time[domain] = slot + self.min_interval_s + random.random() * self.jitter_s
+        if slot > now:
+            time.sleep(slot - now)
+
+
+@dataclass(frozen=True)
+class RateProfile:
+    """Token-bucket budget: `rate` requests/second on average, bursts up to `burst`."""
+
+    rate: float = 1.25
+    burst: int = 1
+
+
+@dataclass
+class _Bucket:
+    profile: RateProfile
+    tokens: float
+    updated: float
+    # Effective rate; lowered by `throttle()` and raised back by `recover()`.
+    rate: float = 0.0
+    successes: int = 0
+    throttles: int = 0
+    requests: int = 0
+    waited: int = 0
+    wait_s: float = 0.0
+    max_wait_s: float = 0.0
+
+
+class TokenBucketLimiter:
+    """Thread-safe per-domain token bucket, shared by API calls and downloads.
+
+    - profiles are looked up by exact host, then by parent domain
+      (a profile for "donmai.us" covers "cdn.donmai.us")
+    - every caller reserves a token under the lock; when the bucket is empty the
+      token is borrowed and the caller sleeps until it would have been refilled
+    - usable from threads (`wait`) and from asyncio (`wait_async`)
+    - AIMD feedback: `throttle()` (429/503) multiplies the effective rate by
+      `decrease_factor`; every `increase_after` consecutive `recover()` calls add
+      `increase_step * profile.rate` back, never above the configured profile
+    - `stats()` reports per-domain request counts and time spent waiting
+    """
+
+    def __init__(
+        self,
+        default: Optional[RateProfile] = None,
+        profiles: Optional[dict[str, RateProfile]] = None,
+        *,
+        jitter_s: float = 0.0,
+        decrease_factor: float = 0.5,
+        min_rate_factor: float = 0.05,
+        increase_after: int = 20,
+        increase_step: float = 0.1,
+    ):
+        self.default = default or RateProfile()
+        self.profiles: dict[str, RateProfile] = {
+            k.lower(): v for k, v in (profiles or {}).items()
+        }
+        self.jitter_s = jitter_s
+        self.decrease_factor = decrease_factor
+        self.min_rate_factor = min_rate_factor
+        self.increase_after = increase_after
+        self.increase_step = increase_step
+        self._buckets: dict[str, _Bucket] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_interval(cls, min_interval_s: float, jitter_s: float = 0.0) -> "TokenBucketLimiter":
+        """Equivalent of the old fixed-interval RateLimiter (burst of 1)."""
+        rate = 1.0 / min_interval_s if min_interval_s > 0 else float("inf")
+        return cls(RateProfile(rate=rate, burst=1), jitter_s=jitter_s)
+
+    def profile_for(self, domain: str) -> RateProfile:
+        d = domain.lower()
+        while d:
+            if d in self.profiles:
+                return self.profiles[d]
+            _, _, d = d.partition(".")
+        return self.default
+
+    def set_profile(self, domain: str, profile: RateProfile) -> None:
+        with self._lock:
+            self.profiles[domain.lower()] = profile
+            # Existing buckets pick the new budget up on their next refill.
+            for host, b in self._buckets.items():
+                if host == domain.lower() or host.endswith("." + domain.lower()):
+                    b.profile = self.profile_for(host)
+                    b.rate = b.profile.rate
+
+    def _bucket(self, domain: str) -> _Bucket:
+        # Caller holds self._lock.
+        b = self._buckets.get(domain)
+        if b is None:
+            prof = self.profile_for(domain)
+            b = self._buckets[domain] = _Bucket(
+                prof, float(prof.burst), time.monotonic(), rate=prof.rate
+            )
+        return b
+
+    def reserve(self, domain: str) -> float:
+        """Take one token for `domain`; return how long the caller must sleep."""
+        with self._lock:
+            now = time.monotonic()
+            b = self._bucket(domain)
+
+            rate, burst = b.rate, b.profile.burst
+            if rate == float("inf"):
+                b.tokens = float(burst)
+            else:
+                b.tokens = min(float(burst), b.tokens + (now - b.updated) * rate)
+            b.updated = now
+            b.tokens -= 1.0
+
+            delay = 0.0
+            if b.tokens < 0:
+                delay = -b.tokens / rate
+                if self.jitter_s:
+                    delay += random.random() * self.jitter_s
+
+            b.requests += 1
+            if delay > 0:
+                b.waited += 1
+                b.wait_s += delay
+                b.max_wait_s = max(b.max_wait_s, delay)
+            return delay
+
+    def throttle(self, domain: str) -> None:
+        """Server pushed back (429/503): multiplicative decrease of the domain's rate."""
+        with self._lock:
+            b = self._bucket(domain)
+            b.throttles += 1
+            b.successes = 0
+            if b.profile.rate == float("inf"):
+                return
+            floor = b.profile.rate * self.min_rate_factor
+            b.rate = max(floor, b.rate * self.decrease_factor)
+            # Drop any saved-up burst so the slower rate applies right away.
+            b.tokens = min(b.tokens, 0.0)
+
+    def recover(self, domain: str) -> None:
+        """Successful response: additive increase after a run of successes."""
+        with self._lock:
+            b = self._bucket(domain)
+            if b.rate >= b.profile.rate:
+                return
+            b.successes += 1
+            if b.successes >= self.increase_after:
+                b.successes = 0
+                b.rate = min(b.profile.rate, b.rate + b.profile.rate * self.increase_step)
+
+    def wait(self, domain: str) -> None:
+        delay = self.reserve(domain)
+        if delay > 0:
+            time.sleep(delay)
+
+    async def wait_async(self, domain: str) -> None:
+        delay = self.reserve(domain)
+        if delay > 0:
+            await asyncio.sleep(delay)
 
-        target = self.min_interval_s + random.random() * self.jitter_s
-        if elapsed < target:
-            time.sleep(target - elapsed)
+    def stats(self) -> dict[str, dict[str, float]]:
+        """Per-domain accounting: requests, how many had to wait, total/max wait seconds."""
+        with self._lock:
+            return {
+                host: {
+                    "rate": b.rate,
+                    "configured_rate": b.profile.rate,
+                    "burst": b.profile.burst,
+                    "throttles": b.throttles,
+                    "requests": b.requests,
+                    "waited": b.waited,
+                    "wait_s": round(b.wait_s, 3),
+                    "max_wait_s": round(b.max_wait_s, 3),
+                }
+                for host, b in self._buckets.items()
+            }
 
-        self._last_time[domain] = time.time()
\ No newline at end of file
+    def total_wait_s(self) -> float:
+        with self._lock:
+            return sum(b.wait_s for b in self._buckets.values())
@@ -1,11 +1,18 @@
 from __future__ import annotations
 
+import asyncio
+import random
+import threading
 import time
 from dataclasses import dataclass
-from typing import Iterable
+from email.utils import parsedate_to_datetime
+from typing import Iterable, Optional
 
 import httpx
 
+from .rate_limit import TokenBucketLimiter
+from .utils import domain_of
+
 
 @dataclass
 class RetryConfig:
@@ -14,11 +21,136 @@ class RetryConfig:
     max_backoff_s: float = 8.0
     retry_statuses: Iterable[int] = (429, 500, 502, 503, 504)
 
+    # Adaptive mode:
+    # - honours Retry-After (capped at max_retry_after_s)
+    # - decorrelated jitter instead of the fixed exponential schedule
+    # - per-domain retry budget (RetryBudget)
+    # - 429/503 -> limiter.throttle(), successes -> limiter.recover()
+    adaptive: bool = False
+    throttle_statuses: Iterable[int] = (429, 503)
+    max_retry_after_s: float = 120.0
+    budget_ratio: float = 0.2
+    budget_min_tokens: float = 10.0
+
+
+class RetryBudget:
+    """Per-domain retry allowance: each success earns `ratio` of a retry,
+    each retry spends one. Keeps a struggling host from absorbing
+    max_tries x the normal traffic."""
+
+    def __init__(self, ratio: float = 0.2, min_tokens: float = 10.0, max_tokens: float = 100.0):
+        self.ratio = ratio
+        self.min_tokens = min_tokens
+        self.max_tokens = max(max_tokens, min_tokens)
+        self._tokens: dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def deposit(self, domain: str) -> None:
+        with self._lock:
+            t = self._tokens.get(domain, self.min_tokens)
+            self._tokens[domain] = min(t + self.ratio, self.max_tokens)
 
-def _sleep_backoff(i: int, cfg: RetryConfig) -> None:
+    def withdraw(self, domain: str) -> bool:
+        with self._lock:
+            t = self._tokens.get(domain, self.min_tokens)
+            if t < 1.0:
+                return False
+            self._tokens[domain] = t - 1.0
+            return True
+
+
+def _backoff_delay(i: int, cfg: RetryConfig) -> float:
     # exponential backoff
-    delay = min(cfg.base_backoff_s * (2 ** (i - 1)), cfg.max_backoff_s)
-    time.sleep(delay)
+    return min(cfg.base_backoff_s * (2 ** (i - 1)), cfg.max_backoff_s)
+
+
+def parse_retry_after(value: str | None) -> Optional[float]:
+    """Retry-After as seconds (delta-seconds or HTTP-date); None if absent/invalid."""
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        dt = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, dt.timestamp() - time.time())
+
+
+class _RetryPolicy:
+    """Decides, attempt by attempt, whether and how long to wait before retrying.
+
+    Shared by the sync and async request loops (and the downloader).
+    """
+
+    def __init__(
+        self,
+        cfg: RetryConfig,
+        url: str,
+        *,
+        limiter: Optional[TokenBucketLimiter] = None,
+        budget: Optional[RetryBudget] = None,
+    ):
+        self.cfg = cfg
+        self.domain = domain_of(url)
+        self.limiter = limiter if cfg.adaptive else None
+        self.budget = budget if cfg.adaptive else None
+        self._prev = cfg.base_backoff_s
+
+    def _next_delay(self, i: int, retry_after: Optional[float] = None) -> Optional[float]:
+        if i >= self.cfg.max_tries:
+            return None
+        if not self.cfg.adaptive:
+            return _backoff_delay(i, self.cfg)
+        if self.budget is not None and not self.budget.withdraw(self.domain):
+            return None
+
+        # decorrelated jitter: sleep = min(cap, uniform(base, prev * 3))
+        delay = min(self.cfg.max_backoff_s, random.uniform(self.cfg.base_backoff_s, self._prev * 3))
+        self._prev = delay
+        if retry_after is not None:
+            delay = max(delay, min(retry_after, self.cfg.max_retry_after_s))
+        return delay
+
+    def on_response(self, resp: httpx.Response, i: int) -> Optional[float]:
+        """Delay before the next attempt, or None to hand `resp` back to the caller."""
+        status = resp.status_code
+        if self.cfg.adaptive:
+            if status in self.cfg.throttle_statuses:
+                if self.limiter is not None:
+                    self.limiter.throttle(self.domain)
+            elif status < 500:
+                self.on_success()
+
+        if status not in self.cfg.retry_statuses:
+            return None
+        retry_after = None
+        if self.cfg.adaptive:
+            retry_after = parse_retry_after(resp.headers.get("Retry-After"))
+        return self._next_delay(i, retry_after)
+
+    def on_success(self) -> None:
+        """A 2xx: let the limiter speed back up and earn retry budget."""
+        if self.limiter is not None:
+            self.limiter.recover(self.domain)
+        if self.budget is not None:
+            self.budget.deposit(self.domain)
+
+    def on_error(self, i: int) -> Optional[float]:
+        """Delay after a transport error, or None to re-raise."""
+        return self._next_delay(i)
+
+    def before_retry(self) -> None:
+        # Adaptive retries go back through the (possibly slowed down) limiter.
+        if self.limiter is not None:
+            self.limiter.wait(self.domain)
+
+    async def before_retry_async(self) -> None:
+        if self.limiter is not None:
+            await self.limiter.wait_async(self.domain)
 
 
 def request_with_retry(
@@ -26,25 +158,62 @@ def request_with_retry(
     method: str,
     url: str,
     cfg: RetryConfig,
+    *,
+    limiter: Optional[TokenBucketLimiter] = None,
+    budget: Optional[RetryBudget] = None,
     **kwargs,
 ) -> httpx.Response:
-    last_exc: Exception | None = None
+    policy = _RetryPolicy(cfg, url, limiter=limiter, budget=budget)
 
     for i in range(1, cfg.max_tries + 1):
         try:
             resp = client.request(method, url, **kwargs)
-            if resp.status_code in cfg.retry_statuses:
-                if i < cfg.max_tries:
-                    _sleep_backoff(i, cfg)
-                    continue
+        except (httpx.TimeoutException, httpx.NetworkError):
+            delay = policy.on_error(i)
+            if delay is None:
+                raise
+            time.sleep(delay)
+            policy.before_retry()
+            continue
+
+        delay = policy.on_response(resp, i)
+        if delay is None:
             return resp
-        except (httpx.TimeoutException, httpx.NetworkError) as e:
-            last_exc = e
-            if i < cfg.max_tries:
-                _sleep_backoff(i, cfg)
-                continue
-            raise
-
-    if last_exc:
-        raise last_exc
+        resp.close()
+        time.sleep(delay)
+        policy.before_retry()
+
     raise RuntimeError("request_with_retry: unreachable")
+
+
+async def request_with_retry_async(
+    client: httpx.AsyncClient,
+    method: str,
+    url: str,
+    cfg: RetryConfig,
+    *,
+    limiter: Optional[TokenBucketLimiter] = None,
+    budget: Optional[RetryBudget] = None,
+    **kwargs,
+) -> httpx.Response:
+    policy = _RetryPolicy(cfg, url, limiter=limiter, budget=budget)
+
+    for i in range(1, cfg.max_tries + 1):
+        try:
+            resp = await client.request(method, url, **kwargs)
+        except (httpx.TimeoutException, httpx.NetworkError):
+            delay = policy.on_error(i)
+            if delay is None:
+                raise
+            await asyncio.sleep(delay)
+            await policy.before_retry_async()
+            continue
+
+        delay = policy.on_response(resp, i)
+        if delay is None:
+            return resp
+        await resp.aclose()
+        await asyncio.sleep(delay)
+        await policy.before_retry_async()
+
+    raise RuntimeError("request_with_retry_async: unreachable")
@@ -0,0 +1,260 @@
+from __future__ import annotations
+
+import contextlib
+import dataclasses
+import json
+import os
+import re
+import shutil
+import tarfile
+import threading
+import time
+from pathlib import Path
+from typing import Mapping, Optional
+
+from .downloader import DownloadResult
+from .models import Post
+
+_BLOCK = 512
+_SHARD_RE = re.compile(r"^shard-(\d+)\.tar(?:\.part)?$")
+
+
+def _padding(n: int) -> int:
+    return -n % _BLOCK
+
+
+def sample_key(post: Post) -> str:
+    """WebDataset sample key: no dots (readers split member names at the first one)."""
+    return "".join(c if c.isalnum() or c in "-_" else "_" for c in f"{post.source}_{post.post_id}")
+
+
+def sample_metadata(post: Post) -> dict:
+    d = post.to_dict(copy_raw=False)  # only serialized; `raw` is dropped anyway
+    d.pop("raw", None)
+    return d
+
+
+class ShardWriter:
+    """Streams samples into rolling WebDataset-style tar shards.
+
+        out_dir/shard-000000.tar   <key>.jpg, <key>.json, <key>.txt, ...
+        out_dir/shard-000000.idx   one JSON line per sample: member byte offsets
+
+    - append-only and sequential; `write` is thread-safe (one lock)
+    - the open shard is `shard-N.tar.part` (+ `.idx.part`); each sample is
+      flushed and indexed as it is written, so a crashed run is resumed by
+      truncating the part file after its last indexed sample
+    - a shard is closed once it would pass `max_bytes` (or holds
+      `max_samples`): end-of-archive blocks, fsync, then renamed, so a
+      `.tar` file is always complete
+    """
+
+    def __init__(
+        self,
+        out_dir: str | Path,
+        *,
+        max_bytes: int = 1 << 30,
+        max_samples: Optional[int] = None,
+    ):
+        self.out_dir = Path(out_dir)
+        self.out_dir.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = int(max_bytes)
+        self.max_samples = max_samples
+        self._lock = threading.Lock()
+        self._f = None
+        self._idx = None
+        self._keys: set[str] = set()  # samples in the open shard
+        self._n = 0
+        self._size = 0
+        # downloads land here first, then are appended to a shard
+        self.staging_dir = self.out_dir / ".staging"
+        self.closed_shards: list[Path] = []
+        self._next = self._recover()
+
+    def shard_path(self, n: int) -> Path:
+        return self.out_dir / f"shard-{n:06d}.tar"
+
+    def _idx_path(self, n: int) -> Path:
+        return self.out_dir / f"shard-{n:06d}.idx"
+
+    @staticmethod
+    def _part(path: Path) -> Path:
+        return path.with_name(path.name + ".part")
+
+    def _recover(self) -> int:
+        """Finish interrupted closes, reopen an interrupted shard; next shard number."""
+        numbers = []
+        for p in self.out_dir.iterdir():
+            m = _SHARD_RE.match(p.name)
+            if m:
+                numbers.append(int(m.group(1)))
+        last = max(numbers, default=-1)
+        for n in sorted(set(numbers)):
+            tar, idx = self.shard_path(n), self._idx_path(n)
+            if tar.exists() and self._part(idx).exists():
+                os.replace(self._part(idx), idx)
+        part = self._part(self.shard_path(last))
+        if last >= 0 and part.exists():
+            self._reopen(last)
+            return last
+        return last + 1
+
+    def _reopen(self, n: int) -> None:
+        idx_part = self._part(self._idx_path(n))
+        entries = []
+        keep = 0
+        if idx_part.exists():
+            with idx_part.open("rb") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        break  # torn last line
+                    entries.append(entry)
+                    keep += len(line)
+        end = entries[-1]["end"] if entries else 0
+        self._f = self._part(self.shard_path(n)).open("r+b")
+        self._f.truncate(end)
+        self._f.seek(end)
+        self._idx = idx_part.open("a+b")
+        self._idx.truncate(keep)
+        self._idx.seek(keep)
+        self._keys = {e["key"] for e in entries}
+        self._n = n
+        self._size = end
+
+    def _open(self) -> None:
+        n = self._next
+        self._next += 1
+        self._f = self._part(self.shard_path(n)).open("wb")
+        self._idx = self._part(self._idx_path(n)).open("wb")
+        self._keys = set()
+        self._n = n
+        self._size = 0
+
+    def _close_shard(self) -> None:
+        f, idx = self._f, self._idx
+        self._f = self._idx = None
+        f.write(b"\0" * (2 * _BLOCK))
+        for h in (f, idx):
+            h.flush()
+            os.fsync(h.fileno())
+            h.close()
+        n = self._n
+        tar = self.shard_path(n)
+        os.replace(self._part(tar), tar)  # the commit point
+        os.replace(self._part(self._idx_path(n)), self._idx_path(n))
+        self.closed_shards.append(tar)
+        if n >= self._next:
+            self._next = n + 1
+
+    def _member(self, name: str, size: int, mtime: int) -> None:
+        info = tarfile.TarInfo(name)
+        info.size = size
+        info.mtime = mtime
+        info.mode = 0o644
+        self._f.write(info.tobuf(tarfile.PAX_FORMAT, "utf-8", "surrogateescape"))
+
+    def write(self, key: str, members: Mapping[str, bytes | Path]) -> tuple[Path, dict[str, str]]:
+        """Append one sample: `members` maps extension ("jpg", "json", "t.webp") to
+        bytes or a file to copy. Returns (final shard path, {ext: member name}).
+
+        A key already in the open shard (a resumed run) is not written twice.
+        """
+        sizes = {
+            ext: len(v) if isinstance(v, bytes) else Path(v).stat().st_size
+            for ext, v in members.items()
+        }
+        names = {ext: f"{key}.{ext}" for ext in members}
+        with self._lock:
+            if self._f is not None and key in self._keys:
+                return self.shard_path(self._n), names
+            approx = sum(s + _padding(s) + 3 * _BLOCK for s in sizes.values())
+            if self._f is not None and self._keys and (
+                self._size + approx > self.max_bytes
+                or (self.max_samples is not None and len(self._keys) >= self.max_samples)
+            ):
+                self._close_shard()
+            if self._f is None:
+                self._open()
+
+            f = self._f
+            mtime = int(time.time())
+            offsets: dict[str, list[int]] = {}
+            for ext, value in members.items():
+                size = sizes[ext]
+                self._member(names[ext], size, mtime)
+                offsets[ext] = [f.tell(), size]
+                if isinstance(value, bytes):
+                    f.write(value)
+                else:
+                    with Path(value).open("rb") as src:
+                        shutil.copyfileobj(src, f, 1 << 20)
+                f.write(b"\0" * _padding(size))
+            f.flush()
+            self._size = f.tell()
+            line = json.dumps({"key": key, "members": offsets, "end": self._size}) + "\n"
+            self._idx.write(line.encode())
+            self._idx.flush()
+            self._keys.add(key)
+            return self.shard_path(self._n), names
+
+    def close(self) -> None:
+        """Close the open shard (even when not full; an empty one is removed)."""
+        with self._lock:
+            with contextlib.suppress(OSError):
+                self.staging_dir.rmdir()  # only when empty
+            if self._f is None:
+                return
+            if self._keys:
+                self._close_shard()
+                return
+            self._f.close()
+            self._idx.close()
+            self._f = self._idx = None
+            self._part(self.shard_path(self._n)).unlink(missing_ok=True)
+            self._part(self._idx_path(self._n)).unlink(missing_ok=True)
+            self._next = self._n
+
+    def __enter__(self) -> "ShardWriter":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+def write_result(writer: ShardWriter, res: DownloadResult) -> DownloadResult:
+    """Move a finished download (and its transform outputs) into the shards.
+
+    The sample holds the image, `<key>.json` (post metadata) and `<key>.txt`
+    (tags, space-separated); the staged files are deleted. Returns the result
+    with `path` / `outputs` pointing inside the shard (`shard-N.tar#member`).
+    """
+    if res.path is None:
+        return res
+    post = res.post
+    path = Path(res.path)
+    # staged file -> member extension ("jpg", "thumb.webp", ...)
+    files: dict[Path, str] = {path: path.suffix.lstrip(".") or "bin"}
+    for kind, o in (res.outputs or {}).items():
+        files.setdefault(Path(o.path), f"{kind}.{Path(o.path).suffix.lstrip('.')}")
+    members: dict[str, bytes | Path] = {ext: p for p, ext in files.items()}
+    meta = sample_metadata(post)
+    if res.phash is not None:
+        meta["phash"] = f"{res.phash:016x}"
+    members["json"] = json.dumps(meta, ensure_ascii=False).encode()
+    members["txt"] = " ".join(post.tags).encode()
+
+    shard, names = writer.write(sample_key(post), members)
+    for p in files:
+        p.unlink(missing_ok=True)
+
+    def loc(p: Path) -> Path:
+        return Path(f"{shard}#{names[files[p]]}")
+
+    outputs = None
+    if res.outputs:
+        outputs = {
+            kind: dataclasses.replace(o, path=loc(Path(o.path))) for kind, o in res.outputs.items()
+        }
+    return dataclasses.replace(res, path=loc(path), outputs=outputs)
@@ -0,0 +1,231 @@
+from __future__ import annotations
+
+import os
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Literal, Optional
+
+from .phash import phash as _phash
+from .postprocess import _PIL_OK, freeze_apng_inplace
+
+if _PIL_OK:
+    from PIL import Image, ImageOps
+
+TransformFit = Literal["crop", "letterbox"]
+TransformFormat = Literal["webp", "jpeg", "png"]
+
+_EXT = {"webp": "webp", "jpeg": "jpg", "png": "png"}
+_PIL_FORMAT = {"webp": "WEBP", "jpeg": "JPEG", "png": "PNG"}
+
+
+@dataclass(frozen=True)
+class TransformConfig:
+    """Resize / re-encode applied to every image right after it is downloaded.
+
+    - max_side: downscale so the longer side is at most this (never upscales)
+    - size: exact (width, height) output, reached by `fit`:
+      "crop" center-crops to the aspect ratio, "letterbox" pads with `background`;
+      takes precedence over max_side
+    - format: re-encode as "webp", "jpeg" or "png" (None keeps the source format)
+    - quality: WebP / JPEG quality
+    - thumb_side: also write a thumbnail whose longer side is at most this
+    - replace: the result takes the original's place (the original is removed);
+      otherwise it is written next to it as `<stem>.t.<ext>`.
+      Thumbnails always go next to it as `<stem>.thumb.<ext>`.
+    """
+
+    max_side: Optional[int] = None
+    size: Optional[tuple[int, int]] = None
+    fit: TransformFit = "crop"
+    background: tuple[int, int, int] = (0, 0, 0)
+    format: Optional[TransformFormat] = None
+    quality: int = 90
+
+    thumb_side: Optional[int] = None
+    thumb_format: TransformFormat = "webp"
+    thumb_quality: int = 80
+
+    replace: bool = False
+
+    def __post_init__(self) -> None:
+        if self.fit not in ("crop", "letterbox"):
+            raise ValueError(f"Unknown fit '{self.fit}'")
+        for fmt in (self.format, self.thumb_format):
+            if fmt is not None and fmt not in _EXT:
+                raise ValueError(f"Unknown format '{fmt}'")
+        if self.size is not None:
+            object.__setattr__(self, "size", (int(self.size[0]), int(self.size[1])))
+
+    @property
+    def reshapes(self) -> bool:
+        """True when a main output is written (resize, crop or re-encode)."""
+        return self.max_side is not None or self.size is not None or self.format is not None
+
+    def main_path(self, src: Path) -> Path:
+        ext = _EXT[self.format] if self.format else src.suffix.lstrip(".")
+        if self.replace:
+            return src.with_suffix(f".{ext}")
+        return src.with_name(f"{src.stem}.t.{ext}")
+
+    def thumb_path(self, src: Path) -> Path:
+        return src.with_name(f"{src.stem}.thumb.{_EXT[self.thumb_format]}")
+
+    def final_path(self, src: Path) -> Path:
+        """Where the post's image ends up: the main output with `replace`, else `src`."""
+        return self.main_path(src) if self.replace and self.reshapes else src
+
+    def is_done(self, src: Path) -> bool:
+        """Every output of `src` (and `src` itself, unless replaced) is already on disk."""
+        paths = [self.final_path(src)]
+        if self.reshapes:
+            paths.append(self.main_path(src))
+        if self.thumb_side:
+            paths.append(self.thumb_path(src))
+        return all(p.exists() for p in paths)
+
+
+@dataclass(frozen=True)
+class TransformOutput:
+    path: Path
+    width: int
+    height: int
+    format: str
+
+
+def _draft_size(im, cfg: TransformConfig) -> Optional[tuple[int, int]]:
+    # Smallest decode that still covers every output; JPEGs then decode at
+    # 1/2, 1/4 or 1/8 scale straight from the DCT (much less work for big files).
+    w, h = im.size
+    need = 0
+    if cfg.size is not None:
+        # Either orientation (EXIF rotation is applied after decoding).
+        need = int(max(w, h) * max(cfg.size) / min(w, h)) + 1
+    elif cfg.max_side is not None:
+        need = max(need, cfg.max_side)
+    elif cfg.reshapes:
+        return None  # re-encode only: full size
+    if cfg.thumb_side:
+        need = max(need, cfg.thumb_side)
+    if not need or need >= max(w, h):
+        return None
+    s = need / max(w, h)
+    return max(1, int(w * s) + 1), max(1, int(h * s) + 1)
+
+
+def _reshape(im, cfg: TransformConfig):
+    if cfg.size is not None:
+        if cfg.fit == "crop":
+            return ImageOps.fit(im, cfg.size, Image.Resampling.LANCZOS)
+        color = cfg.background + (255,) if im.mode == "RGBA" else cfg.background
+        return ImageOps.pad(im, cfg.size, Image.Resampling.LANCZOS, color=color)
+    if cfg.max_side is not None and max(im.size) > cfg.max_side:
+        w, h = im.size
+        s = cfg.max_side / max(w, h)
+        size = (max(1, round(w * s)), max(1, round(h * s)))
+        return im.resize(size, Image.Resampling.LANCZOS, reducing_gap=3.0)
+    return im
+
+
+def _save(
+    im, dst: Path, fmt: str, quality: int, background: tuple[int, int, int]
+) -> TransformOutput:
+    if fmt == "JPEG" and im.mode != "RGB":
+        if im.mode in ("RGBA", "LA"):
+            flat = Image.new("RGB", im.size, background)
+            flat.paste(im, mask=im.getchannel("A"))
+            im = flat
+        else:
+            im = im.convert("RGB")
+    opts: dict = {}
+    if fmt in ("JPEG", "WEBP"):
+        opts["quality"] = int(quality)
+    if fmt == "WEBP":
+        opts["method"] = 4
+    tmp = dst.with_name(dst.name + ".tf.part")
+    im.save(tmp, format=fmt, **opts)
+    os.replace(tmp, dst)
+    return TransformOutput(path=dst, width=im.width, height=im.height, format=fmt.lower())
+
+
+def _load(src: Path, cfg: Optional[TransformConfig], for_hash: bool = False):
+    """Decoded, upright first frame of `src` and its PIL format."""
+    with Image.open(src) as im:
+        src_format = {"MPO": "JPEG"}.get(im.format or "", im.format or "PNG")
+        if src_format == "JPEG":
+            draft = _draft_size(im, cfg) if cfg is not None else None
+            if draft is None and cfg is None and for_hash:
+                draft = (64, 64)
+            if draft is not None:
+                im.draft("RGB", draft)
+        im.seek(0)
+        im = ImageOps.exif_transpose(im)
+    if im.mode not in ("RGB", "RGBA", "L", "LA"):
+        im = im.convert("RGBA" if "transparency" in im.info or im.mode == "PA" else "RGB")
+    return im, src_format
+
+
+def _write_outputs(
+    im, src: Path, src_format: str, cfg: TransformConfig
+) -> dict[str, TransformOutput]:
+    outputs: dict[str, TransformOutput] = {}
+    base = im
+    if cfg.reshapes:
+        base = _reshape(im, cfg)
+        fmt = _PIL_FORMAT[cfg.format] if cfg.format else src_format
+        outputs["main"] = _save(base, cfg.main_path(src), fmt, cfg.quality, cfg.background)
+
+    if cfg.thumb_side:
+        thumb = base.copy()
+        side = (cfg.thumb_side, cfg.thumb_side)
+        thumb.thumbnail(side, Image.Resampling.LANCZOS, reducing_gap=3.0)
+        outputs["thumb"] = _save(
+            thumb,
+            cfg.thumb_path(src),
+            _PIL_FORMAT[cfg.thumb_format],
+            cfg.thumb_quality,
+            cfg.background,
+        )
+
+    main = outputs.get("main")
+    if cfg.replace and main is not None and main.path != src:
+        src.unlink(missing_ok=True)
+    return outputs
+
+
+def transform_file(path: Path | str, cfg: TransformConfig) -> dict[str, TransformOutput]:
+    """Write the outputs of `cfg` for one image; returns them by kind ("main", "thumb").
+
+    The image is decoded once (at reduced scale where the outputs allow it);
+    animated files use their first frame. Needs Pillow.
+    """
+    if not _PIL_OK:
+        raise RuntimeError("Pillow is required for transforms: pip install Pillow")
+    src = Path(path)
+    im, src_format = _load(src, cfg)
+    return _write_outputs(im, src, src_format, cfg)
+
+
+@dataclass(frozen=True)
+class Processed:
+    outputs: dict[str, TransformOutput]
+    phash: Optional[int] = None
+
+
+def process_file(
+    path: Path | str,
+    *,
+    freeze: bool = False,
+    transform: Optional[TransformConfig] = None,
+    phash: bool = False,
+) -> Processed:
+    """Process-pool job for one downloaded file: freeze an APNG, then hash and
+    transform it from a single decode."""
+    if freeze:
+        freeze_apng_inplace(path)
+    if transform is None and not phash:
+        return Processed({})
+    src = Path(path)
+    im, src_format = _load(src, transform, for_hash=phash)
+    h = _phash(im) if phash else None
+    outputs = _write_outputs(im, src, src_format, transform) if transform is not None else {}
+    return Processed(outputs, h)
@@ -0,0 +1,282 @@
+from __future__ import annotations
+
+import asyncio
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, AsyncIterator, Iterator, Union
+
+import httpx
+
+from .utils import domain_of
+
+_warned_h2_missing = False
+
+# Errors that mean "this host does not speak HTTP/2 properly" when they hit
+# a host's first HTTP/2 request; the request never got a response, so it is
+# safe to replay it over HTTP/1.1.
+_H2_FALLBACK_ERRORS = (httpx.RemoteProtocolError, httpx.LocalProtocolError)
+
+
+def h2_available() -> bool:
+    global _warned_h2_missing
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        if not _warned_h2_missing:
+            _warned_h2_missing = True
+            print(
+                "[moescraper] paket h2 belum terpasang; HTTP/2 dimatikan (pakai HTTP/1.1). "
+                "Install: pip install 'httpx[http2]'"
+            )
+        return False
+    return True
+
+
+class _HostProtocols:
+    """Which hosts get the HTTP/2 client, shared by the sync and async fallbacks.
+
+    A host stays on HTTP/2 once it has answered over it. It is moved to
+    HTTP/1.1 for `reprobe_s` when it answers HTTP/1.1 (no h2 in ALPN) or when
+    its first HTTP/2 request fails with a protocol error.
+    """
+
+    def __init__(self, reprobe_s: float):
+        self.reprobe_s = float(reprobe_s)
+        self._h1_hosts: dict[str, float] = {}  # host -> when it was downgraded
+        self._h2_hosts: set[str] = set()  # hosts that answered over HTTP/2
+        self._lock = threading.Lock()
+
+    def uses_h2(self, host: str) -> bool:
+        since = self._h1_hosts.get(host)
+        if since is None:
+            return True
+        if time.monotonic() - since < self.reprobe_s:
+            return False
+        with self._lock:
+            self._h1_hosts.pop(host, None)  # cooldown over: probe again
+        return True
+
+    def failed(self, host: str) -> None:
+        with self._lock:
+            if host not in self._h2_hosts:
+                self._h1_hosts[host] = time.monotonic()
+
+    def answered(self, host: str, http_version: str) -> None:
+        if http_version == "HTTP/2":
+            if host not in self._h2_hosts:
+                with self._lock:
+                    self._h2_hosts.add(host)
+        elif host not in self._h2_hosts:
+            # ALPN picked HTTP/1.1: keep the host off the small HTTP/2 pool.
+            with self._lock:
+                self._h1_hosts[host] = time.monotonic()
+
+
+class H2FallbackClient:
+    """httpx.Client look-alike that prefers HTTP/2 and falls back per host.
+
+    - HTTP/2 requests go through a small pool (`max_connections`), so many
+      concurrent downloads share a few TLS connections
+    - hosts that answer over HTTP/1.1 (no h2 in ALPN), or whose first HTTP/2
+      request fails with a protocol error, are sent to a plain HTTP/1.1
+      client with the usual limits, and tried over HTTP/2 again after `reprobe_s`
+    - on a host that has already answered over HTTP/2, a protocol error (e.g. a
+      GOAWAY while a connection resets) only replays that request over HTTP/1.1
+    - at most `max_connections * max_streams` requests per host are in flight
+      on the HTTP/2 client
+    """
+
+    def __init__(
+        self,
+        *,
+        max_connections: int = 2,
+        max_streams: int = 32,
+        reprobe_s: float = 600.0,
+        **kwargs: Any,
+    ):
+        self.max_connections = max(1, int(max_connections))
+        self.max_streams = max(1, int(max_streams))
+        self.h2 = httpx.Client(
+            http2=True,
+            limits=httpx.Limits(
+                max_connections=self.max_connections,
+                max_keepalive_connections=self.max_connections,
+            ),
+            **kwargs,
+        )
+        self.h1 = httpx.Client(**kwargs)
+        self.hosts = _HostProtocols(reprobe_s)
+        self._streams: dict[str, threading.BoundedSemaphore] = {}
+        self._lock = threading.Lock()
+
+    def _stream_slot(self, host: str) -> threading.BoundedSemaphore:
+        with self._lock:
+            sem = self._streams.get(host)
+            if sem is None:
+                sem = self._streams[host] = threading.BoundedSemaphore(
+                    self.max_connections * self.max_streams
+                )
+            return sem
+
+    def request(self, method: str, url: str, **kwargs: Any) -> httpx.Response:
+        host = domain_of(url)
+        if self.hosts.uses_h2(host):
+            with self._stream_slot(host):
+                try:
+                    resp = self.h2.request(method, url, **kwargs)
+                except _H2_FALLBACK_ERRORS:
+                    self.hosts.failed(host)
+                else:
+                    self.hosts.answered(host, resp.http_version)
+                    return resp
+        return self.h1.request(method, url, **kwargs)
+
+    @contextmanager
+    def stream(self, method: str, url: str, **kwargs: Any) -> Iterator[httpx.Response]:
+        host = domain_of(url)
+        if self.hosts.uses_h2(host):
+            with self._stream_slot(host):
+                cm = self.h2.stream(method, url, **kwargs)
+                try:
+                    resp = cm.__enter__()
+                except _H2_FALLBACK_ERRORS:
+                    self.hosts.failed(host)
+                else:
+                    self.hosts.answered(host, resp.http_version)
+                    try:
+                        yield resp
+                    except BaseException as e:
+                        if not cm.__exit__(type(e), e, e.__traceback__):
+                            raise
+                    else:
+                        cm.__exit__(None, None, None)
+                    return
+        with self.h1.stream(method, url, **kwargs) as resp:
+            yield resp
+
+    def close(self) -> None:
+        self.h2.close()
+        self.h1.close()
+
+
+SyncClient = Union[httpx.Client, H2FallbackClient]
+
+
+def make_sync_client(
+    *,
+    http2: bool = False,
+    http2_max_connections: int = 2,
+    http2_max_streams: int = 32,
+    **kwargs: Any,
+) -> SyncClient:
+    """httpx.Client, or an H2FallbackClient when `http2` is on and `h2` is installed."""
+    if http2 and h2_available():
+        return H2FallbackClient(
+            max_connections=http2_max_connections,
+            max_streams=http2_max_streams,
+            **kwargs,
+        )
+    return httpx.Client(**kwargs)
+
+
+class _CappedStream(httpx.AsyncByteStream):
+    # Response body that gives its stream slot back once closed.
+    def __init__(self, stream: httpx.AsyncByteStream, sem: asyncio.Semaphore):
+        self._stream = stream
+        self._sem = sem
+
+    async def __aiter__(self) -> AsyncIterator[bytes]:
+        async for chunk in self._stream:
+            yield chunk
+
+    async def aclose(self) -> None:
+        sem, self._sem = self._sem, None
+        try:
+            await self._stream.aclose()
+        finally:
+            if sem is not None:
+                sem.release()
+
+
+class _StreamCapTransport(httpx.AsyncBaseTransport):
+    """At most `limit` requests per host in flight, each held until its body is closed
+    (the async counterpart of H2FallbackClient's stream slots)."""
+
+    def __init__(self, transport: httpx.AsyncBaseTransport, limit: int):
+        self._transport = transport
+        self._limit = max(1, int(limit))
+        self._sems: dict[str, asyncio.Semaphore] = {}
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        host = request.url.host
+        sem = self._sems.get(host)
+        if sem is None:
+            sem = self._sems[host] = asyncio.Semaphore(self._limit)
+        await sem.acquire()
+        try:
+            resp = await self._transport.handle_async_request(request)
+        except BaseException:
+            sem.release()
+            raise
+        resp.stream = _CappedStream(resp.stream, sem)
+        return resp
+
+    async def aclose(self) -> None:
+        await self._transport.aclose()
+
+
+class _H2FallbackTransport(httpx.AsyncBaseTransport):
+    """Async counterpart of H2FallbackClient, as a transport: HTTP/2 through
+    `h2` (stream-capped), per-host fallback to `h1` with the usual limits."""
+
+    def __init__(
+        self, h2: httpx.AsyncBaseTransport, h1: httpx.AsyncBaseTransport, reprobe_s: float
+    ):
+        self.h2 = h2
+        self.h1 = h1
+        self.hosts = _HostProtocols(reprobe_s)
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        host = request.url.host
+        if self.hosts.uses_h2(host):
+            try:
+                resp = await self.h2.handle_async_request(request)
+            except _H2_FALLBACK_ERRORS:
+                self.hosts.failed(host)
+            else:
+                self.hosts.answered(host, resp.extensions.get("http_version", b"").decode())
+                return resp
+        return await self.h1.handle_async_request(request)
+
+    async def aclose(self) -> None:
+        await self.h2.aclose()
+        await self.h1.aclose()
+def make_async_client(
+    *,
+    http2: bool = False,
+    http2_max_connections: int = 2,
+    http2_max_streams: int = 32,
+    **kwargs: Any,
+) -> httpx.AsyncClient:
+    """httpx.AsyncClient with HTTP/2 enabled when requested and available.
+
+    With HTTP/2 it falls back per host like `make_sync_client`: at most
+    `http2_max_connections * http2_max_streams` requests per host are in
+    flight over HTTP/2, and hosts that answer HTTP/1.1 or fail their first
+    HTTP/2 request go through a plain HTTP/1.1 transport.
+    """
+    if http2 and h2_available():
+        h2 = httpx.AsyncHTTPTransport(
+            http2=True,
+            limits=httpx.Limits(
+                max_connections=http2_max_connections,
+                max_keepalive_connections=http2_max_connections,
+            ),
+        )
+        cap = max(1, int(http2_max_connections)) * max(1, int(http2_max_streams))
+        transport = _H2FallbackTransport(
+            _StreamCapTransport(h2, cap), httpx.AsyncHTTPTransport(), reprobe_s=600.0
+        )
+        return httpx.AsyncClient(transport=transport, **kwargs)
+    return httpx.AsyncClient(**kwargs)
@@ -3,8 +3,9 @@ from __future__ import annotations
 import re
 from urllib.parse import urlparse
 
-
 _CONTROL_CHARS_RE = re.compile(r"[\x00-\x08\x0b\x0c\x0e-\x1f\x7f]")
+# Same set as raw bytes; safe on UTF-8 (multi-byte sequences are all >= 0x80).
+_CONTROL_BYTES = bytes([*range(0x00, 0x09), 0x0B, 0x0C, *range(0x0E, 0x20), 0x7F])
 
 
 def domain_of(url: str) -> str:
@@ -15,11 +16,28 @@ def sanitize_json_text(text: str) -> str:
     return _CONTROL_CHARS_RE.sub("", text)
 
 
+def sanitize_json_bytes(data: bytes) -> bytes:
+    """Drop control characters; returns `data` itself when there are none.
+
+    bytes.translate is a single C pass, several times faster than the regex.
+    """
+    cleaned = data.translate(None, _CONTROL_BYTES)
+    return data if len(cleaned) == len(data) else cleaned
+
+
 def guess_ext_from_url(url: str) -> str | None:
-    path = urlparse(url).path
-    if "." not in path:
+    """Extension of the last path segment ("jpg" for ".../a.JPG?x=1"), or None.
+
+    Plain string slicing; called per post, so it avoids urlparse.
+    """
+    path = url.partition("?")[0].partition("#")[0]
+    i = path.find("://")
+    if i != -1 and path.find("/", i + 3) == -1:
+        return None  # no path at all
+    _, dot, ext = path.rpartition("/")[2].rpartition(".")
+    if not dot:
         return None
-    ext = path.rsplit(".", 1)[-1].lower()
+    ext = ext.lower()
     if 1 <= len(ext) <= 5:
         return ext
-    return None
\ No newline at end of file
+    return None
@@ -1,20 +1,238 @@
 from __future__ import annotations
 
+import csv
+import gzip
 import json
+import re
 from pathlib import Path
-from typing import Iterable
+from typing import Any, Iterable, Literal, Optional
 
 from moescraper.core.models import Post
 
+try:
+    import orjson
+except ImportError:  # optional: pip install orjson
+    orjson = None
 
-def write_jsonl(posts: Iterable[Post], path: str | Path) -> Path:
+try:
+    import zstandard
+except ImportError:  # optional: pip install zstandard
+    zstandard = None
+
+MetadataFormat = Literal["jsonl", "csv"]
+
+CSV_FIELDS = (
+    "source", "post_id", "file_url", "preview_url", "tags", "rating",
+    "width", "height", "md5", "file_ext",
+)
+
+_COMPRESSION = {".gz": "gzip", ".zst": "zstd"}
+_FORMATS = {".jsonl": "jsonl", ".csv": "csv"}
+
+
+def _split_name(path: Path) -> tuple[str, MetadataFormat, str, Optional[str]]:
+    """metadata.jsonl.gz -> ("metadata", "jsonl", ".jsonl.gz", "gzip")"""
+    name = path.name
+    compression = None
+    suffix = ""
+    for ext, comp in _COMPRESSION.items():
+        if name.lower().endswith(ext):
+            compression = comp
+            suffix = name[-len(ext):]
+            name = name[: -len(ext)]
+            break
+    for ext, fmt in _FORMATS.items():
+        if name.lower().endswith(ext):
+            return name[: -len(ext)], fmt, name[-len(ext):] + suffix, compression
+    raise ValueError(f"Can't tell the format of '{path.name}': use .jsonl | .csv (+ .gz | .zst)")
+
+
+def _dumps(d: dict) -> bytes:
+    if orjson is not None:
+        try:
+            return orjson.dumps(d)
+        except TypeError:  # e.g. ints past 64 bits
+            pass
+    return json.dumps(d, ensure_ascii=False, separators=(",", ":")).encode()
+
+
+class _Sink:
+    # csv.writer target: rows go straight into the byte buffer.
+    def __init__(self, buf: bytearray):
+        self.buf = buf
+
+    def write(self, s: str) -> None:
+        self.buf += s.encode()
+
+
+class MetadataWriter:
+    """Streams post metadata into JSONL or CSV, optionally compressed and rotated.
+
+    - records are Posts or plain dicts (the index export rows); Posts are
+      serialized without copying `raw` (orjson when installed)
+    - format and compression come from the file name: `.jsonl` / `.csv`,
+      plus `.gz` (gzip) or `.zst` (zstd, needs `zstandard`)
+    - writes are buffered (`buffer_size` bytes)
+    - `max_records` / `max_bytes` (on disk) start a new file once reached:
+      `metadata.jsonl.gz` becomes `metadata-00000.jsonl.gz`, `-00001`, ...
+    - `append=True` continues the existing (last) file; gzip members and
+      zstd frames concatenate, so compressed files can be appended to too.
+      Record counts of existing files aren't known, so it can't be combined
+      with `max_records`.
     """
-    JSON Lines: 1 JSON object per line. :contentReference[oaicite:3]{index=3}
+
+    def __init__(
+        self,
+        path: str | Path,
+        *,
+        append: bool = False,
+        max_records: Optional[int] = None,
+        max_bytes: Optional[int] = None,
+        buffer_size: int = 1 << 20,
+    ):
+        self.path = Path(path)
+        self.stem, self.format, self.suffix, self.compression = _split_name(self.path)
+        if self.compression == "zstd" and zstandard is None:
+            raise RuntimeError("zstandard is required for .zst output: pip install zstandard")
+        if append and max_records is not None:
+            raise ValueError("max_records can't be combined with append")
+        self.append = append
+        self.max_records = max_records
+        self.max_bytes = max_bytes
+        self.buffer_size = int(buffer_size)
+        self.rotates = max_records is not None or max_bytes is not None
+        self.paths: list[Path] = []
+        self.n_records = 0
+
+        self._buf = bytearray()
+        self._csv = csv.writer(_Sink(self._buf)) if self.format == "csv" else None
+        self._raw = None
+        self._stream = None
+        self._part = 0
+        self._part_records = 0
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        if append and self.rotates:
+            parts = self._existing_parts()
+            self._part = parts[-1] if parts else 0
+
+    def _existing_parts(self) -> list[int]:
+        pat = re.compile(re.escape(self.stem) + r"-(\d+)" + re.escape(self.suffix) + "$")
+        found = (pat.match(p.name) for p in self.path.parent.iterdir())
+        return sorted(int(m.group(1)) for m in found if m)
+
+    def _part_path(self) -> Path:
+        if not self.rotates:
+            return self.path
+        return self.path.with_name(f"{self.stem}-{self._part:05d}{self.suffix}")
+
+    def _open(self) -> None:
+        path = self._part_path()
+        fresh = not (self.append and path.exists() and path.stat().st_size)
+        self._raw = path.open("ab" if self.append else "wb")
+        if self.compression == "gzip":
+            self._stream = gzip.GzipFile(fileobj=self._raw, mode="wb", compresslevel=6, mtime=0)
+        elif self.compression == "zstd":
+            self._stream = zstandard.ZstdCompressor(level=3).stream_writer(
+                self._raw, closefd=False
+            )
+        else:
+            self._stream = self._raw
+        self._part_records = 0
+        self.paths.append(path)
+        if self._csv is not None and fresh:
+            self._csv.writerow(CSV_FIELDS)
+
+    def _close_file(self) -> None:
+        self._drain()
+        if self._stream is not self._raw:
+            self._stream.close()
+        self._raw.close()
+        self._stream = self._raw = None
+
+    def _drain(self) -> None:
+        if self._buf:
+            self._stream.write(self._buf)
+            self._buf.clear()
+
+    def _full(self) -> bool:
+        if self.max_records is not None and self._part_records >= self.max_records:
+            return True
+        if self.max_bytes is not None:
+            size = self._raw.tell()
+            if self._stream is self._raw:
+                size += len(self._buf)
+            # compressed output lags behind by the buffers, so parts run a little over
+            return size >= self.max_bytes
+        return False
+
+    def write(self, rec: Post | dict[str, Any]) -> None:
+        if self._stream is None:
+            self._open()
+        elif self.rotates and self._full():
+            self._close_file()
+            self._part += 1
+            self.append = False  # later parts are new files
+            self._open()
+        d = rec.to_dict(copy_raw=False) if isinstance(rec, Post) else rec
+        if self._csv is not None:
+            row = [d.get(k) for k in CSV_FIELDS]
+            tags = d.get("tags")
+            row[CSV_FIELDS.index("tags")] = " ".join(tags) if tags else ""
+            self._csv.writerow(row)
+        else:
+            self._buf += _dumps(d)
+            self._buf += b"\n"
+        self._part_records += 1
+        self.n_records += 1
+        if len(self._buf) >= self.buffer_size:
+            self._drain()
+
+    def write_many(self, records: Iterable[Post | dict[str, Any]]) -> int:
+        n = self.n_records
+        for rec in records:
+            self.write(rec)
+        return self.n_records - n
+
+    def flush(self) -> None:
+        if self._stream is not None:
+            self._drain()
+            self._stream.flush()
+
+    def close(self) -> None:
+        if self._stream is None and not self.paths:
+            self._open()  # nothing written: still leave an (empty) file
+        if self._stream is not None:
+            self._close_file()
+
+    def __enter__(self) -> "MetadataWriter":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+def _written(w: MetadataWriter) -> Path | list[Path]:
+    # One file unless rotation was asked for (then every part, in order).
+    return w.paths if w.rotates else w.path
+
+
+def write_jsonl(posts: Iterable[Post | dict], path: str | Path, **kwargs) -> Path | list[Path]:
+    """JSON Lines: 1 JSON object per line. Options as in `MetadataWriter`.
+
+    Returns the file's Path; with `max_records` / `max_bytes`, the list of parts.
     """
-    path = Path(path)
-    path.parent.mkdir(parents=True, exist_ok=True)
+    if _split_name(Path(path))[1] != "jsonl":
+        raise ValueError(f"'{Path(path).name}' is not a .jsonl path")
+    with MetadataWriter(path, **kwargs) as w:
+        w.write_many(posts)
+    return _written(w)
+
 
-    with path.open("w", encoding="utf-8") as f:
-        for p in posts:
-            f.write(json.dumps(p.to_dict(), ensure_ascii=False) + "\n")
-    return path
\ No newline at end of file
+def write_csv(posts: Iterable[Post | dict], path: str | Path, **kwargs) -> Path | list[Path]:
+    """CSV with `CSV_FIELDS` (tags space-separated). Options and return value
+    as in `write_jsonl`."""
+    if _split_name(Path(path))[1] != "csv":
+        raise ValueError(f"'{Path(path).name}' is not a .csv path")
+    with MetadataWriter(path, **kwargs) as w:
+        w.write_many(posts)
+    return _written(w)